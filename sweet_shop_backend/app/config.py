@@ -4,15 +4,36 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# Read preference names accepted by MONGO_CATALOG_READ_PREFERENCE
+READ_PREFERENCE_NAMES = ("primary", "primaryPreferred", "secondary", "secondaryPreferred", "nearest")
+
 class Settings:
     # Database configuration
     MONGO_URI: str = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     DB_NAME: str = os.getenv("DB_NAME", "sweetshop_db")
 
+    # Storage backend: "mongo" or "memory" (in-process, for tests and benchmarks)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "mongo")
+
+    # MongoDB connection pool and timeouts (0 timeout = driver default / none)
+    MONGO_MAX_POOL_SIZE: int = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+    MONGO_MIN_POOL_SIZE: int = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+    MONGO_CONNECT_TIMEOUT_MS: int = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000))
+    MONGO_SOCKET_TIMEOUT_MS: int = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 0))
+    # Comma-separated wire compressors, e.g. "zstd,snappy,zlib" (zstd/snappy need extra packages)
+    MONGO_COMPRESSORS: str = os.getenv("MONGO_COMPRESSORS", "")
+    # Read preference for public catalog reads, e.g. "secondaryPreferred"
+    MONGO_CATALOG_READ_PREFERENCE: str = os.getenv("MONGO_CATALOG_READ_PREFERENCE", "primary")
+
     # JWT configuration for authentication
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "supersecret")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+    # How often each worker pulls token revocations (role changes, deletions)
+    # recorded by other workers; the worker that revokes applies it at once
+    REVOCATION_SYNC_INTERVAL_SECONDS: float = float(os.getenv("REVOCATION_SYNC_INTERVAL_SECONDS", 2))
 
     # Admin account details for seeding
     ADMIN_EMAIL: str = os.getenv("ADMIN_EMAIL", "admin@example.com")
@@ -21,5 +42,98 @@ class Settings:
     # Optional security code for admin registration
     ADMIN_SECRET: str = os.getenv("ADMIN_SECRET", "superadmincode")
 
+    # In-process cache of verified users, for tokens issued without role claims
+    PRINCIPAL_CACHE_MAX_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", 1024))
+    PRINCIPAL_CACHE_TTL_SECONDS: int = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+
+    # Worker pool for bcrypt hashing ("thread" or "process"; 0 workers = auto)
+    PASSWORD_POOL_KIND: str = os.getenv("PASSWORD_POOL_KIND", "thread")
+    PASSWORD_POOL_WORKERS: int = int(os.getenv("PASSWORD_POOL_WORKERS", 0))
+    PASSWORD_POOL_MAX_PENDING: int = int(os.getenv("PASSWORD_POOL_MAX_PENDING", 64))
+
+    # bcrypt cost: PASSWORD_HASH_ROUNDS fixes it; 0 calibrates it at startup so
+    # one verification takes about PASSWORD_HASH_TARGET_MS on this hardware,
+    # within the min/max bounds. Stored hashes at a lower cost are rehashed
+    # on the user's next successful login
+    PASSWORD_HASH_ROUNDS: int = int(os.getenv("PASSWORD_HASH_ROUNDS", 0))
+    PASSWORD_HASH_TARGET_MS: float = float(os.getenv("PASSWORD_HASH_TARGET_MS", 250))
+    PASSWORD_HASH_MIN_ROUNDS: int = int(os.getenv("PASSWORD_HASH_MIN_ROUNDS", 10))
+    PASSWORD_HASH_MAX_ROUNDS: int = int(os.getenv("PASSWORD_HASH_MAX_ROUNDS", 15))
+
+    # Catalog pagination (GET /api/sweets/)
+    CATALOG_PAGE_SIZE: int = int(os.getenv("CATALOG_PAGE_SIZE", 100))
+    CATALOG_MAX_PAGE_SIZE: int = int(os.getenv("CATALOG_MAX_PAGE_SIZE", 1000))
+
+    # Read-through cache for catalog list/search results (cleared on every write)
+    CATALOG_CACHE_MAX_SIZE: int = int(os.getenv("CATALOG_CACHE_MAX_SIZE", 256))
+    CATALOG_CACHE_TTL_SECONDS: int = int(os.getenv("CATALOG_CACHE_TTL_SECONDS", 30))
+
+    # Maximum items accepted by the bulk create/update/delete endpoints
+    BULK_MAX_ITEMS: int = int(os.getenv("BULK_MAX_ITEMS", 5000))
+
+    # Streaming export: documents per cursor batch / rows per response chunk
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+    # Stock holds: lifetime of a hold, and how often / how many expired holds
+    # the background reaper returns to stock per pass
+    HOLD_TTL_SECONDS: int = int(os.getenv("HOLD_TTL_SECONDS", 600))
+    HOLD_REAPER_INTERVAL_SECONDS: float = float(os.getenv("HOLD_REAPER_INTERVAL_SECONDS", 5))
+    HOLD_REAPER_BATCH_SIZE: int = int(os.getenv("HOLD_REAPER_BATCH_SIZE", 500))
+    # A reaper's claim older than this is taken to be from a crashed pass and reclaimed
+    HOLD_CLAIM_TIMEOUT_SECONDS: int = int(os.getenv("HOLD_CLAIM_TIMEOUT_SECONDS", 60))
+
+    # Write-behind inventory counter for hot sweets (off by default). Sales are
+    # served from units leased from the database INVENTORY_LEASE_SIZE at a
+    # time; restocks and unsold leases are written back as batched $inc every
+    # INVENTORY_FLUSH_INTERVAL_SECONDS or after INVENTORY_FLUSH_THRESHOLD operations
+    INVENTORY_BUFFER_ENABLED: bool = os.getenv("INVENTORY_BUFFER_ENABLED", "false").lower() == "true"
+    INVENTORY_LEASE_SIZE: int = int(os.getenv("INVENTORY_LEASE_SIZE", 50))
+    INVENTORY_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("INVENTORY_FLUSH_INTERVAL_SECONDS", 0.5))
+    INVENTORY_FLUSH_THRESHOLD: int = int(os.getenv("INVENTORY_FLUSH_THRESHOLD", 1000))
+
+    # Catalog change feed: polling interval when change streams are unavailable,
+    # events buffered per live client, and SSE keep-alive interval
+    CATALOG_FEED_POLL_INTERVAL_SECONDS: float = float(os.getenv("CATALOG_FEED_POLL_INTERVAL_SECONDS", 1))
+    CATALOG_FEED_QUEUE_SIZE: int = int(os.getenv("CATALOG_FEED_QUEUE_SIZE", 256))
+    CATALOG_FEED_HEARTBEAT_SECONDS: float = float(os.getenv("CATALOG_FEED_HEARTBEAT_SECONDS", 15))
+
+    # Per-request profiling: off unless enabled (the middleware is not installed).
+    # Requests sending "X-Profile: <PROFILING_TOKEN>" are profiled, plus a
+    # random PROFILING_SAMPLE_RATE fraction of all requests
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_TOKEN: str = os.getenv("PROFILING_TOKEN", "")
+    PROFILING_SAMPLE_RATE: float = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+    PROFILING_MAX_STORED: int = int(os.getenv("PROFILING_MAX_STORED", 50))
+
+    # Token-bucket rate limiting (middleware not installed when disabled).
+    # Each limit is a burst size plus a refill rate per minute; a burst of 0
+    # turns that limit off. Login and register are limited per client IP and
+    # login additionally per account; RATE_LIMIT_API_IP_* covers every other
+    # route. RATE_LIMIT_STORE is "local" (per worker) or "shared" (buckets in
+    # the storage backend, enforced across workers).
+    # Behind a reverse proxy every request comes from the proxy's address, so
+    # all users share one per-IP bucket unless RATE_LIMIT_TRUST_FORWARDED is
+    # set. Only set it when a proxy that overwrites X-Forwarded-For is in
+    # front of the app: otherwise clients pick their own key by sending one
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_STORE: str = os.getenv("RATE_LIMIT_STORE", "local")
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", 100_000))
+    RATE_LIMIT_TRUST_FORWARDED: bool = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+    RATE_LIMIT_AUTH_IP_BURST: int = int(os.getenv("RATE_LIMIT_AUTH_IP_BURST", 20))
+    RATE_LIMIT_AUTH_IP_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_AUTH_IP_PER_MINUTE", 30))
+    RATE_LIMIT_LOGIN_ACCOUNT_BURST: int = int(os.getenv("RATE_LIMIT_LOGIN_ACCOUNT_BURST", 5))
+    RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE", 5))
+    RATE_LIMIT_API_IP_BURST: int = int(os.getenv("RATE_LIMIT_API_IP_BURST", 0))
+    RATE_LIMIT_API_IP_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_API_IP_PER_MINUTE", 1200))
+
+    def validate(self):
+        """Reject values that would otherwise fail later with an obscure error."""
+        if self.MONGO_CATALOG_READ_PREFERENCE not in READ_PREFERENCE_NAMES:
+            raise ValueError(
+                f"Invalid MONGO_CATALOG_READ_PREFERENCE: {self.MONGO_CATALOG_READ_PREFERENCE!r} "
+                f"(expected one of: {', '.join(READ_PREFERENCE_NAMES)})"
+            )
+
 # Instantiate Settings object for use across the app
 settings = Settings()
+settings.validate()
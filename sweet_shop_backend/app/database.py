@@ -1,8 +1,45 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 from app.config import settings
+from app.utils.command_monitor import SERVER_POOL_STATS, command_counter, command_metrics, pool_monitor
+from app.utils.metrics import gauge_lines, registry
 
-# Initialize MongoDB client using the configured URI
-client = AsyncIOMotorClient(settings.MONGO_URI)
+# Read preference classes by the names accepted in settings (READ_PREFERENCE_NAMES)
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+def client_options() -> dict:
+    """Build Motor client keyword options from settings (0 = driver default)."""
+    options = {
+        "maxPoolSize": settings.MONGO_MAX_POOL_SIZE,
+        "minPoolSize": settings.MONGO_MIN_POOL_SIZE,
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+    }
+    if settings.MONGO_WAIT_QUEUE_TIMEOUT_MS:
+        options["waitQueueTimeoutMS"] = settings.MONGO_WAIT_QUEUE_TIMEOUT_MS
+    if settings.MONGO_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = settings.MONGO_SOCKET_TIMEOUT_MS
+    if settings.MONGO_COMPRESSORS:
+        options["compressors"] = settings.MONGO_COMPRESSORS
+    return options
+
+pool_monitor.max_pool_size = settings.MONGO_MAX_POOL_SIZE
+
+# Initialize MongoDB client using the configured URI and pool options.
+# The client connects lazily; the app lifespan pings it on startup and
+# closes it on shutdown. command_counter tallies driver commands,
+# command_metrics feeds /metrics and pool_monitor tracks pool saturation.
+client = AsyncIOMotorClient(
+    settings.MONGO_URI,
+    event_listeners=[command_counter, command_metrics, pool_monitor],
+    **client_options()
+)
 
 # Access the database specified in settings
 db = client[settings.DB_NAME]
@@ -10,3 +47,43 @@ db = client[settings.DB_NAME]
 # Define collections for users and sweets
 user_collection = db.get_collection("users")
 sweet_collection = db.get_collection("sweets")
+hold_collection = db.get_collection("holds")
+rate_limit_collection = db.get_collection("rate_limits")  # Shared token buckets (RATE_LIMIT_STORE=shared)
+revocation_collection = db.get_collection("revocations")  # Token revocations (see app/utils/revocation.py)
+meta_collection = db.get_collection("meta")  # Small bookkeeping documents (e.g. catalog version)
+
+# Public catalog reads may be served by secondaries (eventually consistent)
+sweet_read_collection = sweet_collection.with_options(
+    read_preference=READ_PREFERENCES[settings.MONGO_CATALOG_READ_PREFERENCE]()
+)
+
+async def connect_database():
+    """Fail fast at startup if MongoDB is unreachable (and open the pool)."""
+    await client.admin.command("ping")
+
+def close_database():
+    """Close all pooled connections; called on application shutdown."""
+    client.close()
+
+def pool_stats() -> dict:
+    """Connection pool usage, including the saturation ratio."""
+    return pool_monitor.stats()
+
+def _pool_metrics() -> list:
+    """
+    Expose pool usage on /metrics as mongo_pool_<stat> gauges (all servers)
+    and mongo_pool_server_<stat>{server="host:port"} gauges (one per pool).
+    """
+    stats = pool_monitor.stats()
+    servers = stats.pop("servers")
+    lines = []
+    for name, value in stats.items():
+        lines.extend(gauge_lines(f"mongo_pool_{name}", f"Connection pool {name.replace('_', ' ')}", [("", value)]))
+    for name in SERVER_POOL_STATS:
+        lines.extend(gauge_lines(
+            f"mongo_pool_server_{name}", f"Connection pool {name.replace('_', ' ')} per server",
+            [(f'{{server="{address}"}}', values[name]) for address, values in servers.items()]
+        ))
+    return lines
+
+registry.add_collector(_pool_metrics)
@@ -1,11 +1,67 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.openapi.utils import get_openapi
-from app.routes import auth, sweet  # Import route modules
-from app.services.auth_service import seed_admin  # Admin seeding logic
+from app.config import settings  # Feature toggles
+from app.repositories import open_storage, close_storage, rate_limit_repository, storage_stats  # Storage backend lifecycle
+from app.routes import auth, profiling, sweet  # Import route modules
+from app.services.auth_service import (  # bcrypt cost, admin seeding, token revocations
+    configure_password_hashing, seed_admin, start_revocation_sync, stop_revocation_sync
+)
+from app.services.catalog_feed import catalog_feed  # Cross-worker cache sync and live push
+from app.services.hold_service import start_hold_reaper, stop_hold_reaper  # Expired hold reaper
+from app.services.index_service import provision_indexes  # Index provisioning
+from app.services.sweet_service import catalog_cache, start_inventory_flusher, stop_inventory_flusher  # Catalog cache, write-behind stock
+from app.utils.cache import principal_cache  # Verified-user cache
+from app.utils.metrics import MetricsMiddleware, cache_collector, preregister_routes, registry  # /metrics
+from app.utils.password_pool import shutdown_password_pool  # bcrypt worker pool
+from app.utils.profiler import ProfilingMiddleware  # Opt-in per-request cProfile
+from app.utils.rate_limit import RateLimitMiddleware  # Token-bucket rate limiting
 from fastapi.middleware.cors import CORSMiddleware  # Middleware for CORS handling
 
+# Application lifespan: fix the bcrypt cost, open storage, provision
+# indexes, seed the admin user and start the token revocation sync, hold
+# reaper, inventory flusher and catalog change feed on startup; stop them
+# (flushing buffered stock) and the bcrypt pool and close storage on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_password_hashing()
+    await open_storage()
+    await provision_indexes()
+    await seed_admin()
+    start_revocation_sync()
+    start_hold_reaper()
+    start_inventory_flusher()
+    catalog_feed.start()
+    yield
+    await catalog_feed.stop()
+    await stop_inventory_flusher()
+    await stop_hold_reaper()
+    await stop_revocation_sync()
+    shutdown_password_pool()
+    close_storage()
+
 # Initialize FastAPI application with debug enabled
-app = FastAPI(debug=True)
+app = FastAPI(debug=True, lifespan=lifespan)
+
+# Middleware added later wraps the earlier ones, so the rate limiter goes in
+# first and CORS last: throttled responses still carry the CORS headers
+
+# Throttle bcrypt-heavy auth calls per IP and per account before they reach
+# the app; "shared" keeps the buckets in the storage backend for all workers
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        store=rate_limit_repository if settings.RATE_LIMIT_STORE == "shared" else None,
+    )
+
+# Record per-route latency and in-flight requests for /metrics (outside the
+# rate limiter, so throttled requests are counted too)
+app.add_middleware(MetricsMiddleware)
+
+# Profile requests selected by header or sampling; not installed at all
+# unless PROFILING_ENABLED, so there is no per-request cost when off
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
 # Add CORS middleware to allow cross-origin requests (for frontend integration)
 app.add_middleware(
@@ -14,11 +70,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag", "X-Profile-Id", "Retry-After"],  # Pagination/caching/profiling/throttling headers readable by the frontend
 )
 
-# Include API routers for authentication and sweet management
+# Include API routers for authentication, sweet management and profiles
 app.include_router(auth.router)
 app.include_router(sweet.router)
+app.include_router(profiling.router)
 
 # Define custom OpenAPI schema to include global JWT bearer authentication
 def custom_openapi():
@@ -53,7 +111,19 @@ def custom_openapi():
 # Override FastAPI's default OpenAPI schema generation with custom one
 app.openapi = custom_openapi
 
-# Event triggered on application startup to seed admin user
-@app.on_event("startup")
-async def startup_event():
-    await seed_admin()
+# Health check including storage backend and MongoDB connection pool usage,
+# for sizing workers per node
+@app.get("/api/health", tags=["Health"])
+async def health():
+    return {"status": "ok", **storage_stats()}
+
+# Cache hit ratios are read from the caches at scrape time
+registry.add_collector(cache_collector({"catalog": catalog_cache, "principal": principal_cache}))
+
+# Prometheus text exposition of request, MongoDB, bcrypt and cache metrics
+@app.get("/metrics", tags=["Health"], include_in_schema=False)
+async def metrics():
+    return Response(content=registry.expose(), media_type="text/plain; version=0.0.4")
+
+# Create latency histogram label sets for all routes defined above
+preregister_routes(app)
@@ -0,0 +1,53 @@
+# app/repositories/__init__.py
+from app.config import settings
+from app.repositories.base import (
+    ChangeStreamUnsupported, DuplicateKeyError, HoldRepository, RateLimitRepository, RevocationRepository,
+    SweetRepository, UserRepository, REVOKE_ALL
+)
+
+# Storage backend selected by STORAGE_BACKEND: "mongo" (default) or "memory"
+if settings.STORAGE_BACKEND == "memory":
+    from app.repositories.memory import (
+        MemoryHoldRepository, MemoryRateLimitRepository, MemoryRevocationRepository, MemorySweetRepository,
+        MemoryUserRepository
+    )
+    user_repository: UserRepository = MemoryUserRepository()
+    revocation_repository: RevocationRepository = MemoryRevocationRepository()
+    sweet_repository: SweetRepository = MemorySweetRepository()
+    hold_repository: HoldRepository = MemoryHoldRepository(sweet_repository)
+    rate_limit_repository: RateLimitRepository = MemoryRateLimitRepository(settings.RATE_LIMIT_MAX_KEYS)
+elif settings.STORAGE_BACKEND == "mongo":
+    from app.repositories.mongo import (
+        MongoHoldRepository, MongoRateLimitRepository, MongoRevocationRepository, MongoSweetRepository,
+        MongoUserRepository
+    )
+    user_repository: UserRepository = MongoUserRepository()
+    revocation_repository: RevocationRepository = MongoRevocationRepository()
+    sweet_repository: SweetRepository = MongoSweetRepository()
+    hold_repository: HoldRepository = MongoHoldRepository()
+    rate_limit_repository: RateLimitRepository = MongoRateLimitRepository()
+else:
+    raise ValueError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND!r}")
+
+
+async def open_storage():
+    """Connect to the storage backend on startup (fails fast if unreachable)."""
+    if settings.STORAGE_BACKEND == "mongo":
+        from app.database import connect_database
+        await connect_database()
+
+
+def close_storage():
+    """Release storage connections on shutdown."""
+    if settings.STORAGE_BACKEND == "mongo":
+        from app.database import close_database
+        close_database()
+
+
+def storage_stats() -> dict:
+    """Backend name plus connection pool usage where applicable."""
+    stats = {"backend": settings.STORAGE_BACKEND}
+    if settings.STORAGE_BACKEND == "mongo":
+        from app.database import pool_stats
+        stats["mongo_pool"] = pool_stats()
+    return stats
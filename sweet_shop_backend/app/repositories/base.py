@@ -0,0 +1,265 @@
+# app/repositories/base.py
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from bson import ObjectId
+
+# Index names shared by every backend (reported by ensure_indexes)
+USER_INDEX_NAMES = ["email_unique"]
+SWEET_INDEX_NAMES = ["name_lower_1", "category_lower_1_price_1", "price_1"]
+HOLD_INDEX_NAMES = ["claimed_by_1_expires_at_1", "claimed_at_1", "sweet_id_1"]
+REVOCATION_INDEX_NAMES = ["revoked_at_ttl"]
+RATE_LIMIT_INDEX_NAMES = ["expires_at_ttl"]
+
+# Revocation version for a deleted user: no token they hold is ever valid again
+REVOKE_ALL = 2 ** 62
+
+
+class DuplicateKeyError(Exception):
+    """Raised when an insert violates a unique constraint (e.g. user email)."""
+
+
+class ChangeStreamUnsupported(Exception):
+    """Raised by watch() when the backend cannot stream changes (e.g. standalone mongod)."""
+
+
+class UserRepository(ABC):
+    """Storage operations on user documents ({_id, email, hashed_password, role, token_version})."""
+
+    @abstractmethod
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        """Return the user with this email, or None."""
+
+    @abstractmethod
+    async def find_by_id(self, user_id: str) -> Optional[dict]:
+        """Return the user with this ID, or None."""
+
+    @abstractmethod
+    async def insert(self, user: dict):
+        """Store a new user. Raises DuplicateKeyError if the email is taken."""
+
+    @abstractmethod
+    async def set_role(self, user_id: str, role: str) -> Optional[int]:
+        """
+        Change a user's role and bump their token_version (absent counts as 0),
+        so tokens carrying the old role can be told apart.
+        Returns the new token version, or None if the user does not exist.
+        """
+
+    @abstractmethod
+    async def replace_password_hash(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        """
+        Store new_hash if the user's hash is still old_hash (a password
+        changed in the meantime wins). Returns True if it was replaced.
+        """
+
+    @abstractmethod
+    async def delete(self, user_id: str) -> bool:
+        """Delete a user. Returns False if the user does not exist."""
+
+    @abstractmethod
+    async def ensure_indexes(self) -> dict:
+        """Create indexes if needed; returns {"created", "existing", "failed"} name lists."""
+
+
+class SweetRepository(ABC):
+    """
+    Storage operations on sweet documents. Documents are plain dicts with an
+    ObjectId _id plus the lowercase name_lower/category_lower search fields.
+    Every method returns copies, so callers may modify results freely.
+    """
+
+    @abstractmethod
+    async def insert(self, sweet: dict):
+        """Store a new sweet; sweet["_id"] must already be set."""
+
+    @abstractmethod
+    async def get(self, sweet_id: ObjectId) -> Optional[dict]:
+        """Return one sweet, or None."""
+
+    @abstractmethod
+    async def list_page(self, after: Optional[ObjectId], limit: int, projection: Optional[dict] = None) -> List[dict]:
+        """Return up to limit sweets with _id > after, ordered by _id."""
+
+    @abstractmethod
+    async def estimated_count(self) -> int:
+        """Cheap (possibly approximate) number of sweets."""
+
+    @abstractmethod
+    def iter_all(self, batch_size: int) -> AsyncIterator[dict]:
+        """Iterate every sweet in _id order, fetching batch_size at a time."""
+
+    @abstractmethod
+    async def search(self, name_prefix: str, category_prefix: str, price_min: float, price_max: float) -> List[dict]:
+        """Sweets whose lowercase name/category start with the given (lowercase) prefixes, within the price range."""
+
+    @abstractmethod
+    async def update_fields(self, sweet_id: ObjectId, changes: dict) -> Optional[Tuple[dict, dict]]:
+        """Set fields and return the sweet (before, after) the update, or None if missing."""
+
+    @abstractmethod
+    async def increment_quantity(self, sweet_id: ObjectId, delta: int) -> Optional[dict]:
+        """Atomically add delta to quantity and return the updated sweet, or None if missing."""
+
+    @abstractmethod
+    async def decrement_quantity(self, sweet_id: ObjectId, quantity: int) -> Optional[dict]:
+        """
+        Atomically take quantity units if at least that many are in stock.
+        Returns the updated sweet, or None if it is missing or short.
+        """
+
+    @abstractmethod
+    async def bulk_increment(self, deltas: Dict[ObjectId, int]) -> Dict[int, str]:
+        """Add a quantity delta to many sweets in one write; returns {index: error} for failures."""
+
+    @abstractmethod
+    async def delete(self, sweet_id: ObjectId) -> Optional[dict]:
+        """Delete a sweet. Returns the deleted document, or None if it did not exist."""
+
+    @abstractmethod
+    async def decrement_basket(self, basket: Dict[ObjectId, int]) -> Dict[ObjectId, str]:
+        """
+        Atomically decrement every sweet in basket by its quantity, all or
+        nothing. Returns a status per ID: ok, not_found, insufficient_stock
+        or not_applied (line was fine but another line failed).
+        """
+
+    @abstractmethod
+    async def bulk_insert(self, sweets: List[dict]) -> Dict[int, str]:
+        """Insert many sweets; returns {index: error} for the ones that failed."""
+
+    @abstractmethod
+    async def bulk_update(self, updates: List[Tuple[ObjectId, dict]]) -> Dict[int, str]:
+        """Apply many (id, changes) updates; returns {index: error} for failures."""
+
+    @abstractmethod
+    async def bulk_delete(self, sweet_ids: List[ObjectId]) -> Dict[int, str]:
+        """Delete many sweets; returns {index: error} for failures."""
+
+    @abstractmethod
+    async def existing_ids(self, sweet_ids: List[ObjectId]) -> Set[ObjectId]:
+        """Return the subset of sweet_ids that exist."""
+
+    @abstractmethod
+    async def categories_of(self, sweet_ids: List[ObjectId]) -> Dict[ObjectId, str]:
+        """Return the category of each of sweet_ids that exists."""
+
+    @abstractmethod
+    async def facet_stats(self, categories: Optional[List[str]] = None) -> List[dict]:
+        """
+        Per-category aggregates over the catalog, or over the given categories
+        only: {category, count, in_stock (quantity > 0), price_sum, min_price,
+        max_price}.
+        """
+
+    @abstractmethod
+    def watch(self, resume_after: Optional[dict] = None) -> AsyncIterator[dict]:
+        """
+        Stream catalog changes as {"op", "_id", "document", "resume_token"},
+        plus optional "before" (the pre-image, if the backend keeps one) and
+        "updated_fields" (names set by an update). op is insert, update,
+        replace or delete; document is None for deletes. Bumps of the shared
+        catalog version arrive as {"op": "version", "version", "resume_token"}.
+        Raises ChangeStreamUnsupported if the backend cannot.
+        """
+
+    @abstractmethod
+    async def bump_catalog_version(self) -> int:
+        """Increment the shared catalog version counter; returns the value before."""
+
+    @abstractmethod
+    async def get_catalog_version(self) -> int:
+        """Current shared catalog version counter (0 if never bumped)."""
+
+    @asynccontextmanager
+    async def consistent_reads(self):
+        """
+        Catalog reads in this block see at least every write included in the
+        newest shared catalog version this process has bumped, read or been
+        streamed, even when served by a lagging replica. Backends without
+        replicas read their latest state anyway.
+        """
+        yield
+
+    @abstractmethod
+    async def ensure_indexes(self) -> dict:
+        """Create indexes if needed; returns {"created", "existing", "failed"} name lists."""
+
+    @abstractmethod
+    async def backfill_search_fields(self):
+        """Fill in name_lower/category_lower on sweets written before they existed."""
+
+
+class HoldRepository(ABC):
+    """
+    Stock holds ({_id, sweet_id, user_id, quantity, expires_at}). Placing a
+    hold moves units from the sweet's quantity (available stock) into its
+    held counter; closing or expiring the hold settles them again.
+    """
+
+    @abstractmethod
+    async def create(self, hold: dict) -> str:
+        """
+        Reserve hold["quantity"] units of hold["sweet_id"] and store the hold.
+        Returns ok, not_found or insufficient_stock.
+        """
+
+    @abstractmethod
+    async def close(self, hold_id: ObjectId, user_id: str, now: datetime, purchased: bool) -> Optional[dict]:
+        """
+        Remove an unexpired hold owned by user_id. Purchased units leave stock
+        for good; released units return to quantity. Returns the hold, or None.
+        """
+
+    @abstractmethod
+    async def reap(self, now: datetime, batch_size: int) -> List[ObjectId]:
+        """Return up to batch_size expired holds to stock; returns the sweet ID of each hold reaped."""
+
+    @abstractmethod
+    async def delete_for_sweets(self, sweet_ids: List[ObjectId]) -> int:
+        """Drop the holds of deleted sweets (their units have nowhere to go); returns how many."""
+
+    @abstractmethod
+    async def ensure_indexes(self) -> dict:
+        """Create indexes if needed; returns {"created", "existing", "failed"} name lists."""
+
+
+class RevocationRepository(ABC):
+    """
+    Token revocations ({_id: user_id, version, revoked_at}): tokens of that
+    user whose "ver" claim is below version are no longer valid. Entries only
+    matter while tokens issued before them can still be unexpired.
+    """
+
+    @abstractmethod
+    async def record(self, user_id: str, version: int, revoked_at: datetime):
+        """Store a revocation, keeping the highest version recorded for the user."""
+
+    @abstractmethod
+    async def active(self, since: datetime) -> List[dict]:
+        """Return revocations recorded at or after since."""
+
+    @abstractmethod
+    async def ensure_indexes(self) -> dict:
+        """Create indexes if needed; returns {"created", "existing", "failed"} name lists."""
+
+
+class RateLimitRepository(ABC):
+    """
+    Token buckets shared by every worker ({_id: key, tokens, updated_at,
+    expires_at}). A bucket left alone until it is full again is the same as
+    no bucket, so it may be dropped from then on (expires_at).
+    """
+
+    @abstractmethod
+    async def take(self, key: str, burst: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        """
+        Atomically refill the bucket (rate tokens per second, at most burst)
+        and take cost tokens if available.
+        Returns (allowed, seconds until cost tokens are available).
+        """
+
+    @abstractmethod
+    async def ensure_indexes(self) -> dict:
+        """Create indexes if needed; returns {"created", "existing", "failed"} name lists."""
@@ -0,0 +1,371 @@
+# app/repositories/memory.py
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from bson import ObjectId
+from app.repositories.base import (
+    ChangeStreamUnsupported, DuplicateKeyError, HoldRepository, RateLimitRepository, RevocationRepository,
+    SweetRepository, UserRepository,
+    HOLD_INDEX_NAMES, RATE_LIMIT_INDEX_NAMES, REVOCATION_INDEX_NAMES, SWEET_INDEX_NAMES, USER_INDEX_NAMES
+)
+from app.utils.rate_limit import LocalBucketStore
+
+# In-process storage engine for tests and benchmarks (STORAGE_BACKEND=memory).
+# Every method runs without awaiting, so each call is atomic on the event loop.
+# Data lives only as long as the process.
+
+
+def _report(index_names: List[str]) -> dict:
+    # Indexes are part of the data structures, so they always exist
+    return {"created": [], "existing": list(index_names), "failed": []}
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self._users = {}   # _id -> user document
+        self._emails = {}  # email -> _id (unique index)
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        user_id = self._emails.get(email)
+        return dict(self._users[user_id]) if user_id is not None else None
+
+    async def find_by_id(self, user_id: str) -> Optional[dict]:
+        user = self._users.get(user_id)
+        return dict(user) if user else None
+
+    async def insert(self, user: dict):
+        if user["email"] in self._emails or user["_id"] in self._users:
+            raise DuplicateKeyError(f"Duplicate user: {user['email']}")
+        self._users[user["_id"]] = dict(user)
+        self._emails[user["email"]] = user["_id"]
+
+    async def set_role(self, user_id: str, role: str) -> Optional[int]:
+        user = self._users.get(user_id)
+        if not user:
+            return None
+        user["role"] = role
+        user["token_version"] = user.get("token_version", 0) + 1
+        return user["token_version"]
+
+    async def replace_password_hash(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        user = self._users.get(user_id)
+        if not user or user["hashed_password"] != old_hash:
+            return False
+        user["hashed_password"] = new_hash
+        return True
+
+    async def delete(self, user_id: str) -> bool:
+        user = self._users.pop(user_id, None)
+        if not user:
+            return False
+        del self._emails[user["email"]]
+        return True
+
+    async def ensure_indexes(self) -> dict:
+        return _report(USER_INDEX_NAMES)
+
+
+class MemoryRevocationRepository(RevocationRepository):
+    def __init__(self):
+        self._revocations = {}  # user_id -> revocation document
+
+    async def record(self, user_id: str, version: int, revoked_at: datetime):
+        previous = self._revocations.get(user_id, {"version": version})
+        self._revocations[user_id] = {
+            "_id": user_id, "version": max(version, previous["version"]), "revoked_at": revoked_at
+        }
+
+    async def active(self, since: datetime) -> List[dict]:
+        return [dict(entry) for entry in self._revocations.values() if entry["revoked_at"] >= since]
+
+    async def ensure_indexes(self) -> dict:
+        return _report(REVOCATION_INDEX_NAMES)
+
+
+class MemoryRateLimitRepository(RateLimitRepository):
+    """Process-local stand-in for a shared bucket store (e.g. Redis or the Mongo collection)."""
+
+    def __init__(self, max_keys: int):
+        self._buckets = LocalBucketStore(max_keys)
+
+    async def take(self, key: str, burst: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        return self._buckets.take_now(key, burst, rate, cost)
+
+    async def ensure_indexes(self) -> dict:
+        return _report(RATE_LIMIT_INDEX_NAMES)
+
+
+class MemorySweetRepository(SweetRepository):
+    """
+    Sweets in a dict keyed by ObjectId, plus sorted secondary indexes
+    (maintained with bisect) mirroring the Mongo ones: _id order for keyset
+    pagination, price for range queries, and name_lower/category_lower for
+    prefix search.
+    """
+
+    def __init__(self):
+        self._docs = {}            # _id -> sweet document
+        self._ids = []             # sorted _ids
+        self._price_index = []     # sorted (price, _id)
+        self._name_index = []      # sorted (name_lower, _id)
+        self._category_index = []  # sorted (category_lower, _id)
+        self._catalog_version = 0  # Shared version counter (process-local here)
+
+    # --- index maintenance -------------------------------------------------
+
+    def _index_entries(self, doc: dict):
+        return (
+            (self._price_index, (doc["price"], doc["_id"])),
+            (self._name_index, (doc["name_lower"], doc["_id"])),
+            (self._category_index, (doc["category_lower"], doc["_id"])),
+        )
+
+    def _store(self, doc: dict):
+        doc.setdefault("name_lower", doc["name"].lower())
+        doc.setdefault("category_lower", doc["category"].lower())
+        self._docs[doc["_id"]] = doc
+        insort(self._ids, doc["_id"])
+        for index, entry in self._index_entries(doc):
+            insort(index, entry)
+
+    def _remove(self, sweet_id: ObjectId) -> Optional[dict]:
+        doc = self._docs.pop(sweet_id, None)
+        if doc is None:
+            return None
+        del self._ids[bisect_left(self._ids, sweet_id)]
+        for index, entry in self._index_entries(doc):
+            del index[bisect_left(index, entry)]
+        return doc
+
+    def _apply_changes(self, sweet_id: ObjectId, changes: dict) -> Optional[dict]:
+        doc = self._remove(sweet_id)
+        if doc is None:
+            return None
+        doc.update(changes)
+        self._store(doc)
+        return doc
+
+    @staticmethod
+    def _prefix_scan(index: list, prefix: str):
+        position = bisect_left(index, (prefix,))
+        while position < len(index) and index[position][0].startswith(prefix):
+            yield index[position][1]
+            position += 1
+
+    # --- repository API ----------------------------------------------------
+
+    async def insert(self, sweet: dict):
+        if sweet["_id"] in self._docs:
+            raise DuplicateKeyError(f"Duplicate sweet: {sweet['_id']}")
+        self._store(dict(sweet))
+
+    async def get(self, sweet_id: ObjectId) -> Optional[dict]:
+        doc = self._docs.get(sweet_id)
+        return dict(doc) if doc else None
+
+    async def list_page(self, after: Optional[ObjectId], limit: int, projection: Optional[dict] = None) -> List[dict]:
+        start = bisect_right(self._ids, after) if after else 0
+        page = [self._docs[sweet_id] for sweet_id in self._ids[start:start + limit]]
+        if projection:
+            return [{key: doc[key] for key in ("_id", *projection) if key in doc} for doc in page]
+        return [dict(doc) for doc in page]
+
+    async def estimated_count(self) -> int:
+        return len(self._docs)
+
+    async def iter_all(self, batch_size: int):
+        ids = list(self._ids)
+        for start in range(0, len(ids), batch_size):
+            for sweet_id in ids[start:start + batch_size]:
+                doc = self._docs.get(sweet_id)
+                if doc is not None:
+                    yield dict(doc)
+
+    async def search(self, name_prefix: str, category_prefix: str, price_min: float, price_max: float) -> List[dict]:
+        # Drive the scan from the most selective index, then filter the rest
+        if name_prefix:
+            candidates = self._prefix_scan(self._name_index, name_prefix)
+        elif category_prefix:
+            candidates = self._prefix_scan(self._category_index, category_prefix)
+        else:
+            start = bisect_left(self._price_index, (price_min,))
+            candidates = (
+                sweet_id for price, sweet_id in self._price_index[start:] if price <= price_max
+            )
+        results = []
+        for sweet_id in candidates:
+            doc = self._docs[sweet_id]
+            if (price_min <= doc["price"] <= price_max
+                    and doc["name_lower"].startswith(name_prefix)
+                    and doc["category_lower"].startswith(category_prefix)):
+                results.append(dict(doc))
+        return results
+
+    async def update_fields(self, sweet_id: ObjectId, changes: dict) -> Optional[Tuple[dict, dict]]:
+        before = self._docs.get(sweet_id)
+        if before is None:
+            return None
+        before = dict(before)
+        return before, dict(self._apply_changes(sweet_id, changes))
+
+    async def increment_quantity(self, sweet_id: ObjectId, delta: int) -> Optional[dict]:
+        doc = self._docs.get(sweet_id)
+        if doc is None:
+            return None
+        doc["quantity"] = doc.get("quantity", 0) + delta
+        return dict(doc)
+
+    async def decrement_quantity(self, sweet_id: ObjectId, quantity: int) -> Optional[dict]:
+        doc = self._docs.get(sweet_id)
+        if doc is None or doc.get("quantity", 0) < quantity:
+            return None
+        doc["quantity"] -= quantity
+        return dict(doc)
+
+    async def bulk_increment(self, deltas: Dict[ObjectId, int]) -> Dict[int, str]:
+        for sweet_id, delta in deltas.items():
+            doc = self._docs.get(sweet_id)
+            if doc is not None:
+                doc["quantity"] = doc.get("quantity", 0) + delta
+        return {}
+
+    async def delete(self, sweet_id: ObjectId) -> Optional[dict]:
+        doc = self._remove(sweet_id)
+        return dict(doc) if doc else None
+
+    async def decrement_basket(self, basket: Dict[ObjectId, int]) -> Dict[ObjectId, str]:
+        statuses = {}
+        for sweet_id, quantity in basket.items():
+            doc = self._docs.get(sweet_id)
+            if doc is None:
+                statuses[sweet_id] = "not_found"
+            elif doc.get("quantity", 0) < quantity:
+                statuses[sweet_id] = "insufficient_stock"
+            else:
+                statuses[sweet_id] = "ok"
+        if any(status != "ok" for status in statuses.values()):
+            return {sweet_id: "not_applied" if status == "ok" else status for sweet_id, status in statuses.items()}
+        for sweet_id, quantity in basket.items():
+            self._docs[sweet_id]["quantity"] -= quantity
+        return statuses
+
+    async def bulk_insert(self, sweets: List[dict]) -> Dict[int, str]:
+        errors = {}
+        for index, sweet in enumerate(sweets):
+            if sweet["_id"] in self._docs:
+                errors[index] = "Duplicate key"
+            else:
+                self._store(dict(sweet))
+        return errors
+
+    async def bulk_update(self, updates: List[Tuple[ObjectId, dict]]) -> Dict[int, str]:
+        for sweet_id, changes in updates:
+            self._apply_changes(sweet_id, changes)
+        return {}
+
+    async def bulk_delete(self, sweet_ids: List[ObjectId]) -> Dict[int, str]:
+        for sweet_id in sweet_ids:
+            self._remove(sweet_id)
+        return {}
+
+    async def existing_ids(self, sweet_ids: List[ObjectId]) -> Set[ObjectId]:
+        return {sweet_id for sweet_id in sweet_ids if sweet_id in self._docs}
+
+    async def categories_of(self, sweet_ids: List[ObjectId]) -> Dict[ObjectId, str]:
+        return {sweet_id: self._docs[sweet_id]["category"] for sweet_id in sweet_ids if sweet_id in self._docs}
+
+    async def ensure_indexes(self) -> dict:
+        return _report(SWEET_INDEX_NAMES)
+
+    async def backfill_search_fields(self):
+        pass  # _store always derives the search fields
+
+    async def facet_stats(self, categories: Optional[List[str]] = None) -> List[dict]:
+        wanted = None if categories is None else set(categories)
+        groups = {}
+        for doc in self._docs.values():
+            if wanted is not None and doc["category"] not in wanted:
+                continue
+            group = groups.setdefault(doc["category"], {
+                "category": doc["category"], "count": 0, "in_stock": 0,
+                "price_sum": 0.0, "min_price": doc["price"], "max_price": doc["price"],
+            })
+            group["count"] += 1
+            group["in_stock"] += doc.get("quantity", 0) > 0
+            group["price_sum"] += doc["price"]
+            group["min_price"] = min(group["min_price"], doc["price"])
+            group["max_price"] = max(group["max_price"], doc["price"])
+        return list(groups.values())
+
+    async def watch(self, resume_after: Optional[dict] = None):
+        raise ChangeStreamUnsupported("The in-memory engine has no change stream")
+        yield  # Makes this an async generator, like the Mongo implementation
+
+    async def bump_catalog_version(self) -> int:
+        self._catalog_version += 1
+        return self._catalog_version - 1
+
+    async def get_catalog_version(self) -> int:
+        return self._catalog_version
+
+
+class MemoryHoldRepository(HoldRepository):
+    """
+    Holds in a dict plus a sorted (expires_at, _id) index, so the reaper
+    reads expired holds from the front without scanning the rest.
+    Adjusts the sweet documents of the given MemorySweetRepository.
+    """
+
+    def __init__(self, sweets: MemorySweetRepository):
+        self._sweets = sweets
+        self._holds = {}   # _id -> hold document
+        self._expiry = []  # sorted (expires_at, _id)
+
+    def _settle(self, hold: dict, returned: int):
+        doc = self._sweets._docs.get(hold["sweet_id"])
+        if doc is not None:
+            doc["held"] = doc.get("held", 0) - hold["quantity"]
+            doc["quantity"] += returned
+
+    def _pop(self, hold_id: ObjectId) -> dict:
+        hold = self._holds.pop(hold_id)
+        del self._expiry[bisect_left(self._expiry, (hold["expires_at"], hold_id))]
+        return hold
+
+    async def create(self, hold: dict) -> str:
+        doc = self._sweets._docs.get(hold["sweet_id"])
+        if doc is None:
+            return "not_found"
+        if doc.get("quantity", 0) < hold["quantity"]:
+            return "insufficient_stock"
+        doc["quantity"] -= hold["quantity"]
+        doc["held"] = doc.get("held", 0) + hold["quantity"]
+        self._holds[hold["_id"]] = dict(hold)
+        insort(self._expiry, (hold["expires_at"], hold["_id"]))
+        return "ok"
+
+    async def close(self, hold_id: ObjectId, user_id: str, now: datetime, purchased: bool) -> Optional[dict]:
+        hold = self._holds.get(hold_id)
+        if hold is None or hold["user_id"] != user_id or hold["expires_at"] <= now:
+            return None
+        self._pop(hold_id)
+        self._settle(hold, 0 if purchased else hold["quantity"])
+        return dict(hold)
+
+    async def reap(self, now: datetime, batch_size: int) -> List[ObjectId]:
+        reaped = []
+        while len(reaped) < batch_size and self._expiry and self._expiry[0][0] <= now:
+            hold = self._pop(self._expiry[0][1])
+            self._settle(hold, hold["quantity"])
+            reaped.append(hold["sweet_id"])
+        return reaped
+
+    async def delete_for_sweets(self, sweet_ids: List[ObjectId]) -> int:
+        targets = set(sweet_ids)
+        doomed = [hold_id for hold_id, hold in self._holds.items() if hold["sweet_id"] in targets]
+        for hold_id in doomed:
+            self._pop(hold_id)
+        return len(doomed)
+
+    async def ensure_indexes(self) -> dict:
+        return _report(HOLD_INDEX_NAMES)
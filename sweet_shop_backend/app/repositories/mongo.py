@@ -0,0 +1,618 @@
+# app/repositories/mongo.py
+import asyncio
+import re
+import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DeleteOne, IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo import errors as mongo_errors
+from app.config import settings
+from app.database import (
+    client, user_collection, sweet_collection, sweet_read_collection, hold_collection, meta_collection,
+    rate_limit_collection, revocation_collection
+)
+from app.repositories.base import (
+    ChangeStreamUnsupported, DuplicateKeyError, HoldRepository, RateLimitRepository, RevocationRepository,
+    SweetRepository, UserRepository
+)
+from app.utils.rate_limit import retry_after
+
+# Unique email index: O(log n) login lookups and database-enforced uniqueness
+USER_INDEXES = [
+    IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+]
+
+# Indexes backing search: prefix match on name, category + price range
+SWEET_INDEXES = [
+    IndexModel([("name_lower", ASCENDING)], name="name_lower_1"),
+    IndexModel([("category_lower", ASCENDING), ("price", ASCENDING)], name="category_lower_1_price_1"),
+    IndexModel([("price", ASCENDING)], name="price_1"),
+]
+
+# Reaper lookups: unclaimed holds by expiry, a reaper's own claimed batch,
+# and stale claims left by a reaper that died mid-pass
+HOLD_INDEXES = [
+    IndexModel([("claimed_by", ASCENDING), ("expires_at", ASCENDING)], name="claimed_by_1_expires_at_1"),
+    IndexModel([("claimed_at", ASCENDING)], name="claimed_at_1", sparse=True),
+    IndexModel([("sweet_id", ASCENDING)], name="sweet_id_1"),
+]
+
+# Revocations expire once every token issued before them has expired too
+REVOCATION_INDEXES = [
+    IndexModel([("revoked_at", ASCENDING)], name="revoked_at_ttl",
+               expireAfterSeconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60),
+]
+
+# Buckets are deleted once they would have refilled completely
+RATE_LIMIT_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+]
+
+# Causally consistent session of the current consistent_reads() block, if any
+_read_session: ContextVar = ContextVar("catalog_read_session", default=None)
+
+# Server error code returned by standalone mongod for transactional writes
+ILLEGAL_OPERATION = 20
+
+# Runs of a checkout transaction that keeps hitting write conflicts with
+# concurrent checkouts before the basket is reported as not applied
+TRANSACTION_ATTEMPTS = 5
+
+# Server error codes meaning change streams are unavailable (standalone mongod)
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}
+
+
+async def provision(collection, indexes) -> dict:
+    """
+    Create the given indexes on one collection (idempotent).
+    Returns which index names were newly created, already existed or failed.
+    """
+    existing = set(await collection.index_information())
+    report = {"created": [], "existing": [], "failed": []}
+    for index in indexes:
+        name = index.document["name"]
+        if name in existing:
+            report["existing"].append(name)
+            continue
+        try:
+            await collection.create_indexes([index])
+            report["created"].append(name)
+        except mongo_errors.OperationFailure as exc:
+            # e.g. a unique index cannot be built over existing duplicates
+            print(f"Index {collection.name}.{name} not created: {exc}")
+            report["failed"].append(name)
+    return report
+
+
+def build_search_query(name_prefix: str, category_prefix: str, price_min: float, price_max: float) -> dict:
+    """
+    Build the search filter. Prefixes are escaped so user input is never
+    interpreted as a regex, and anchored so they can use an index.
+    Empty filters are left out.
+    """
+    query = {"price": {"$gte": price_min, "$lte": price_max}}
+    if name_prefix:
+        query["name_lower"] = {"$regex": "^" + re.escape(name_prefix)}
+    if category_prefix:
+        query["category_lower"] = {"$regex": "^" + re.escape(category_prefix)}
+    return query
+
+
+async def run_bulk(collection, operations: list) -> Dict[int, str]:
+    """
+    Apply operations in one unordered bulk_write.
+    Returns {operation index: error message} for the operations that failed.
+    """
+    if not operations:
+        return {}
+    try:
+        await collection.bulk_write(operations, ordered=False)
+    except mongo_errors.BulkWriteError as exc:
+        return {error["index"]: error.get("errmsg", "Write failed") for error in exc.details["writeErrors"]}
+    return {}
+
+
+class _TransactionConflict(Exception):
+    """Aborts a checkout transaction that conflicted TRANSACTION_ATTEMPTS times."""
+
+
+class _InsufficientStock(Exception):
+    """Raised inside a checkout transaction to abort it."""
+
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, collection=user_collection):
+        self.collection = collection
+
+    async def find_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email})
+
+    async def find_by_id(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"_id": user_id})
+
+    async def insert(self, user: dict):
+        try:
+            await self.collection.insert_one(user)
+        except mongo_errors.DuplicateKeyError as exc:
+            raise DuplicateKeyError(str(exc)) from exc
+
+    async def set_role(self, user_id: str, role: str) -> Optional[int]:
+        user = await self.collection.find_one_and_update(
+            {"_id": user_id},
+            {"$set": {"role": role}, "$inc": {"token_version": 1}},
+            projection={"token_version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return user["token_version"] if user else None
+
+    async def replace_password_hash(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        result = await self.collection.update_one(
+            {"_id": user_id, "hashed_password": old_hash}, {"$set": {"hashed_password": new_hash}}
+        )
+        return result.modified_count > 0
+
+    async def delete(self, user_id: str) -> bool:
+        result = await self.collection.delete_one({"_id": user_id})
+        return result.deleted_count > 0
+
+    async def ensure_indexes(self) -> dict:
+        return await provision(self.collection, USER_INDEXES)
+
+
+class MongoRevocationRepository(RevocationRepository):
+    def __init__(self, collection=revocation_collection):
+        self.collection = collection
+
+    async def record(self, user_id: str, version: int, revoked_at: datetime):
+        await self.collection.update_one(
+            {"_id": user_id},
+            {"$max": {"version": version}, "$set": {"revoked_at": revoked_at}},
+            upsert=True,
+        )
+
+    async def active(self, since: datetime) -> List[dict]:
+        return await self.collection.find({"revoked_at": {"$gte": since}}).to_list(None)
+
+    async def ensure_indexes(self) -> dict:
+        return await provision(self.collection, REVOCATION_INDEXES)
+
+
+def token_bucket_pipeline(burst: int, rate: float, cost: int) -> list:
+    """
+    Update pipeline refilling a bucket from the time elapsed on the server
+    clock ($$NOW, so worker clocks do not matter) and taking cost tokens if
+    there are enough: the same O(1) step as LocalBucketStore, applied
+    atomically to one document. A missing bucket starts full.
+    """
+    elapsed_seconds = {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]}, 1000]}
+    allowed = {"$gte": ["$tokens", cost]}
+    # A bucket that never refills is kept for a day
+    ms_per_token = 1000 / rate if rate > 0 else 86_400_000
+    return [
+        {"$set": {
+            "tokens": {"$min": [burst, {"$add": [{"$ifNull": ["$tokens", burst]}, {"$multiply": [elapsed_seconds, rate]}]}]},
+            "updated_at": "$$NOW",
+        }},
+        {"$set": {
+            "allowed": allowed,
+            "tokens": {"$cond": [allowed, {"$subtract": ["$tokens", cost]}, "$tokens"]},
+        }},
+        {"$set": {
+            "expires_at": {"$add": ["$$NOW", {"$multiply": [{"$subtract": [burst, "$tokens"]}, ms_per_token]}]},
+        }},
+    ]
+
+
+class MongoRateLimitRepository(RateLimitRepository):
+    def __init__(self, collection=rate_limit_collection):
+        self.collection = collection
+
+    async def take(self, key: str, burst: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        bucket = await self.collection.find_one_and_update(
+            {"_id": key},
+            token_bucket_pipeline(burst, rate, cost),
+            projection={"tokens": 1, "allowed": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return True, 0.0
+        return False, retry_after(bucket["tokens"], cost, rate)
+
+    async def ensure_indexes(self) -> dict:
+        return await provision(self.collection, RATE_LIMIT_INDEXES)
+
+
+class MongoSweetRepository(SweetRepository):
+    def __init__(self, collection=sweet_collection, read_collection=sweet_read_collection, meta=meta_collection):
+        self.collection = collection
+        self.meta = meta
+        # Public catalog reads may go to secondaries (MONGO_CATALOG_READ_PREFERENCE)
+        self.read_collection = read_collection
+        # Cached result of the first transaction attempt (None until probed)
+        self.transactions_supported = None
+        # Cluster time of the newest catalog version this process has seen
+        self._version_time = None
+
+    def _saw_version(self, cluster_time):
+        if cluster_time is not None and (self._version_time is None or cluster_time > self._version_time):
+            self._version_time = cluster_time
+
+    async def insert(self, sweet: dict):
+        await self.collection.insert_one(sweet)
+
+    async def get(self, sweet_id: ObjectId) -> Optional[dict]:
+        return await self.collection.find_one({"_id": sweet_id})
+
+    async def list_page(self, after: Optional[ObjectId], limit: int, projection: Optional[dict] = None) -> List[dict]:
+        query = {"_id": {"$gt": after}} if after else {}
+        cursor = self.read_collection.find(query, projection, session=_read_session.get()).sort("_id", 1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def estimated_count(self) -> int:
+        # Answered from collection metadata, no scan
+        return await self.read_collection.estimated_document_count()
+
+    def iter_all(self, batch_size: int):
+        return self.read_collection.find().sort("_id", 1).batch_size(batch_size)
+
+    async def search(self, name_prefix: str, category_prefix: str, price_min: float, price_max: float) -> List[dict]:
+        cursor = self.read_collection.find(
+            build_search_query(name_prefix, category_prefix, price_min, price_max), session=_read_session.get()
+        )
+        return await cursor.to_list(length=None)
+
+    async def update_fields(self, sweet_id: ObjectId, changes: dict) -> Optional[Tuple[dict, dict]]:
+        # One round trip: fetch the previous version and derive the new one,
+        # since $set of top-level fields is exactly a dict update
+        before = await self.collection.find_one_and_update(
+            {"_id": sweet_id},
+            {"$set": changes},
+            return_document=ReturnDocument.BEFORE
+        )
+        return (before, {**before, **changes}) if before else None
+
+    async def increment_quantity(self, sweet_id: ObjectId, delta: int) -> Optional[dict]:
+        # Single atomic server-side increment; returns the post-update document
+        # so concurrent restocks never lose updates.
+        return await self.collection.find_one_and_update(
+            {"_id": sweet_id},
+            {"$inc": {"quantity": delta}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def decrement_quantity(self, sweet_id: ObjectId, quantity: int) -> Optional[dict]:
+        # The quantity guard and the decrement are one atomic server-side step
+        return await self.collection.find_one_and_update(
+            {"_id": sweet_id, "quantity": {"$gte": quantity}},
+            {"$inc": {"quantity": -quantity}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def bulk_increment(self, deltas: Dict[ObjectId, int]) -> Dict[int, str]:
+        return await run_bulk(self.collection, [
+            UpdateOne({"_id": sweet_id}, {"$inc": {"quantity": delta}}) for sweet_id, delta in deltas.items()
+        ])
+
+    async def delete(self, sweet_id: ObjectId) -> Optional[dict]:
+        return await self.collection.find_one_and_delete({"_id": sweet_id})
+
+    async def _classify_failures(self, basket: Dict[ObjectId, int]) -> Dict[ObjectId, str]:
+        """
+        Work out why a basket could not be fulfilled.
+        Returns a status per sweet ID based on current stock levels.
+        """
+        stock = {}
+        async for sweet in self.collection.find({"_id": {"$in": list(basket)}}, {"quantity": 1}):
+            stock[sweet["_id"]] = sweet.get("quantity", 0)
+
+        statuses = {}
+        for sweet_id, quantity in basket.items():
+            if sweet_id not in stock:
+                statuses[sweet_id] = "not_found"
+            elif stock[sweet_id] < quantity:
+                statuses[sweet_id] = "insufficient_stock"
+            else:
+                statuses[sweet_id] = "not_applied"
+        return statuses
+
+    async def _decrement_transaction(self, basket: Dict[ObjectId, int]) -> Dict[ObjectId, str]:
+        """
+        Decrement every line in one bulk write inside a transaction.
+        Any line failing its quantity guard aborts the whole transaction.
+        with_transaction re-runs it after write conflicts with concurrent
+        checkouts (TransientTransactionError) and retries an unknown commit
+        result; a basket still conflicting after TRANSACTION_ATTEMPTS runs
+        is reported as not applied, like any other failed basket.
+        """
+        operations = [
+            UpdateOne({"_id": sweet_id, "quantity": {"$gte": quantity}}, {"$inc": {"quantity": -quantity}})
+            for sweet_id, quantity in basket.items()
+        ]
+        attempts = 0
+
+        async def decrement(session):
+            nonlocal attempts
+            attempts += 1
+            if attempts > TRANSACTION_ATTEMPTS:
+                raise _TransactionConflict()
+            result = await self.collection.bulk_write(operations, ordered=False, session=session)
+            if result.modified_count != len(operations):
+                raise _InsufficientStock()
+
+        try:
+            async with await client.start_session() as session:
+                await session.with_transaction(decrement)
+        except _InsufficientStock:
+            return await self._classify_failures(basket)
+        except _TransactionConflict:
+            return {sweet_id: "not_applied" for sweet_id in basket}
+        except mongo_errors.PyMongoError as exc:
+            if not exc.has_error_label("TransientTransactionError"):
+                raise
+            return {sweet_id: "not_applied" for sweet_id in basket}  # Out of with_transaction's retry time
+        return {sweet_id: "ok" for sweet_id in basket}
+
+    async def _decrement_compensating(self, basket: Dict[ObjectId, int]) -> Dict[ObjectId, str]:
+        """
+        Fallback for servers without transactions (standalone mongod).
+        Each line is an atomic conditional decrement; if any line fails,
+        the successful ones are returned to stock in one bulk write.
+        """
+        async def decrement(sweet_id: ObjectId, quantity: int):
+            return await self.collection.find_one_and_update(
+                {"_id": sweet_id, "quantity": {"$gte": quantity}},
+                {"$inc": {"quantity": -quantity}},
+                projection={"_id": 1}
+            )
+
+        results = await asyncio.gather(*(decrement(sweet_id, quantity) for sweet_id, quantity in basket.items()))
+        applied = [sweet_id for sweet_id, doc in zip(basket, results) if doc is not None]
+        if len(applied) == len(basket):
+            return {sweet_id: "ok" for sweet_id in basket}
+
+        if applied:
+            await self.collection.bulk_write([
+                UpdateOne({"_id": sweet_id}, {"$inc": {"quantity": basket[sweet_id]}})
+                for sweet_id in applied
+            ], ordered=False)
+        return await self._classify_failures(basket)
+
+    async def decrement_basket(self, basket: Dict[ObjectId, int]) -> Dict[ObjectId, str]:
+        if self.transactions_supported is False:
+            return await self._decrement_compensating(basket)
+        try:
+            statuses = await self._decrement_transaction(basket)
+            self.transactions_supported = True
+            return statuses
+        except mongo_errors.OperationFailure as exc:
+            if exc.code != ILLEGAL_OPERATION:
+                raise
+            self.transactions_supported = False
+            return await self._decrement_compensating(basket)
+
+    async def bulk_insert(self, sweets: List[dict]) -> Dict[int, str]:
+        return await run_bulk(self.collection, [InsertOne(sweet) for sweet in sweets])
+
+    async def bulk_update(self, updates: List[Tuple[ObjectId, dict]]) -> Dict[int, str]:
+        return await run_bulk(self.collection, [
+            UpdateOne({"_id": sweet_id}, {"$set": changes}) for sweet_id, changes in updates
+        ])
+
+    async def bulk_delete(self, sweet_ids: List[ObjectId]) -> Dict[int, str]:
+        return await run_bulk(self.collection, [DeleteOne({"_id": sweet_id}) for sweet_id in sweet_ids])
+
+    async def existing_ids(self, sweet_ids: List[ObjectId]) -> Set[ObjectId]:
+        cursor = self.collection.find({"_id": {"$in": sweet_ids}}, {"_id": 1})
+        return {doc["_id"] async for doc in cursor}
+
+    async def categories_of(self, sweet_ids: List[ObjectId]) -> Dict[ObjectId, str]:
+        cursor = self.collection.find({"_id": {"$in": sweet_ids}}, {"category": 1})
+        return {doc["_id"]: doc["category"] async for doc in cursor}
+
+    async def ensure_indexes(self) -> dict:
+        return await provision(self.collection, SWEET_INDEXES)
+
+    async def facet_stats(self, categories: Optional[List[str]] = None) -> List[dict]:
+        pipeline = []
+        if categories is not None:
+            # category_lower narrows the scan through its index; category keeps the match exact
+            pipeline.append({"$match": {
+                "category_lower": {"$in": sorted({category.lower() for category in categories})},
+                "category": {"$in": categories},
+            }})
+        cursor = self.read_collection.aggregate([
+            *pipeline,
+            {"$group": {
+                "_id": "$category",
+                "count": {"$sum": 1},
+                "in_stock": {"$sum": {"$cond": [{"$gt": ["$quantity", 0]}, 1, 0]}},
+                "price_sum": {"$sum": "$price"},
+                "min_price": {"$min": "$price"},
+                "max_price": {"$max": "$price"},
+            }},
+        ])
+        return [{"category": group.pop("_id"), **group} async for group in cursor]
+
+    async def watch(self, resume_after: Optional[dict] = None):
+        # One database stream for the sweets and the catalog version document,
+        # so the version of a change arrives right behind it
+        pipeline = [{"$match": {"$or": [
+            {"ns.coll": self.collection.name},
+            {"ns.coll": self.meta.name, "documentKey._id": "catalog"},
+        ]}}]
+        try:
+            # Pre-images only arrive where changeStreamPreAndPostImages is enabled on the collection
+            async with self.collection.database.watch(
+                pipeline, full_document="updateLookup", full_document_before_change="whenAvailable",
+                resume_after=resume_after
+            ) as stream:
+                async for change in stream:
+                    updated_fields = change.get("updateDescription", {}).get("updatedFields", {})
+                    if change.get("ns", {}).get("coll") == self.meta.name:
+                        if change["operationType"] not in ("insert", "update", "replace"):
+                            continue
+                        # updatedFields holds this bump's value; the looked-up document may be newer
+                        version = updated_fields.get("version", (change.get("fullDocument") or {}).get("version"))
+                        if version is None:
+                            continue
+                        self._saw_version(change.get("clusterTime"))
+                        yield {"op": "version", "version": version, "resume_token": change["_id"]}
+                        continue
+                    yield {
+                        "op": change["operationType"],
+                        "_id": change.get("documentKey", {}).get("_id"),
+                        "document": change.get("fullDocument"),
+                        "before": change.get("fullDocumentBeforeChange"),
+                        "updated_fields": list(updated_fields),
+                        "resume_token": change["_id"],
+                    }
+        except mongo_errors.OperationFailure as exc:
+            if exc.code in CHANGE_STREAM_UNSUPPORTED:
+                raise ChangeStreamUnsupported(str(exc)) from exc
+            raise
+
+    async def bump_catalog_version(self) -> int:
+        async with await client.start_session() as session:
+            before = await self.meta.find_one_and_update(
+                {"_id": "catalog"}, {"$inc": {"version": 1}}, upsert=True, return_document=ReturnDocument.BEFORE,
+                session=session
+            )
+            self._saw_version(session.operation_time)
+        return before["version"] if before else 0
+
+    async def get_catalog_version(self) -> int:
+        async with await client.start_session() as session:
+            doc = await self.meta.find_one({"_id": "catalog"}, session=session)
+            self._saw_version(session.operation_time)
+        return doc["version"] if doc else 0
+
+    @asynccontextmanager
+    async def consistent_reads(self):
+        # Every version this process knows of was bumped, read or streamed
+        # at or before _version_time. Reads in the session carry it as
+        # afterClusterTime, so a lagging secondary waits until it caught up
+        async with await client.start_session(causal_consistency=True) as session:
+            if self._version_time is not None:
+                session.advance_operation_time(self._version_time)
+            token = _read_session.set(session)
+            try:
+                yield
+            finally:
+                _read_session.reset(token)
+
+    async def backfill_search_fields(self):
+        # Only touches documents that are missing the search fields
+        await self.collection.update_many(
+            {"name_lower": {"$exists": False}},
+            [{"$set": {
+                "name_lower": {"$toLower": "$name"},
+                "category_lower": {"$toLower": "$category"}
+            }}]
+        )
+
+
+class MongoHoldRepository(HoldRepository):
+    """
+    Holds live in their own collection; the sweet document only carries the
+    aggregate held counter, so catalog reads see available stock for free.
+    """
+
+    def __init__(self, collection=hold_collection, sweet_collection=sweet_collection):
+        self.collection = collection
+        self.sweet_collection = sweet_collection
+
+    async def create(self, hold: dict) -> str:
+        quantity = hold["quantity"]
+        # Guarded atomic move from available to held: never oversells
+        reserved = await self.sweet_collection.find_one_and_update(
+            {"_id": hold["sweet_id"], "quantity": {"$gte": quantity}},
+            {"$inc": {"quantity": -quantity, "held": quantity}},
+            projection={"_id": 1}
+        )
+        if reserved is None:
+            exists = await self.sweet_collection.find_one({"_id": hold["sweet_id"]}, {"_id": 1})
+            return "insufficient_stock" if exists else "not_found"
+        try:
+            await self.collection.insert_one({**hold, "claimed_by": None})
+        except Exception:
+            await self.sweet_collection.update_one(
+                {"_id": hold["sweet_id"]}, {"$inc": {"quantity": quantity, "held": -quantity}}
+            )
+            raise
+        return "ok"
+
+    async def close(self, hold_id: ObjectId, user_id: str, now: datetime, purchased: bool) -> Optional[dict]:
+        # Deleting the hold claims it; the reaper only takes expired ones
+        hold = await self.collection.find_one_and_delete(
+            {"_id": hold_id, "user_id": user_id, "claimed_by": None, "expires_at": {"$gt": now}}
+        )
+        if hold is None:
+            return None
+        change = {"held": -hold["quantity"]}
+        if not purchased:
+            change["quantity"] = hold["quantity"]
+        await self.sweet_collection.update_one({"_id": hold["sweet_id"]}, {"$inc": change})
+        return hold
+
+    async def reap(self, now: datetime, batch_size: int) -> List[ObjectId]:
+        """
+        Claim a batch of expired holds with a unique token (so concurrent
+        reapers in other workers never return the same hold twice), return
+        their units, then delete them.
+
+        Every step can be re-run after a crash. Claims older than
+        HOLD_CLAIM_TIMEOUT_SECONDS are taken over by the next pass, and each
+        hold's $inc only applies while its ID is not yet in the sweet's
+        returned_holds, which the same update pushes it onto. An ID is pulled
+        again only once its hold is gone: a pass that took over this pass's
+        claim meanwhile still owns the hold, and the ID must keep guarding
+        that pass's $inc until it deletes it.
+        """
+        claimable = {"expires_at": {"$lte": now}, "$or": [
+            {"claimed_by": None},
+            {"claimed_at": {"$lte": now - timedelta(seconds=settings.HOLD_CLAIM_TIMEOUT_SECONDS)}},
+        ]}
+        expired = self.collection.find(claimable, {"_id": 1}).sort("expires_at", 1).limit(batch_size)
+        hold_ids = [hold["_id"] async for hold in expired]
+        if not hold_ids:
+            return []
+
+        token = uuid.uuid4().hex
+        await self.collection.update_many(
+            {"_id": {"$in": hold_ids}, **claimable}, {"$set": {"claimed_by": token, "claimed_at": now}}
+        )
+        returns, returned_ids = [], {}  # sweet_id -> IDs of its holds in this batch
+        async for hold in self.collection.find({"claimed_by": token}, {"sweet_id": 1, "quantity": 1}):
+            returns.append(UpdateOne(
+                {"_id": hold["sweet_id"], "returned_holds": {"$ne": hold["_id"]}},
+                {"$inc": {"quantity": hold["quantity"], "held": -hold["quantity"]},
+                 "$push": {"returned_holds": hold["_id"]}}
+            ))
+            returned_ids.setdefault(hold["sweet_id"], []).append(hold["_id"])
+        if not returns:
+            return []
+
+        await run_bulk(self.sweet_collection, returns)
+        await self.collection.delete_many({"claimed_by": token})
+        claimed = [hold_id for ids in returned_ids.values() for hold_id in ids]
+        taken_over = {hold["_id"] async for hold in self.collection.find({"_id": {"$in": claimed}}, {"_id": 1})}
+        reaped = {
+            sweet_id: [hold_id for hold_id in ids if hold_id not in taken_over]
+            for sweet_id, ids in returned_ids.items()
+        }
+        await run_bulk(self.sweet_collection, [
+            UpdateOne({"_id": sweet_id}, {"$pullAll": {"returned_holds": ids}})
+            for sweet_id, ids in reaped.items() if ids
+        ])
+        return [sweet_id for sweet_id, ids in reaped.items() for _ in ids]
+
+    async def delete_for_sweets(self, sweet_ids: List[ObjectId]) -> int:
+        result = await self.collection.delete_many({"sweet_id": {"$in": sweet_ids}})
+        return result.deleted_count
+
+    async def ensure_indexes(self) -> dict:
+        return await provision(self.collection, HOLD_INDEXES)
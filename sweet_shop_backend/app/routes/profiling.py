@@ -0,0 +1,24 @@
+# app/routes/profiling.py
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.routes.sweet import verify_admin
+from app.utils.profiler import profile_store
+
+router = APIRouter(
+    prefix="/api/profiles",
+    tags=["Profiling"]
+)
+
+# 🔒 ADMIN ROUTES
+@router.get("/")
+async def list_profiles(user=Depends(verify_admin)):
+    """Stored request profiles, newest first (metadata only)."""
+    return profile_store.summaries()
+
+@router.get("/{profile_id}", response_class=PlainTextResponse)
+async def get_profile(profile_id: str, user=Depends(verify_admin)):
+    """cProfile report of one request, by the ID from its X-Profile-Id header."""
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile["report"]
@@ -1,18 +1,26 @@
-from fastapi import APIRouter, Depends, Header, HTTPException, Body
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Body, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
 from jose import jwt, JWTError
 from app.config import settings
-from app.database import user_collection
-from app.schemas.sweet_schema import SweetCreate, SweetUpdate, SweetResponse
-from app.services import sweet_service
+from app.utils.auth_guard import load_principal, principal_from_claims
+from app.utils.cache import principal_cache
+from app.utils.serialization import FastJSONResponse
+from app.schemas.sweet_schema import (
+    SweetCreate, SweetUpdate, SweetResponse, CheckoutRequest, CheckoutResponse,
+    SweetBulkCreate, SweetBulkUpdate, SweetBulkDelete, BulkResponse, HoldRequest, HoldResponse,
+    CatalogFacets
+)
+from app.services import hold_service, sweet_service
+from app.services.catalog_feed import catalog_feed
 
 router = APIRouter(
     prefix="/api/sweets",
     tags=["Sweets"]
 )
 
-# 🔐 Inline admin check logic
-async def verify_admin(authorization: str = Header(...)):
+# 🔐 Inline token check logic
+async def verify_user(authorization: str = Header(...)):
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid token format")
 
@@ -26,36 +34,141 @@ async def verify_admin(authorization: str = Header(...)):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = await user_collection.find_one({"_id": user_id})
+    # Role and token version come from the signed token: no database hit
+    user = principal_from_claims(payload) or await load_principal(user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
+    return user
+
+# 🔐 Inline admin check logic
+async def verify_admin(user=Depends(verify_user)):
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Admins only")
 
     return user
 
+# 🏷️ Conditional request helpers
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header lists etag (or "*")."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    return "*" in tags or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
 # 🟢 PUBLIC ROUTES
 @router.get("/", response_model=List[SweetResponse])
-async def get_all_sweets():
-    return await sweet_service.get_all_sweets()
+async def get_all_sweets(
+    limit: int = Query(settings.CATALOG_PAGE_SIZE, ge=1, le=settings.CATALOG_MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    # Taken from memory before the read, which is at least as new: a concurrent
+    # write can only make the tag stale, never the rows older than the tag
+    version = sweet_service.current_catalog_version()
+    etag = sweet_service.catalog_etag(version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    page = await sweet_service.get_all_sweets(limit, after, fields, version)
+
+    headers = {"X-Total-Count": str(page["total"]), "ETag": etag, "Cache-Control": "no-cache"}
+    if page["next_cursor"]:
+        headers["X-Next-Cursor"] = page["next_cursor"]
+    # Returned directly: rows are trusted plain dicts and may be projected
+    return FastJSONResponse(content=page["items"], headers=headers)
 
 @router.get("/search", response_model=List[SweetResponse])
-async def search_sweets(name: str = "", category: str = "", price_min: float = 0, price_max: float = 1000):
-    return await sweet_service.search_sweets(name, category, price_min, price_max)
+async def search_sweets(
+    name: str = "",
+    category: str = "",
+    price_min: float = 0,
+    price_max: float = 1000,
+    if_none_match: Optional[str] = Header(None)
+):
+    version = sweet_service.current_catalog_version()
+    etag = sweet_service.catalog_etag(version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    sweets = await sweet_service.search_sweets(name, category, price_min, price_max, version)
+
+    return FastJSONResponse(content=sweets, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+@router.get("/facets", response_model=CatalogFacets)
+async def get_facets():
+    return await sweet_service.get_facets()
+
+@router.get("/stream")
+async def stream_catalog_changes():
+    # Server-Sent Events: upsert/delete per change, or invalidate (refetch)
+    return StreamingResponse(
+        catalog_feed.events(settings.CATALOG_FEED_HEARTBEAT_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# 🛒 AUTHENTICATED ROUTES
+
+@router.post("/checkout", response_model=CheckoutResponse)
+async def checkout(order: CheckoutRequest, user=Depends(verify_user)):
+    result = await sweet_service.checkout(order.items)
+    if not result["success"]:
+        return JSONResponse(status_code=409, content=result)
+    return result
+
+@router.post("/{sweet_id}/hold", status_code=201, response_model=HoldResponse)
+async def hold_sweet(sweet_id: str, request: HoldRequest, user=Depends(verify_user)):
+    return await hold_service.create_hold(sweet_id, request.quantity, user["_id"])
+
+@router.post("/holds/{hold_id}/purchase", response_model=HoldResponse)
+async def purchase_hold(hold_id: str, user=Depends(verify_user)):
+    return await hold_service.close_hold(hold_id, user["_id"], purchased=True)
+
+@router.delete("/holds/{hold_id}", response_model=HoldResponse)
+async def release_hold(hold_id: str, user=Depends(verify_user)):
+    return await hold_service.close_hold(hold_id, user["_id"], purchased=False)
 
 # 🔒 ADMIN ROUTES
 
+@router.get("/export")
+async def export_sweets(format: str = "ndjson", admin=Depends(verify_admin)):
+    if format != "ndjson":
+        raise HTTPException(status_code=400, detail="Unsupported export format")
+    return StreamingResponse(sweet_service.export_sweets(), media_type="application/x-ndjson")
+
+@router.get("/cache-stats")
+async def cache_stats(admin=Depends(verify_admin)):
+    return {
+        "catalog": sweet_service.catalog_cache_stats(),
+        "principal": principal_cache.stats(),
+    }
+
 @router.post("/", status_code=201, response_model=SweetResponse)
 async def create_sweet(
     admin=Depends(verify_admin),
     sweet: SweetCreate = Body(...)
 ):
-    return await sweet_service.create_sweet(sweet)
+    return FastJSONResponse(status_code=201, content=await sweet_service.create_sweet(sweet))
+
+@router.post("/bulk", response_model=BulkResponse)
+async def bulk_create_sweets(payload: SweetBulkCreate, admin=Depends(verify_admin)):
+    return await sweet_service.bulk_create_sweets(payload.items)
+
+@router.patch("/bulk", response_model=BulkResponse)
+async def bulk_update_sweets(payload: SweetBulkUpdate, admin=Depends(verify_admin)):
+    return await sweet_service.bulk_update_sweets(payload.items)
+
+@router.delete("/bulk", response_model=BulkResponse)
+async def bulk_delete_sweets(payload: SweetBulkDelete, admin=Depends(verify_admin)):
+    return await sweet_service.bulk_delete_sweets(payload.ids)
 
 @router.put("/{sweet_id}", response_model=SweetResponse)
 async def update_sweet(sweet_id: str, data: SweetUpdate, admin=Depends(verify_admin)):
-    return await sweet_service.update_sweet(sweet_id, data)
+    return FastJSONResponse(content=await sweet_service.update_sweet(sweet_id, data))
 
 @router.delete("/{sweet_id}")
 async def delete_sweet(sweet_id: str, admin=Depends(verify_admin)):
@@ -64,4 +177,4 @@ async def delete_sweet(sweet_id: str, admin=Depends(verify_admin)):
 
 @router.patch("/{sweet_id}/restock", response_model=SweetResponse)
 async def restock_sweet(sweet_id: str, quantity: int, admin=Depends(verify_admin)):
-    return await sweet_service.restock_sweet(sweet_id, quantity)
\ No newline at end of file
+    return FastJSONResponse(content=await sweet_service.restock_sweet(sweet_id, quantity))
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from datetime import datetime
+from typing import List, Optional
 
 class SweetCreate(BaseModel):
     # Schema for creating a new sweet; all fields required
@@ -10,18 +11,91 @@ class SweetCreate(BaseModel):
 
 class SweetUpdate(BaseModel):
     # Schema for updating an existing sweet; all fields optional
-    name: Optional[str]
-    category: Optional[str]
-    price: Optional[float]
-    quantity: Optional[int]
+    name: Optional[str] = None
+    category: Optional[str] = None
+    price: Optional[float] = None
+    quantity: Optional[int] = None
 
 class SweetResponse(BaseModel):
     id: str = Field(..., alias="_id")  # Accepts _id but outputs as id
     name: str
     category: str
     price: float
-    quantity: int
+    quantity: int  # Available stock (units under active holds are not included)
+    held: int = 0  # Units reserved by active holds
 
     class Config:
         allow_population_by_field_name = True  # So you can use .dict(by_alias=True) later
         orm_mode = True  # Allow using "id" field name when returning responses
+
+class CategoryFacet(BaseModel):
+    category: str
+    count: int
+    in_stock: int  # Sweets with quantity > 0
+    out_of_stock: int
+    min_price: float
+    max_price: float
+    avg_price: float
+
+class CatalogFacets(BaseModel):
+    categories: List[CategoryFacet]  # Sorted by category name
+    total: int
+    in_stock: int
+    out_of_stock: int
+    min_price: Optional[float] = None  # None when the catalog is empty
+    max_price: Optional[float] = None
+
+class HoldRequest(BaseModel):
+    # Units of one sweet to reserve for a limited time
+    quantity: int = Field(..., gt=0)  # Quantity must be positive
+
+class HoldResponse(BaseModel):
+    hold_id: str
+    sweet_id: str
+    quantity: int
+    expires_at: datetime  # UTC; the units return to stock after this
+
+class CheckoutItem(BaseModel):
+    # One basket line: which sweet and how many to purchase
+    sweet_id: str
+    quantity: int = Field(..., gt=0)  # Quantity must be positive
+
+class CheckoutRequest(BaseModel):
+    # Schema for purchasing a whole basket in a single request
+    items: List[CheckoutItem]
+
+class CheckoutLineResult(BaseModel):
+    sweet_id: str
+    quantity: int
+    status: str  # ok, insufficient_stock, not_found or not_applied
+
+class CheckoutResponse(BaseModel):
+    success: bool  # True only when every line was purchased
+    lines: List[CheckoutLineResult]
+
+class SweetBulkCreate(BaseModel):
+    # Schema for creating many sweets in one request
+    items: List[SweetCreate]
+
+class SweetBulkUpdateItem(BaseModel):
+    sweet_id: str
+    data: SweetUpdate  # Only the fields provided are changed
+
+class SweetBulkUpdate(BaseModel):
+    # Schema for updating many sweets in one request
+    items: List[SweetBulkUpdateItem]
+
+class SweetBulkDelete(BaseModel):
+    # Schema for deleting many sweets in one request
+    ids: List[str]
+
+class BulkItemResult(BaseModel):
+    index: int  # Position of the item in the request
+    sweet_id: Optional[str] = None
+    status: str  # created, updated, deleted, not_found, invalid_id or error
+    detail: Optional[str] = None
+
+class BulkResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkItemResult]
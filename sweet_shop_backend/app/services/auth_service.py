@@ -1,23 +1,40 @@
 # app/services/auth_service.py
+import asyncio
 from fastapi import HTTPException
-from passlib.context import CryptContext
 from jose import jwt
 from datetime import datetime, timedelta
-from app.database import user_collection
+from app.repositories import REVOKE_ALL, DuplicateKeyError, revocation_repository, user_repository
 from app.config import settings
 from app.schemas.user_schema import UserCreate, UserLogin
+from app.utils.cache import invalidate_principal
+from app.utils.hash import (
+    calibrate_rounds, configure_hashing, hash_password, verify_and_update_password, verify_password
+)
+from app.utils.metrics import password_rehashed_total, password_task_duration_seconds
+from app.utils.password_pool import run_password_task
+from app.utils.revocation import token_revocations
 import uuid
 
-# Password hashing context using bcrypt
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Background task pulling revocations recorded by other workers (see start_revocation_sync)
+_revocation_sync_task: asyncio.Task = None
 
-def hash_password(password: str) -> str:
-    """Hash the plain password using bcrypt."""
-    return pwd_context.hash(password)
+# Pre-register bcrypt timing label sets (labelled by function name)
+for _task in (hash_password, verify_password, verify_and_update_password):
+    password_task_duration_seconds.labels(_task.__name__)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plain password against the hashed password."""
-    return pwd_context.verify(plain_password, hashed_password)
+def configure_password_hashing() -> int:
+    """
+    Fix the bcrypt cost on startup, before the password pool is used:
+    PASSWORD_HASH_ROUNDS if set, otherwise calibrated so a verification
+    takes about PASSWORD_HASH_TARGET_MS on this machine.
+    Returns the cost in use.
+    """
+    rounds = settings.PASSWORD_HASH_ROUNDS or calibrate_rounds(
+        settings.PASSWORD_HASH_TARGET_MS, settings.PASSWORD_HASH_MIN_ROUNDS, settings.PASSWORD_HASH_MAX_ROUNDS
+    )
+    configure_hashing(rounds)
+    print(f"Password hashing: bcrypt cost {rounds}")
+    return rounds
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """
@@ -32,6 +49,17 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
 
+def issue_token(user: dict) -> str:
+    """
+    Create an access token carrying the user's role and token version as
+    signed claims, so authorization needs no database lookup.
+    """
+    return create_access_token(data={
+        "sub": str(user["_id"]),
+        "role": user["role"],
+        "ver": user.get("token_version", 0),
+    })
+
 async def register_user(user_data: UserCreate):
     """
     Register a new user.
@@ -40,7 +68,7 @@ async def register_user(user_data: UserCreate):
     Returns access token on success.
     """
     # Check if user already exists
-    existing_user = await user_collection.find_one({"email": user_data.email})
+    existing_user = await user_repository.find_by_email(user_data.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
@@ -51,20 +79,24 @@ async def register_user(user_data: UserCreate):
     
     # Create user document with hashed password
     user_id = str(uuid.uuid4())
-    hashed_password = hash_password(user_data.password)
+    hashed_password = await run_password_task(hash_password, user_data.password)
     
     user_doc = {
         "_id": user_id,
         "email": user_data.email,
         "hashed_password": hashed_password,
-        "role": user_data.role
+        "role": user_data.role,
+        "token_version": 0
     }
     
-    # Insert user into DB
-    await user_collection.insert_one(user_doc)
+    # Insert user into DB; the unique email constraint settles concurrent registrations
+    try:
+        await user_repository.insert(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Generate access token for new user
-    access_token = create_access_token(data={"sub": user_id})
+    access_token = issue_token(user_doc)
     
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -75,38 +107,125 @@ async def login_user(user_data: UserLogin):
     Returns access token on success.
     """
     try:
-        user = await user_collection.find_one({"email": user_data.email})
+        user = await user_repository.find_by_email(user_data.email)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid credentials")
 
-        if not verify_password(user_data.password, user["hashed_password"]):
+        # One pool job verifies and, if the stored cost is below the current
+        # one, rehashes the password at the current cost
+        valid, new_hash = await run_password_task(
+            verify_and_update_password, user_data.password, user["hashed_password"]
+        )
+        if not valid:
             raise HTTPException(status_code=401, detail="Invalid credentials")
+        if new_hash:
+            await _store_rehash(user, new_hash)
 
-        access_token = create_access_token(data={"sub": str(user["_id"])})
+        access_token = issue_token(user)
         return {"access_token": access_token, "token_type": "bearer"}
 
+    except HTTPException:
+        # Invalid credentials (401) or a saturated password pool (503)
+        raise
     except Exception:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail="Login failed")
 
 
+async def _store_rehash(user: dict, new_hash: str):
+    """Save an upgraded hash; a failure only postpones the upgrade to the next login."""
+    try:
+        if await user_repository.replace_password_hash(user["_id"], user["hashed_password"], new_hash):
+            password_rehashed_total.inc()
+    except Exception as exc:
+        print(f"Password rehash not stored for {user['_id']}: {exc}")
+
+async def revoke_tokens(user_id: str, version: int):
+    """
+    Reject the user's tokens older than token version `version`.
+    Applied to this worker immediately and recorded for the others, which
+    pick it up within REVOCATION_SYNC_INTERVAL_SECONDS.
+    """
+    revoked_at = datetime.utcnow()
+    token_revocations.revoke(user_id, version, revoked_at)
+    await revocation_repository.record(user_id, version, revoked_at)
+
+async def set_user_role(user_id: str, role: str):
+    """
+    Change a user's role.
+    Bumps the user's token version and revokes their older tokens, so a
+    token carrying the old role stops working; the user logs in again to
+    get one with the new role. Raises 404 if the user does not exist.
+    """
+    version = await user_repository.set_role(user_id, role)
+    invalidate_principal(user_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    await revoke_tokens(user_id, version)
+
+async def delete_user(user_id: str):
+    """
+    Delete a user, revoke all their tokens and drop them from the principal cache.
+    Raises 404 if the user does not exist.
+    """
+    deleted = await user_repository.delete(user_id)
+    invalidate_principal(user_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="User not found")
+    await revoke_tokens(user_id, REVOKE_ALL)
+
+
+async def sync_revocations():
+    """Merge revocations recorded by any worker within the token lifetime."""
+    token_revocations.merge(await revocation_repository.active(token_revocations.window_start()))
+
+async def _run_revocation_sync():
+    while True:
+        try:
+            await sync_revocations()
+        except Exception as exc:
+            print(f"Revocation sync failed: {exc}")
+        await asyncio.sleep(settings.REVOCATION_SYNC_INTERVAL_SECONDS)
+
+def start_revocation_sync():
+    """Start the background revocation sync; called on application startup."""
+    global _revocation_sync_task
+    if _revocation_sync_task is None:
+        _revocation_sync_task = asyncio.create_task(_run_revocation_sync())
+
+async def stop_revocation_sync():
+    """Cancel the background revocation sync; called on application shutdown."""
+    global _revocation_sync_task
+    if _revocation_sync_task is not None:
+        _revocation_sync_task.cancel()
+        try:
+            await _revocation_sync_task
+        except asyncio.CancelledError:
+            pass
+        _revocation_sync_task = None
+
+
 async def seed_admin():
     """
     Seed the default admin user if not exists.
     Uses admin email and password from settings.
     """
-    existing_admin = await user_collection.find_one({"email": settings.ADMIN_EMAIL})
+    existing_admin = await user_repository.find_by_email(settings.ADMIN_EMAIL)
     if not existing_admin:
         admin_id = str(uuid.uuid4())
-        hashed_password = hash_password(settings.ADMIN_PASSWORD)
+        hashed_password = await run_password_task(hash_password, settings.ADMIN_PASSWORD)
         
         admin_doc = {
             "_id": admin_id,
             "email": settings.ADMIN_EMAIL,
             "hashed_password": hashed_password,
-            "role": "admin"
+            "role": "admin",
+            "token_version": 0
         }
         
-        await user_collection.insert_one(admin_doc)
+        try:
+            await user_repository.insert(admin_doc)
+        except DuplicateKeyError:
+            return  # Seeded concurrently by another worker
         print(f"Admin user created with email: {settings.ADMIN_EMAIL}")
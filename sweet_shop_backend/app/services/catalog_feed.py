@@ -0,0 +1,162 @@
+# app/services/catalog_feed.py
+import asyncio
+from typing import Optional, Set
+from app.config import settings
+from app.repositories import ChangeStreamUnsupported, SweetRepository, sweet_repository
+from app.services import sweet_service
+from app.utils.serialization import dumps
+
+# Change stream operations that carry the new document
+UPSERT_OPERATIONS = {"insert", "update", "replace"}
+
+
+def changed_categories(change: dict) -> Optional[Set[str]]:
+    """
+    Categories whose facets a change event can affect, or None when the
+    event does not tell: a delete, replace or category update without a
+    pre-image, or an event that is not about one sweet.
+    """
+    before, after = change.get("before"), change["document"]
+    if change["op"] not in UPSERT_OPERATIONS and change["op"] != "delete":
+        return None
+    if before is not None:
+        return {doc["category"] for doc in (before, after) if doc}
+    if after is None:
+        return None
+    if change["op"] == "insert" or (change["op"] == "update" and "category" not in change.get("updated_fields", ())):
+        return {after["category"]}
+    return None
+
+
+class CatalogFeed:
+    """
+    Keeps this worker's catalog cache in step with writes made by other
+    workers, and fans catalog changes out to live clients (SSE).
+
+    On a replica set it tails the sweets change stream: every change clears
+    the local cache, marks the facets of the categories it touched for
+    re-aggregation, and is pushed to clients as an upsert/delete event.
+    Bumps of the shared catalog version that every write makes (see
+    sweet_service.catalog_changed) come through the same stream and move
+    this worker's ETag. Where change streams are unavailable (standalone
+    mongod, in-memory engine) it polls that version instead; clients then
+    get an "invalidate" event and refetch.
+    """
+
+    def __init__(self, repository: SweetRepository, poll_interval: float, queue_size: int):
+        self.repository = repository
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.mode: Optional[str] = None  # "change_stream" or "polling" once started
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._resume_token = None
+        self._seen_local = sweet_service.catalog_version()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- clients -----------------------------------------------------------
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: dict):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Slow client: replace its backlog with one refetch instruction
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "invalidate"})
+
+    async def events(self, heartbeat: float):
+        """Server-Sent Events for one client, with keep-alive comments."""
+        queue = self.subscribe()
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield b"event: " + event["type"].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+    # --- sources -----------------------------------------------------------
+
+    def _remote_change(self, categories: Optional[Set[str]] = None):
+        """Drop cached reads and affected facets after a change made elsewhere (None = any category)."""
+        sweet_service.sweets_changed_elsewhere(categories)
+        self._seen_local = sweet_service.catalog_version()
+
+    async def follow_changes(self):
+        """Apply and publish change stream events until the stream ends."""
+        async for change in self.repository.watch(self._resume_token):
+            self.mode = "change_stream"
+            self._resume_token = change["resume_token"]
+            if change["op"] == "version":  # Some worker published its writes: move the ETag
+                sweet_service.shared_catalog_version_seen(change["version"])
+                continue
+            self._remote_change(changed_categories(change))
+            if change["op"] in UPSERT_OPERATIONS and change["document"]:
+                self.publish({"type": "upsert", "sweet": sweet_service.obj_to_dict(change["document"])})
+            elif change["op"] == "delete":
+                self.publish({"type": "delete", "sweet_id": str(change["_id"])})
+            else:  # drop, rename, invalidate, or an update whose document is already gone
+                self.publish({"type": "invalidate"})
+
+    async def poll_once(self):
+        """Pick up other workers' writes from the shared version, and tell clients about any change."""
+        current = await self.repository.get_catalog_version()
+        if current != sweet_service.shared_catalog_version():
+            sweet_service.sweets_changed_elsewhere(None, shared_version=current)
+        elif sweet_service.catalog_version() == self._seen_local:
+            return
+        self._seen_local = sweet_service.catalog_version()
+        self.publish({"type": "invalidate", "version": current})
+
+    async def run(self):
+        while True:
+            try:
+                await self.follow_changes()
+            except ChangeStreamUnsupported:
+                break
+            except Exception as exc:  # Connection lost: resume from the last token
+                print(f"Catalog change stream interrupted: {exc}")
+                self._remote_change()  # Changes may have been missed meanwhile
+                self.publish({"type": "invalidate"})
+                await asyncio.sleep(self.poll_interval)
+
+        self.mode = "polling"
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll_once()
+            except Exception as exc:
+                print(f"Catalog version poll failed: {exc}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+catalog_feed = CatalogFeed(
+    sweet_repository,
+    poll_interval=settings.CATALOG_FEED_POLL_INTERVAL_SECONDS,
+    queue_size=settings.CATALOG_FEED_QUEUE_SIZE,
+)
@@ -0,0 +1,142 @@
+# app/services/facet_service.py
+from typing import Iterable, Optional
+from app.repositories import SweetRepository, sweet_repository
+
+
+class FacetSummary:
+    """
+    Per-category catalog statistics kept in memory and updated on each
+    single-sweet write, so reading facets costs O(categories).
+
+    Counts and price sums are maintained exactly. Removing a category's
+    cheapest or dearest sweet (or changing its price) makes the min/max
+    unknown; that category is then re-aggregated on the next read, as are
+    categories changed by other workers (see invalidate_categories) and
+    those of sweets written without reporting their documents (bulk,
+    checkout, holds; see invalidate_sweets). Only a change of unknown
+    extent marks the whole summary stale, to be rebuilt from one storage
+    aggregation.
+    """
+
+    def __init__(self, repository: SweetRepository):
+        self.repository = repository
+        self._categories = {}  # category -> {count, in_stock, price_sum, min_price, max_price}
+        self._stale = True     # Needs a rebuild before the next read
+        self._stale_categories = set()  # Need re-aggregating before the next read
+        self._stale_sweets = set()      # Their categories need re-aggregating (looked up on the next read)
+        self._version = 0      # Bumped on every change, to detect writes during a rebuild
+
+    def invalidate(self):
+        self._stale = True
+        self._version += 1
+
+    def invalidate_categories(self, categories: Iterable[str]):
+        """Re-aggregate only these categories on the next read (sweets in them changed elsewhere)."""
+        self._version += 1
+        if not self._stale:
+            self._stale_categories.update(categories)
+
+    def invalidate_sweets(self, sweet_ids: Iterable):
+        """Re-aggregate the categories of these sweets on the next read (their stock changed in bulk)."""
+        self._version += 1
+        if not self._stale:
+            self._stale_sweets.update(sweet_ids)
+
+    def _add(self, doc: dict):
+        stats = self._categories.setdefault(doc["category"], {
+            "count": 0, "in_stock": 0, "price_sum": 0.0, "min_price": doc["price"], "max_price": doc["price"],
+        })
+        stats["count"] += 1
+        stats["in_stock"] += doc.get("quantity", 0) > 0
+        stats["price_sum"] += doc["price"]
+        stats["min_price"] = min(stats["min_price"], doc["price"])
+        stats["max_price"] = max(stats["max_price"], doc["price"])
+
+    def _remove(self, doc: dict):
+        stats = self._categories.get(doc["category"])
+        if stats is None:
+            self._stale_categories.add(doc["category"])
+            return
+        stats["count"] -= 1
+        stats["in_stock"] -= doc.get("quantity", 0) > 0
+        stats["price_sum"] -= doc["price"]
+        if stats["count"] == 0:
+            del self._categories[doc["category"]]
+        elif doc["price"] in (stats["min_price"], stats["max_price"]):
+            self._stale_categories.add(doc["category"])  # The new extreme is not known without a rescan
+
+    def apply(self, before: Optional[dict], after: Optional[dict]):
+        """Account for one sweet changing from before to after (None = absent)."""
+        self._version += 1
+        if self._stale:
+            return  # Rebuilt on the next read anyway
+        if before and before.get("_id") in self._stale_sweets:
+            # Its category may change before the lookup: refresh the old one too
+            self._stale_categories.add(before["category"])
+        if before and after and before["category"] == after["category"] and before["price"] == after["price"]:
+            # Stock-only change (e.g. restock): extremes are unaffected
+            stats = self._categories.get(after["category"])
+            if stats is None:
+                self._stale_categories.add(after["category"])
+            else:
+                stats["in_stock"] += (after.get("quantity", 0) > 0) - (before.get("quantity", 0) > 0)
+            return
+        if before:
+            self._remove(before)
+        if after:
+            self._add(after)
+
+    async def _rebuild(self):
+        version = self._version
+        self._stale_categories.clear()
+        self._stale_sweets.clear()
+        groups = await self.repository.facet_stats()
+        self._categories = {group.pop("category"): group for group in groups}
+        # A write that raced with the aggregation may or may not be included
+        self._stale = version != self._version
+
+    async def _refresh(self, categories: set):
+        version = self._version
+        self._stale_categories -= categories
+        groups = await self.repository.facet_stats(sorted(categories))
+        for category in categories:
+            self._categories.pop(category, None)
+        self._categories.update((group.pop("category"), group) for group in groups)
+        if version != self._version:
+            self._stale_categories |= categories
+
+    async def facets(self) -> dict:
+        """Facets per category plus catalog-wide totals."""
+        if self._stale:
+            await self._rebuild()
+        else:
+            if self._stale_sweets:
+                sweet_ids = set(self._stale_sweets)
+                categories = await self.repository.categories_of(list(sweet_ids))
+                self._stale_sweets -= sweet_ids
+                self._stale_categories.update(categories.values())
+            if self._stale_categories:
+                await self._refresh(set(self._stale_categories))
+        categories = [
+            {
+                "category": category,
+                "count": stats["count"],
+                "in_stock": stats["in_stock"],
+                "out_of_stock": stats["count"] - stats["in_stock"],
+                "min_price": stats["min_price"],
+                "max_price": stats["max_price"],
+                "avg_price": round(stats["price_sum"] / stats["count"], 2),
+            }
+            for category, stats in sorted(self._categories.items())
+        ]
+        return {
+            "categories": categories,
+            "total": sum(c["count"] for c in categories),
+            "in_stock": sum(c["in_stock"] for c in categories),
+            "out_of_stock": sum(c["out_of_stock"] for c in categories),
+            "min_price": min((c["min_price"] for c in categories), default=None),
+            "max_price": max((c["max_price"] for c in categories), default=None),
+        }
+
+
+facet_summary = FacetSummary(sweet_repository)
@@ -0,0 +1,100 @@
+# app/services/hold_service.py
+import asyncio
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from app.config import settings
+from app.repositories import hold_repository
+from app.services.sweet_service import catalog_changed
+from bson import ObjectId
+
+# Background task returning expired holds to stock (see start_hold_reaper)
+_reaper_task: asyncio.Task = None
+
+
+def hold_to_dict(hold: dict) -> dict:
+    return {
+        "hold_id": str(hold["_id"]),
+        "sweet_id": str(hold["sweet_id"]),
+        "quantity": hold["quantity"],
+        "expires_at": hold["expires_at"],
+    }
+
+
+async def create_hold(sweet_id: str, quantity: int, user_id: str):
+    """
+    Reserve stock of one sweet for HOLD_TTL_SECONDS.
+    Raise 404 if the sweet does not exist, 409 if not enough is available.
+    """
+    if not ObjectId.is_valid(sweet_id):
+        raise HTTPException(status_code=404, detail="Sweet not found")
+
+    hold = {
+        "_id": ObjectId(),
+        "sweet_id": ObjectId(sweet_id),
+        "user_id": user_id,
+        "quantity": quantity,
+        "expires_at": datetime.utcnow() + timedelta(seconds=settings.HOLD_TTL_SECONDS),
+    }
+    status = await hold_repository.create(hold)
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Sweet not found")
+    if status == "insufficient_stock":
+        raise HTTPException(status_code=409, detail="Not enough stock available")
+    await catalog_changed([hold["sweet_id"]])
+    return hold_to_dict(hold)
+
+
+async def close_hold(hold_id: str, user_id: str, purchased: bool):
+    """
+    Purchase (purchased=True) or release one of the user's active holds.
+    Raise 404 if the hold does not exist, belongs to someone else or expired.
+    """
+    hold = None
+    if ObjectId.is_valid(hold_id):
+        hold = await hold_repository.close(ObjectId(hold_id), user_id, datetime.utcnow(), purchased)
+    if not hold:
+        raise HTTPException(status_code=404, detail="Hold not found or expired")
+    await catalog_changed([hold["sweet_id"]])
+    return hold_to_dict(hold)
+
+
+async def reap_expired_holds(now: datetime = None) -> int:
+    """Return all holds expired at `now` (default: current UTC time) to stock, batch by batch."""
+    now = now or datetime.utcnow()
+    sweet_ids = []
+    while True:
+        reaped = await hold_repository.reap(now, settings.HOLD_REAPER_BATCH_SIZE)
+        sweet_ids.extend(reaped)
+        if len(reaped) < settings.HOLD_REAPER_BATCH_SIZE:
+            break
+    if sweet_ids:
+        await catalog_changed(set(sweet_ids))
+    return len(sweet_ids)
+
+
+async def _run_reaper():
+    while True:
+        try:
+            await reap_expired_holds()
+        except Exception as exc:  # Keep reaping after transient storage errors
+            print(f"Hold reaper failed: {exc}")
+        await asyncio.sleep(settings.HOLD_REAPER_INTERVAL_SECONDS)
+
+
+def start_hold_reaper():
+    """Start the background reaper; called on application startup."""
+    global _reaper_task
+    if _reaper_task is None:
+        _reaper_task = asyncio.create_task(_run_reaper())
+
+
+async def stop_hold_reaper():
+    """Cancel the background reaper; called on application shutdown."""
+    global _reaper_task
+    if _reaper_task is not None:
+        _reaper_task.cancel()
+        try:
+            await _reaper_task
+        except asyncio.CancelledError:
+            pass
+        _reaper_task = None
@@ -0,0 +1,26 @@
+# app/services/index_service.py
+from app.repositories import (
+    hold_repository, rate_limit_repository, revocation_repository, sweet_repository, user_repository
+)
+
+
+async def provision_indexes() -> dict:
+    """
+    Ensure every index the app relies on exists, then backfill derived
+    search fields on sweets. Safe to run on every startup.
+    Returns a per-collection report of created/existing/failed indexes.
+    """
+    report = {
+        "users": await user_repository.ensure_indexes(),
+        "sweets": await sweet_repository.ensure_indexes(),
+        "holds": await hold_repository.ensure_indexes(),
+        "revocations": await revocation_repository.ensure_indexes(),
+        "rate_limits": await rate_limit_repository.ensure_indexes(),
+    }
+    await sweet_repository.backfill_search_fields()
+    for collection, result in report.items():
+        print(
+            f"Indexes on {collection}: created={result['created']} "
+            f"existing={result['existing']} failed={result['failed']}"
+        )
+    return report
@@ -0,0 +1,141 @@
+# app/services/inventory_buffer.py
+import asyncio
+from collections import Counter
+from typing import Dict, Iterable, Optional
+from bson import ObjectId
+from app.repositories.base import SweetRepository
+
+# Rounds of leasing a basket may need when concurrent sales keep using up
+# the allotment it waited for; after that it is reported as out of stock
+TAKE_ATTEMPTS = 3
+
+
+class InventoryBuffer:
+    """
+    Write-behind quantity counter for hot sweets.
+
+    Restocks accumulate in memory and are written as one $inc per sweet on
+    flush. Sales are served from a local allotment: units taken out of the
+    database with the usual guarded decrement, lease_size at a time (or
+    straight from pending restocks, with no database call at all). A sale
+    only succeeds against units this process already owns, so the stored
+    quantity can never go negative, even with many workers.
+
+    flush() writes pending restocks and returns unsold allotments, after
+    which the stored quantity is exact again. Between flushes it is low by
+    at most the units buffered in each process (see buffered()).
+    """
+
+    def __init__(self, repository: SweetRepository, lease_size: int, flush_threshold: int, on_flush=None):
+        self.repository = repository
+        self.lease_size = lease_size
+        self.flush_threshold = flush_threshold
+        self.on_flush = on_flush        # Awaited with the flushed sweet IDs after a flush that wrote something
+        self._restocks = Counter()      # Units added locally, not yet written
+        self._allotments = Counter()    # Units taken from the database, not yet sold
+        self._operations = 0            # Buffered operations since the last flush
+        self._lease_locks = {}          # sweet_id -> asyncio.Lock: one lease in flight per sweet
+        self._flushing: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()  # A flush returns only after earlier ones are stored
+
+    def buffered(self, sweet_id: ObjectId) -> int:
+        """Units of sweet_id held in this buffer (missing from the stored quantity)."""
+        return self._restocks[sweet_id] + self._allotments[sweet_id]
+
+    def _count_operation(self):
+        self._operations += 1
+        if self._operations >= self.flush_threshold and (self._flushing is None or self._flushing.done()):
+            self._flushing = asyncio.create_task(self.flush())
+
+    def restock(self, sweet_id: ObjectId, quantity: int):
+        self._restocks[sweet_id] += quantity
+        self._count_operation()
+
+    async def _ensure(self, sweet_id: ObjectId, quantity: int) -> str:
+        """Grow the allotment of sweet_id to at least quantity units."""
+        if quantity <= self._allotments[sweet_id]:
+            return "ok"
+        # Concurrent sales wait for one lease instead of each taking their own
+        lock = self._lease_locks.setdefault(sweet_id, asyncio.Lock())
+        async with lock:
+            return await self._refill(sweet_id, quantity)
+
+    async def _refill(self, sweet_id: ObjectId, quantity: int) -> str:
+        shortfall = quantity - self._allotments[sweet_id]
+        if shortfall <= 0:
+            return "ok"
+        local = min(shortfall, self._restocks[sweet_id])
+        if local > 0:
+            self._restocks[sweet_id] -= local
+            self._allotments[sweet_id] += local
+            shortfall -= local
+            if shortfall == 0:
+                return "ok"
+        # Lease a chunk ahead; near the end of stock take only what is needed
+        for amount in (shortfall + self.lease_size, shortfall):
+            if await self.repository.decrement_quantity(sweet_id, amount) is not None:
+                self._allotments[sweet_id] += amount
+                return "ok"
+        return "insufficient_stock" if await self.repository.get(sweet_id) else "not_found"
+
+    async def take(self, basket: Dict[ObjectId, int]) -> Dict[ObjectId, str]:
+        """
+        Sell a basket all-or-nothing from local allotments.
+        Returns the same statuses as SweetRepository.decrement_basket.
+        """
+        for _ in range(TAKE_ATTEMPTS):
+            statuses = {}
+            for sweet_id, quantity in basket.items():
+                statuses[sweet_id] = await self._ensure(sweet_id, quantity)
+            if any(status != "ok" for status in statuses.values()):
+                return {sweet_id: "not_applied" if status == "ok" else status for sweet_id, status in statuses.items()}
+
+            # Other sales may have used the allotment while we awaited a lease
+            if all(self._allotments[sweet_id] >= quantity for sweet_id, quantity in basket.items()):
+                for sweet_id, quantity in basket.items():
+                    self._allotments[sweet_id] -= quantity
+                self._count_operation()
+                return statuses
+        return {
+            sweet_id: "insufficient_stock" if self._allotments[sweet_id] < quantity else "not_applied"
+            for sweet_id, quantity in basket.items()
+        }
+
+    async def discard(self, sweet_ids: Iterable[ObjectId]):
+        """
+        Forget pending restocks and unsold allotments of sweet_ids. Called
+        before their stored quantity is overwritten or the sweets deleted:
+        a later flush would otherwise add the units on top of the new value.
+        Waits for a flush in progress, so none of its writes land afterwards.
+        """
+        async with self._flush_lock:
+            for sweet_id in sweet_ids:
+                self._restocks.pop(sweet_id, None)
+                self._allotments.pop(sweet_id, None)
+
+    async def flush(self):
+        """Write pending restocks and unsold allotments back as one batched $inc."""
+        async with self._flush_lock:
+            await self._write_back()
+
+    async def _write_back(self):
+        deltas = {
+            sweet_id: delta for sweet_id, delta in (self._restocks + self._allotments).items() if delta
+        }
+        self._restocks.clear()
+        self._allotments.clear()
+        self._operations = 0
+        if not deltas:
+            return
+        try:
+            errors = await self.repository.bulk_increment(deltas)
+        except Exception:
+            self._restocks.update(deltas)  # Keep the units; retried on the next flush
+            raise
+        failed = [sweet_id for index, sweet_id in enumerate(deltas) if index in errors]
+        if failed:
+            # Retried on the next flush, unless the sweet is gone for good
+            for sweet_id in await self.repository.existing_ids(failed):
+                self._restocks[sweet_id] += deltas[sweet_id]
+        if self.on_flush:
+            await self.on_flush(list(deltas))
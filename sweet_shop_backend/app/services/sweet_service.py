@@ -1,51 +1,347 @@
 # app/services/sweet_service.py
+import asyncio
+from typing import Iterable, List, Optional
 from fastapi import HTTPException
-from app.database import sweet_collection
-from app.schemas.sweet_schema import SweetCreate, SweetUpdate, SweetResponse
+from app.config import settings
+from app.repositories import hold_repository, sweet_repository
+from app.services.facet_service import facet_summary
+from app.services.inventory_buffer import InventoryBuffer
+from app.schemas.sweet_schema import SweetCreate, SweetUpdate, CheckoutItem, SweetBulkUpdateItem
+from app.utils.cache import TTLCache
+from app.utils.serialization import dumps
 from bson import ObjectId
 
+# Read-through cache of list/search results. Cached values are shared
+# between requests and must be treated as read-only.
+catalog_cache = TTLCache(
+    max_size=settings.CATALOG_CACHE_MAX_SIZE,
+    ttl_seconds=settings.CATALOG_CACHE_TTL_SECONDS,
+)
+
+# Bumped by every catalog change this worker sees (drives the change feed)
+_catalog_version = 0
+
+# Last value of the shared catalog version (the repository counter that every
+# worker's writes bump) whose changes this worker's facets already include
+_shared_version = 0
+
+# Shared catalog version this worker tags catalog reads with. Kept in memory,
+# so conditional requests never touch storage: moved by this worker's own
+# writes and by the catalog feed when other workers write (see catalog_feed)
+_etag_version = 0
+
+def _bump_catalog_version():
+    global _catalog_version
+    _catalog_version += 1
+    catalog_cache.clear()
+
+# Bumps of the shared version are serialized per worker: writes stored while
+# one is in flight queue here and share the next one (see _publish_write)
+_publishing = False
+_publish_queue: List[asyncio.Future] = []
+
+async def _bump_shared_version():
+    global _shared_version, _etag_version
+    try:
+        before = await sweet_repository.bump_catalog_version()
+    except Exception as exc:  # The write itself is stored; only the tag lags
+        print(f"Catalog version bump failed: {exc}")
+        return
+    _etag_version = max(_etag_version, before + 1)
+    if before == _shared_version:
+        _shared_version = before + 1  # No other worker wrote in between
+
+def _pass_publishing_turn():
+    """Let the first queued write run the next bump, or mark publishing idle."""
+    global _publishing
+    while _publish_queue:
+        turn = _publish_queue.pop(0)
+        if not turn.done():
+            turn.set_result(True)
+            return
+    _publishing = False
+
+async def _publish_write():
+    """
+    Bump the shared catalog version after a stored write, which moves this
+    worker's ETag and, via their feeds, everyone else's.
+
+    At most one bump per worker is in flight. One that started before this
+    write was stored does not cover it, so the write waits for the next
+    bump, which covers every write queued meanwhile: a burst of N writes
+    costs two bumps of the shared document instead of N.
+    """
+    global _publishing
+    if _publishing:
+        turn = asyncio.get_running_loop().create_future()
+        _publish_queue.append(turn)
+        try:
+            if not await turn:
+                return  # Covered by a bump that started after this write was stored
+        except asyncio.CancelledError:
+            if turn.done() and not turn.cancelled() and turn.result():
+                _pass_publishing_turn()
+            raise
+    _publishing = True
+    covered = list(_publish_queue)
+    _publish_queue.clear()
+    try:
+        await _bump_shared_version()
+    finally:
+        for turn in covered:
+            if not turn.done():
+                turn.set_result(False)
+        _pass_publishing_turn()
+
+async def catalog_changed(sweet_ids: Iterable[ObjectId] = (), categories: Iterable[str] = ()):
+    """
+    Record a write to many sweets: bump the versions, drop cached reads and
+    re-aggregate the facets of the given categories and of the categories
+    the given sweets are in.
+    """
+    _bump_catalog_version()
+    facet_summary.invalidate_categories(categories)
+    facet_summary.invalidate_sweets(sweet_ids)
+    await _publish_write()
+
+async def sweet_changed(before: Optional[dict], after: Optional[dict]):
+    """Record a write to one sweet whose old/new documents are known: facets update in place."""
+    _bump_catalog_version()
+    facet_summary.apply(before, after)
+    await _publish_write()
+
+def sweets_changed_elsewhere(categories: Optional[Iterable[str]], shared_version: Optional[int] = None):
+    """
+    Record writes made by another process to sweets in categories: drop cached
+    reads and re-aggregate only those facets (None = categories unknown, rebuild all).
+    shared_version is the shared catalog version that includes them, if known.
+    """
+    global _shared_version
+    _bump_catalog_version()
+    if shared_version is not None:
+        _shared_version = shared_version
+        shared_catalog_version_seen(shared_version)
+    if categories is None:
+        facet_summary.invalidate()
+    else:
+        facet_summary.invalidate_categories(categories)
+
+def shared_catalog_version_seen(version: int):
+    """Tag catalog reads with a shared catalog version the feed reported (ignored if older than the current tag)."""
+    global _etag_version
+    _etag_version = max(_etag_version, version)
+
+def catalog_version() -> int:
+    """Number of catalog changes this worker has seen (its own writes and remote ones)."""
+    return _catalog_version
+
+def shared_catalog_version() -> int:
+    """Last shared catalog version this worker has caught up with."""
+    return _shared_version
+
+def current_catalog_version() -> int:
+    """
+    Shared catalog version to tag catalog reads with, from memory. Take it
+    before reading: the rows read afterwards are at least as new (see
+    SweetRepository.consistent_reads), never older than the tag.
+    """
+    return _etag_version
+
+def catalog_etag(version: int) -> str:
+    """Strong ETag for a shared catalog version, the same on every worker, e.g. "catalog-42"."""
+    return f'"catalog-{version}"'
+
+def catalog_cache_stats() -> dict:
+    """Hit/miss counters and size of the catalog cache."""
+    return catalog_cache.stats()
+
+# Optional write-behind quantity counter for hot sweets (INVENTORY_BUFFER_ENABLED)
+inventory_buffer = InventoryBuffer(
+    sweet_repository,
+    lease_size=settings.INVENTORY_LEASE_SIZE,
+    flush_threshold=settings.INVENTORY_FLUSH_THRESHOLD,
+    on_flush=catalog_changed,
+) if settings.INVENTORY_BUFFER_ENABLED else None
+
+_flusher_task: asyncio.Task = None
+
+async def _run_flusher():
+    while True:
+        await asyncio.sleep(settings.INVENTORY_FLUSH_INTERVAL_SECONDS)
+        try:
+            await inventory_buffer.flush()
+        except Exception as exc:  # Units stay buffered and are retried
+            print(f"Inventory flush failed: {exc}")
+
+def start_inventory_flusher():
+    """Start periodic flushing of the inventory buffer, if enabled; called on startup."""
+    global _flusher_task
+    if inventory_buffer is not None and _flusher_task is None:
+        _flusher_task = asyncio.create_task(_run_flusher())
+
+async def stop_inventory_flusher():
+    """Stop the flusher and write out everything still buffered; called on shutdown."""
+    global _flusher_task
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        try:
+            await _flusher_task
+        except asyncio.CancelledError:
+            pass
+        _flusher_task = None
+    if inventory_buffer is not None:
+        await inventory_buffer.flush()
+
+# Lowercased copies of searchable fields, maintained on every write
+SEARCH_FIELDS = {"name": "name_lower", "category": "category_lower"}
+# Bookkeeping of the Mongo hold reaper (see MongoHoldRepository.reap)
+INTERNAL_FIELDS = (*SEARCH_FIELDS.values(), "returned_holds")
+
 def obj_to_dict(sweet) -> dict:
     sweet["_id"] = str(sweet["_id"])  # Just convert ObjectId to string
+    for internal_field in INTERNAL_FIELDS:
+        sweet.pop(internal_field, None)  # Internal fields are not part of the API
     return sweet
 
+def with_search_fields(fields: dict) -> dict:
+    """Add normalized lowercase search fields for any name/category being written."""
+    for field, search_field in SEARCH_FIELDS.items():
+        if isinstance(fields.get(field), str):
+            fields[search_field] = fields[field].lower()
+    return fields
+
 
 async def create_sweet(data: SweetCreate):
-    sweet_dict = data.dict()
-    result = await sweet_collection.insert_one(sweet_dict)
-    sweet = await sweet_collection.find_one({"_id": result.inserted_id})
-    sweet = obj_to_dict(sweet)  # This must return _id (as string), not id
-    return SweetResponse(**sweet)
+    sweet_dict = with_search_fields({"_id": ObjectId(), **data.dict(), "held": 0})
+    await sweet_repository.insert(sweet_dict)
+    await sweet_changed(None, sweet_dict)
+    # Built locally: no read-back. Already API-shaped (_id as string), so
+    # routes serialize it directly instead of re-validating a SweetResponse
+    return obj_to_dict(sweet_dict)
+
+# Fields a client may request through the catalog "fields" projection
+PROJECTABLE_FIELDS = {"name", "category", "price", "quantity", "held"}
 
-async def get_all_sweets():
+def build_projection(fields: Optional[str]) -> Optional[dict]:
     """
-    Retrieve all sweets from the collection.
+    Turn a comma-separated field list into a projection ({field: 1}).
+    _id is always returned. Raises 400 for unknown fields.
     """
-    sweets = []
-    async for sweet in sweet_collection.find():
-        sweets.append(obj_to_dict(sweet))
-    return sweets
+    if not fields:
+        return None
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = set(requested) - PROJECTABLE_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return {field: 1 for field in requested}
 
-async def search_sweets(name: str = "", category: str = "", price_min: float = 0, price_max: float = 1e6):
+async def get_all_sweets(limit: int = 100, after: Optional[str] = None, fields: Optional[str] = None,
+                         version: Optional[int] = None):
     """
-    Search sweets based on name, category, and price range.
+    Retrieve one page of sweets ordered by _id (keyset pagination).
+    Pass the previous page's next_cursor as `after` to continue, and the
+    catalog version the response is tagged with (current_catalog_version()).
+    Returns the page items, the cursor for the next page (None on the
+    last page) and the estimated total size of the catalog.
     """
-    query = {
-        "name": {"$regex": name, "$options": "i"},
-        "category": {"$regex": category, "$options": "i"},
-        "price": {"$gte": price_min, "$lte": price_max}
+    if after and not ObjectId.is_valid(after):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    projection = build_projection(fields)
+
+    if version is None:
+        version = current_catalog_version()
+    # Keyed by the shared version: a write by any worker makes old entries unreachable
+    cache_key = ("list", version, limit, after, fields)
+    page = catalog_cache.get(cache_key)
+    if page is not None:
+        return page
+
+    # Fetch one extra row to know whether another page exists
+    async with sweet_repository.consistent_reads():
+        docs, total = await asyncio.gather(
+            sweet_repository.list_page(ObjectId(after) if after else None, limit + 1, projection),
+            sweet_repository.estimated_count()
+        )
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = str(docs[-1]["_id"])
+    page = {
+        "items": [obj_to_dict(sweet) for sweet in docs],
+        "next_cursor": next_cursor,
+        "total": total,
     }
-    cursor = sweet_collection.find(query)
-    return [obj_to_dict(s) async for s in cursor]
+    catalog_cache.set(cache_key, page)
+    return page
+
+async def iter_ndjson(docs, rows_per_chunk: int):
+    """
+    Serialize an async iterable of sweet documents as NDJSON.
+    Rows are grouped into chunks of rows_per_chunk lines, so memory use
+    depends on the chunk size, not on how many documents there are.
+    """
+    buffer = []
+    async for doc in docs:
+        buffer.append(dumps(obj_to_dict(doc)))
+        if len(buffer) >= rows_per_chunk:
+            yield b"\n".join(buffer) + b"\n"
+            buffer = []
+    if buffer:
+        yield b"\n".join(buffer) + b"\n"
+
+def export_sweets():
+    """
+    Stream the whole catalog as NDJSON chunks.
+    The storage cursor fetches EXPORT_BATCH_SIZE documents per round trip.
+    """
+    batch_size = settings.EXPORT_BATCH_SIZE
+    return iter_ndjson(sweet_repository.iter_all(batch_size), batch_size)
+
+async def get_facets():
+    """Category counts, stock and price statistics (see FacetSummary)."""
+    return await facet_summary.facets()
+
+async def search_sweets(name: str = "", category: str = "", price_min: float = 0, price_max: float = 1e6,
+                        version: Optional[int] = None):
+    """
+    Search sweets based on name, category, and price range.
+    Name and category are case-insensitive prefix matches; empty ones match all.
+    version is the shared catalog version, as for get_all_sweets.
+    """
+    if version is None:
+        version = current_catalog_version()
+    cache_key = ("search", version, name.lower(), category.lower(), price_min, price_max)
+    sweets = catalog_cache.get(cache_key)
+    if sweets is not None:
+        return sweets
+
+    async with sweet_repository.consistent_reads():
+        docs = await sweet_repository.search(name.lower(), category.lower(), price_min, price_max)
+    sweets = [obj_to_dict(doc) for doc in docs]
+    catalog_cache.set(cache_key, sweets)
+    return sweets
 
 async def update_sweet(sweet_id: str, data: SweetUpdate):
     """
     Update sweet by ID with provided fields.
     Raise 404 if sweet not found.
     """
-    result = await sweet_collection.update_one({"_id": ObjectId(sweet_id)}, {"$set": data.dict(exclude_unset=True)})
-    if result.modified_count == 0:
+    changes = with_search_fields(data.dict(exclude_unset=True))
+    if not changes:
+        updated = await sweet_repository.get(ObjectId(sweet_id))
+    else:
+        if "quantity" in changes and inventory_buffer is not None:
+            # The new quantity replaces whatever this worker still has buffered
+            await inventory_buffer.discard([ObjectId(sweet_id)])
+        # Write and read back in one round trip
+        result = await sweet_repository.update_fields(ObjectId(sweet_id), changes)
+        updated = None
+        if result:
+            before, updated = result
+            await sweet_changed(before, updated)
+    if not updated:
         raise HTTPException(status_code=404, detail="Sweet not found")
-    updated = await sweet_collection.find_one({"_id": ObjectId(sweet_id)})
     return obj_to_dict(updated)
 
 async def delete_sweet(sweet_id: str):
@@ -53,9 +349,14 @@ async def delete_sweet(sweet_id: str):
     Delete sweet by ID.
     Raise 404 if sweet not found.
     """
-    result = await sweet_collection.delete_one({"_id": ObjectId(sweet_id)})
-    if result.deleted_count == 0:
+    deleted = await sweet_repository.delete(ObjectId(sweet_id))
+    if not deleted:
         raise HTTPException(status_code=404, detail="Sweet not found")
+    if deleted.get("held"):  # Holds exist only while some of its stock is held
+        await hold_repository.delete_for_sweets([deleted["_id"]])
+    if inventory_buffer is not None:
+        await inventory_buffer.discard([deleted["_id"]])
+    await sweet_changed(deleted, None)
 
 async def restock_sweet(sweet_id: str, quantity: int):
     """
@@ -65,15 +366,159 @@ async def restock_sweet(sweet_id: str, quantity: int):
     if quantity <= 0:
         raise HTTPException(status_code=400, detail="Quantity must be greater than 0")
 
-    sweet = await sweet_collection.find_one({"_id": ObjectId(sweet_id)})
-    if not sweet:
+    if inventory_buffer is not None:
+        # Write-behind: counted locally, stored on the next flush
+        sweet = await sweet_repository.get(ObjectId(sweet_id))
+        if not sweet:
+            raise HTTPException(status_code=404, detail="Sweet not found")
+        inventory_buffer.restock(sweet["_id"], quantity)
+        sweet["quantity"] += inventory_buffer.buffered(sweet["_id"])
+        return obj_to_dict(sweet)
+
+    # Single atomic increment returning the post-update document,
+    # so concurrent restocks never lose updates.
+    updated = await sweet_repository.increment_quantity(ObjectId(sweet_id), quantity)
+    if not updated:
         raise HTTPException(status_code=404, detail="Sweet not found")
+    await sweet_changed({**updated, "quantity": updated["quantity"] - quantity}, updated)
+    return obj_to_dict(updated)
 
-    new_quantity = sweet.get("quantity", 0) + quantity
-    await sweet_collection.update_one(
-        {"_id": ObjectId(sweet_id)},
-        {"$set": {"quantity": new_quantity}}
-    )
 
-    updated = await sweet_collection.find_one({"_id": ObjectId(sweet_id)})
-    return obj_to_dict(updated)
+def _merge_basket(items: List[CheckoutItem]) -> dict:
+    """Collapse duplicate basket lines into one quantity per sweet ID."""
+    basket = {}
+    for item in items:
+        basket[item.sweet_id] = basket.get(item.sweet_id, 0) + item.quantity
+    return basket
+
+
+async def checkout(items: List[CheckoutItem]):
+    """
+    Purchase a basket of sweets all-or-nothing.
+    Each line is guarded by quantity >= requested, so stock never goes
+    negative. Returns the overall outcome and a status per basket line.
+    """
+    if not items:
+        raise HTTPException(status_code=400, detail="Basket is empty")
+
+    basket = _merge_basket(items)
+    invalid = [sweet_id for sweet_id in basket if not ObjectId.is_valid(sweet_id)]
+    if invalid:
+        statuses = {sweet_id: "not_found" if sweet_id in invalid else "not_applied" for sweet_id in basket}
+    else:
+        basket_ids = {ObjectId(sweet_id): quantity for sweet_id, quantity in basket.items()}
+        if inventory_buffer is not None:
+            # Sold from units this worker already holds: stored data changes on the next flush
+            results = await inventory_buffer.take(basket_ids)
+        else:
+            results = await sweet_repository.decrement_basket(basket_ids)
+            if all(status == "ok" for status in results.values()):  # A failed basket changes nothing
+                await catalog_changed(basket_ids)
+        statuses = {str(sweet_id): status for sweet_id, status in results.items()}
+
+    lines = [
+        {"sweet_id": sweet_id, "quantity": quantity, "status": statuses[sweet_id]}
+        for sweet_id, quantity in basket.items()
+    ]
+    return {"success": all(line["status"] == "ok" for line in lines), "lines": lines}
+
+
+def _check_bulk_size(count: int):
+    """Reject empty batches and batches above BULK_MAX_ITEMS."""
+    if count == 0:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if count > settings.BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BULK_MAX_ITEMS} items per request")
+
+
+def _bulk_summary(results: List[dict], success_status: str) -> dict:
+    succeeded = sum(1 for result in results if result["status"] == success_status)
+    return {"succeeded": succeeded, "failed": len(results) - succeeded, "results": results}
+
+
+async def bulk_create_sweets(items: List[SweetCreate]):
+    """
+    Insert many sweets in one bulk write.
+    IDs are generated locally, so no read-back is needed.
+    """
+    _check_bulk_size(len(items))
+    docs = [with_search_fields({"_id": ObjectId(), **item.dict(), "held": 0}) for item in items]
+    errors = await sweet_repository.bulk_insert(docs)
+    await catalog_changed(categories={doc["category"] for index, doc in enumerate(docs) if index not in errors})
+
+    results = []
+    for index, doc in enumerate(docs):
+        if index in errors:
+            results.append({"index": index, "status": "error", "detail": errors[index]})
+        else:
+            results.append({"index": index, "sweet_id": str(doc["_id"]), "status": "created"})
+    return _bulk_summary(results, "created")
+
+
+async def bulk_update_sweets(items: List[SweetBulkUpdateItem]):
+    """
+    Apply many partial updates in one bulk write.
+    Unknown or malformed IDs are reported per item.
+    """
+    _check_bulk_size(len(items))
+    valid_ids = [ObjectId(item.sweet_id) for item in items if ObjectId.is_valid(item.sweet_id)]
+    existing = await sweet_repository.categories_of(valid_ids)
+
+    results, updates, op_items = [], [], []
+    for index, item in enumerate(items):
+        result = {"index": index, "sweet_id": item.sweet_id}
+        results.append(result)
+        if not ObjectId.is_valid(item.sweet_id):
+            result["status"] = "invalid_id"
+        elif ObjectId(item.sweet_id) not in existing:
+            result["status"] = "not_found"
+        else:
+            result["status"] = "updated"
+            changes = with_search_fields(item.data.dict(exclude_unset=True))
+            if changes:
+                updates.append((ObjectId(item.sweet_id), changes))
+                op_items.append(result)
+
+    if inventory_buffer is not None:
+        await inventory_buffer.discard([sweet_id for sweet_id, changes in updates if "quantity" in changes])
+    errors = await sweet_repository.bulk_update(updates) if updates else {}
+    # Facets of the categories the sweets were in and the ones they moved to
+    categories = {existing[sweet_id] for sweet_id, _ in updates}
+    categories.update(changes["category"] for _, changes in updates if "category" in changes)
+    await catalog_changed(categories=categories)
+    for op_index, message in errors.items():
+        op_items[op_index].update({"status": "error", "detail": message})
+    return _bulk_summary(results, "updated")
+
+
+async def bulk_delete_sweets(ids: List[str]):
+    """
+    Delete many sweets in one bulk write.
+    Unknown or malformed IDs are reported per item.
+    """
+    _check_bulk_size(len(ids))
+    existing = await sweet_repository.categories_of([ObjectId(sweet_id) for sweet_id in ids if ObjectId.is_valid(sweet_id)])
+
+    results, deletions, op_items = [], [], []
+    for index, sweet_id in enumerate(ids):
+        result = {"index": index, "sweet_id": sweet_id}
+        results.append(result)
+        if not ObjectId.is_valid(sweet_id):
+            result["status"] = "invalid_id"
+        elif ObjectId(sweet_id) not in existing:
+            result["status"] = "not_found"
+        else:
+            result["status"] = "deleted"
+            deletions.append(ObjectId(sweet_id))
+            op_items.append(result)
+
+    errors = await sweet_repository.bulk_delete(deletions) if deletions else {}
+    deleted = [sweet_id for op_index, sweet_id in enumerate(deletions) if op_index not in errors]
+    if deleted:
+        await hold_repository.delete_for_sweets(deleted)
+        if inventory_buffer is not None:
+            await inventory_buffer.discard(deleted)
+    await catalog_changed(categories={existing[sweet_id] for sweet_id in deleted})
+    for op_index, message in errors.items():
+        op_items[op_index].update({"status": "error", "detail": message})
+    return _bulk_summary(results, "deleted")
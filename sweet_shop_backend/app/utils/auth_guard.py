@@ -2,16 +2,46 @@
 from fastapi import Depends, HTTPException, Header
 from jose import jwt, JWTError
 from app.config import settings
-from app.database import user_collection
-from bson import ObjectId
+from app.repositories import user_repository
+from app.utils.cache import principal_cache
+from app.utils.revocation import token_revocations
+
+def principal_from_claims(payload: dict):
+    """
+    Build the principal from a verified token's signed "role" and "ver"
+    (token version) claims, without a database lookup.
+    Raises HTTP 401 if the user's tokens were revoked after this one was issued.
+    Returns None for tokens issued without these claims; callers then fall
+    back to load_principal.
+    """
+    if "role" not in payload or "ver" not in payload:
+        return None
+    user_id = payload["sub"]
+    if token_revocations.is_revoked(user_id, payload["ver"]):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return {"_id": user_id, "role": payload["role"], "token_version": payload["ver"]}
+
+async def load_principal(user_id: str):
+    """
+    Return the user document for a verified token subject.
+    Served from the in-process principal cache when possible so bursts of
+    authenticated calls do not each pay a database round trip.
+    Returns None if the user does not exist.
+    """
+    user = principal_cache.get(user_id)
+    if user is None:
+        user = await user_repository.find_by_id(user_id)
+        if user:
+            principal_cache.set(user_id, user)
+    return user
 
 async def get_current_user(authorization: str = Header(...)):
     """
-    Extract and validate the JWT token from the Authorization header,
-    decode it to retrieve the user ID, and fetch the corresponding user
-    from the database.
+    Extract and validate the JWT token from the Authorization header and
+    return the user it was issued to, taken from its signed claims (or,
+    for older tokens without them, fetched from the database).
 
-    Raises HTTP 401 if token is missing/invalid or format is incorrect.
+    Raises HTTP 401 if token is missing/invalid/revoked or format is incorrect.
     Raises HTTP 404 if user not found in database.
     """
     # Check if header format is Bearer <token>
@@ -27,8 +57,8 @@ async def get_current_user(authorization: str = Header(...)):
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
         
-        # Fetch user by ID from database
-        user = await user_collection.find_one({"_id": ObjectId(user_id)})
+        # Signed claims first; fetch user by ID (cached) for older tokens
+        user = principal_from_claims(payload) or await load_principal(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         return user
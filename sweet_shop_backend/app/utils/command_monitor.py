@@ -0,0 +1,151 @@
+# app/utils/command_monitor.py
+from collections import Counter
+from pymongo import monitoring
+from app.utils.metrics import mongo_command_duration_seconds
+
+
+class CommandCounter(monitoring.CommandListener):
+    """
+    Counts MongoDB commands sent by the driver, keyed by
+    (command name, collection), e.g. ("insert", "sweets").
+    Registered on the Motor client in app/database.py, like PoolMonitor below.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self.counts[(event.command_name, collection if isinstance(collection, str) else None)] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def snapshot(self) -> Counter:
+        """Copy of the current counts; subtract two snapshots to measure a block of work."""
+        return Counter(self.counts)
+
+    def reset(self):
+        self.counts.clear()
+
+
+command_counter = CommandCounter()
+
+
+# Commands the app issues; their metric children exist before the first request
+KNOWN_COMMANDS = (
+    "find", "getMore", "insert", "update", "delete", "findAndModify", "aggregate", "count",
+    "createIndexes", "listIndexes", "ping", "commitTransaction", "abortTransaction",
+)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Feeds mongo_command_duration_seconds (count, sum and latency buckets per
+    command and outcome) using the driver's own duration measurement.
+    """
+
+    def __init__(self):
+        for command in KNOWN_COMMANDS:
+            for outcome in ("succeeded", "failed"):
+                mongo_command_duration_seconds.labels(command, outcome)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_duration_seconds.labels(event.command_name, "succeeded").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        mongo_command_duration_seconds.labels(event.command_name, "failed").observe(event.duration_micros / 1e6)
+
+
+command_metrics = CommandMetrics()
+
+
+# Figures reported for each server's pool in PoolMonitor.stats()["servers"]
+SERVER_POOL_STATS = ("open_connections", "checked_out", "waiting", "checkout_failures", "saturation")
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Tracks connection pool usage. The driver keeps one pool per server, each
+    capped at maxPoolSize, so usage is counted per server address:
+    connections checked out, operations waiting for a connection, and
+    wait-queue timeouts. A server's saturation = its checked_out /
+    max_pool_size; the overall saturation is the busiest server's. Sustained
+    values near 1.0 with waiters mean the pool (or the worker count) is
+    undersized.
+    """
+
+    def __init__(self):
+        self.max_pool_size = 0
+        self.servers = {}  # "host:port" -> {open_connections, checked_out, waiting, checkout_failures}
+
+    def _server(self, event) -> dict:
+        host, port = event.address
+        return self.servers.setdefault(f"{host}:{port}", {
+            "open_connections": 0, "checked_out": 0, "waiting": 0, "checkout_failures": 0,
+        })
+
+    def pool_created(self, event):
+        self.max_pool_size = event.options.get("maxPoolSize", self.max_pool_size)
+        self._server(event)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._server(event)["open_connections"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._server(event)["open_connections"] -= 1
+
+    def connection_check_out_started(self, event):
+        self._server(event)["waiting"] += 1
+
+    def connection_check_out_failed(self, event):
+        server = self._server(event)
+        server["waiting"] -= 1
+        server["checkout_failures"] += 1
+
+    def connection_checked_out(self, event):
+        server = self._server(event)
+        server["waiting"] -= 1
+        server["checked_out"] += 1
+
+    def connection_checked_in(self, event):
+        self._server(event)["checked_out"] -= 1
+
+    def _saturation(self, checked_out: int) -> float:
+        return checked_out / self.max_pool_size if self.max_pool_size else 0.0
+
+    def stats(self) -> dict:
+        servers = {
+            address: {**usage, "saturation": self._saturation(usage["checked_out"])}
+            for address, usage in self.servers.items()
+        }
+        return {
+            "max_pool_size": self.max_pool_size,
+            "open_connections": sum(usage["open_connections"] for usage in servers.values()),
+            "checked_out": sum(usage["checked_out"] for usage in servers.values()),
+            "waiting": sum(usage["waiting"] for usage in servers.values()),
+            "checkout_failures": sum(usage["checkout_failures"] for usage in servers.values()),
+            "saturation": max((usage["saturation"] for usage in servers.values()), default=0.0),
+            "servers": servers,
+        }
+
+
+pool_monitor = PoolMonitor()
@@ -1,16 +1,83 @@
 # app/utils/hash.py
+import math
+import time
+from typing import Optional, Tuple
 from passlib.context import CryptContext
+from passlib.hash import bcrypt
+from app.config import settings
+
+# passlib's own bcrypt default, used until configure_hashing() runs at startup
+DEFAULT_ROUNDS = 12
+
+
+def _build_context(rounds: int) -> CryptContext:
+    # min == default, no max: needs_update() flags only hashes weaker than this
+    # cost, so workers calibrated to different costs never rehash each other's
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+    )
+
 
 # Create a CryptContext object to handle password hashing using bcrypt algorithm
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_rounds = settings.PASSWORD_HASH_ROUNDS or DEFAULT_ROUNDS
+pwd_context = _build_context(_rounds)
+
+
+def configure_hashing(rounds: int):
+    """
+    Set the bcrypt cost for new hashes and the floor that weaker stored
+    hashes are upgraded to on login. Also used as the password process pool initializer,
+    so worker processes hash at the same cost.
+
+    Args:
+        rounds (int): bcrypt cost factor (log2 of the work).
+    """
+    global pwd_context, _rounds
+    pwd_context = _build_context(rounds)
+    _rounds = rounds
+
+
+def current_rounds() -> int:
+    """Return the bcrypt cost new hashes are made with."""
+    return _rounds
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """
+    Pick the bcrypt cost whose verification takes about target_ms here.
+
+    Times a verification at min_rounds (best of three) and extrapolates:
+    every extra round doubles the work.
+
+    Args:
+        target_ms (float): Desired verification time in milliseconds.
+        min_rounds (int): Lowest cost to return (also the measured cost).
+        max_rounds (int): Highest cost to return.
+
+    Returns:
+        int: Cost factor between min_rounds and max_rounds.
+    """
+    sample = bcrypt.using(rounds=min_rounds).hash("calibration")
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.verify("calibration", sample)
+        timings.append(time.perf_counter() - start)
+    measured_ms = min(timings) * 1000
+    rounds = min_rounds + round(math.log2(target_ms / measured_ms)) if target_ms > 0 else min_rounds
+    return max(min_rounds, min(max_rounds, rounds))
+
 
 def hash_password(password: str) -> str:
     """
     Hash the plain password using bcrypt algorithm.
-    
+
     Args:
         password (str): The plain text password to hash.
-    
+
     Returns:
         str: The hashed password.
     """
@@ -19,12 +86,26 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a plain password against the hashed password.
-    
+
     Args:
         plain_password (str): The plain text password to verify.
         hashed_password (str): The stored hashed password.
-    
+
     Returns:
         bool: True if the password matches, False otherwise.
     """
     return pwd_context.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password and, if it matches but the stored hash was made at a
+    lower cost than the current one, rehash it at the current cost.
+
+    Args:
+        plain_password (str): The plain text password to verify.
+        hashed_password (str): The stored hashed password.
+
+    Returns:
+        tuple: (True if the password matches, new hash to store or None).
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
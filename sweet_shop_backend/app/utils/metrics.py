@@ -0,0 +1,259 @@
+# app/utils/metrics.py
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+# Minimal Prometheus-style metrics (text exposition format 0.0.4).
+# Labelled children are created once per label set and cached, so the hot
+# path is a dict lookup plus a counter increment.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Return the child for these label values (created on first use)."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            lines.extend(child.expose(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def expose(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].inc(amount)
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self._children[()].dec(amount)
+
+    def set(self, value: float):
+        self._children[()].set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def expose(self, name, labelnames, values):
+        lines, cumulative = [], 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            le = f'le="{bound}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {self.sum}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+
+class Registry:
+    """Holds metrics plus collectors: callables producing lines at scrape time."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        self._collectors.append(collector)
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.expose())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# HTTP
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled"))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template and status",
+    ("method", "route", "status")))
+
+# MongoDB (fed by MongoCommandMetrics in app/utils/command_monitor.py)
+mongo_command_duration_seconds = registry.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency",
+    ("command", "outcome")))
+
+# Password hashing (fed by app/utils/password_pool.py)
+password_task_duration_seconds = registry.register(Histogram(
+    "password_task_duration_seconds", "Time spent in bcrypt hash/verify, excluding queueing",
+    ("operation",), buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0)))
+password_pool_rejected_total = registry.register(Counter(
+    "password_pool_rejected_total", "Password jobs rejected with 503 because the pool was saturated"))
+password_rehashed_total = registry.register(Counter(
+    "password_rehashed_total", "Stored password hashes upgraded to the current bcrypt cost on login"))
+
+# Rate limiting (fed by app/utils/rate_limit.py)
+rate_limited_requests_total = registry.register(Counter(
+    "rate_limited_requests_total", "Requests rejected with 429 by the rate limiter", ("limit",)))
+
+
+def gauge_lines(name: str, documentation: str, samples) -> List[str]:
+    """Exposition lines for one gauge family; samples are (labels, value) pairs."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{labels} {value}")
+    return lines
+
+
+def cache_collector(caches: dict) -> Callable[[], List[str]]:
+    """Collector exposing TTLCache stats as cache_<stat>{cache="<name>"} gauges."""
+    families = {
+        "hits": "Cache lookups that found a fresh entry",
+        "misses": "Cache lookups that found nothing or an expired entry",
+        "evictions": "Entries dropped to stay within max_size",
+        "size": "Entries currently cached",
+        "hit_ratio": "hits / (hits + misses)",
+    }
+
+    def collect():
+        stats = {name: cache.stats() for name, cache in caches.items()}
+        lines = []
+        for stat, documentation in families.items():
+            lines.extend(gauge_lines(
+                f"cache_{stat}", documentation,
+                ((f'{{cache="{name}"}}', values[stat]) for name, values in stats.items())
+            ))
+        return lines
+    return collect
+
+
+# Status codes whose label sets are created up front for every route
+PREREGISTERED_STATUSES = ("200", "201", "304", "400", "401", "403", "404", "409", "422", "429", "500", "503")
+
+
+def preregister_routes(app, statuses=PREREGISTERED_STATUSES):
+    """
+    Create the latency histogram children for every (method, route, status)
+    combination at startup, so requests only look them up.
+    """
+    for route in app.routes:
+        for method in getattr(route, "methods", None) or ():
+            for status in statuses:
+                http_request_duration_seconds.labels(method, route.path, status)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording in-flight requests and latency per
+    route template (e.g. /api/sweets/{sweet_id}), method and status.
+    Unmatched paths share the "unmatched" route label to bound cardinality.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500  # Reported if the app raises before starting a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = scope.get("route")  # Set on the scope by the router on match
+            http_request_duration_seconds.labels(
+                scope["method"], route.path if route is not None else "unmatched", str(status)
+            ).observe(elapsed)
@@ -0,0 +1,82 @@
+# app/utils/password_pool.py
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+from app.config import settings
+from app.utils.hash import configure_hashing, current_rounds
+from app.utils.metrics import gauge_lines, password_pool_rejected_total, password_task_duration_seconds, registry
+
+# Lazily created executor for bcrypt work, plus count of queued + running jobs
+_executor: Executor = None
+_pending = 0
+
+
+def _get_executor() -> Executor:
+    """Create the configured executor on first use."""
+    global _executor
+    if _executor is None:
+        workers = settings.PASSWORD_POOL_WORKERS or min(4, os.cpu_count() or 1)
+        if settings.PASSWORD_POOL_KIND == "process":
+            # Worker processes import the hashing module afresh: give them the startup cost
+            _executor = ProcessPoolExecutor(max_workers=workers, initializer=configure_hashing,
+                                            initargs=(current_rounds(),))
+        else:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+    return _executor
+
+
+def _timed(func, *args):
+    """Run func in the worker and report its own runtime (excludes queueing)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+async def run_password_task(func, *args):
+    """
+    Run a CPU-heavy password function (bcrypt hash/verify) off the event loop.
+
+    At most PASSWORD_POOL_MAX_PENDING jobs may be queued or running; beyond
+    that the call fails fast with 503 instead of piling up behind the pool.
+    For the process pool, func must be a picklable module-level function.
+    """
+    global _pending
+    if _pending >= settings.PASSWORD_POOL_MAX_PENDING:
+        password_pool_rejected_total.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"}
+        )
+
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        result, elapsed = await loop.run_in_executor(_get_executor(), _timed, func, *args)
+        password_task_duration_seconds.labels(func.__name__).observe(elapsed)
+        return result
+    finally:
+        _pending -= 1
+
+
+def pending_jobs() -> int:
+    """Number of password jobs currently queued or running."""
+    return _pending
+
+
+registry.add_collector(lambda: gauge_lines(
+    "password_pool_pending_jobs", "Password jobs queued or running", [("", _pending)]
+))
+registry.add_collector(lambda: gauge_lines(
+    "password_hash_rounds", "bcrypt cost used for new hashes", [("", current_rounds())]
+))
+
+
+def shutdown_password_pool():
+    """Stop the executor; called on application shutdown."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,113 @@
+# app/utils/profiler.py
+import cProfile
+import hmac
+import io
+import pstats
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+from app.config import settings
+
+# Request header carrying PROFILING_TOKEN (ASGI header names are lowercase bytes)
+PROFILE_HEADER = b"x-profile"
+
+
+class ProfileStore:
+    """Most recent request profiles keyed by profile ID (oldest dropped first)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._profiles = OrderedDict()
+
+    def add(self, profile_id: str, profile: dict):
+        self._profiles[profile_id] = profile
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return self._profiles.get(profile_id)
+
+    def summaries(self) -> list:
+        """Metadata of stored profiles, newest first, without the report text."""
+        return [
+            {key: value for key, value in profile.items() if key != "report"}
+            for profile in reversed(self._profiles.values())
+        ]
+
+    def clear(self):
+        self._profiles.clear()
+
+
+profile_store = ProfileStore(settings.PROFILING_MAX_STORED)
+
+
+def render_profile(profiler: cProfile.Profile, limit: int = 60) -> str:
+    """pstats report sorted by cumulative time, top `limit` functions."""
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+    return stream.getvalue()
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware that runs selected requests under cProfile, covering
+    routing, dependencies, the route handler, service calls and response
+    serialization. The report is kept in profile_store and its ID returned
+    in the X-Profile-Id response header.
+
+    Only installed when PROFILING_ENABLED is true, so it costs nothing
+    otherwise. cProfile sees the whole event loop thread, so other requests
+    running concurrently show up in the report too; only one request is
+    profiled at a time.
+    """
+
+    def __init__(self, app, token: str = None, sample_rate: float = None, store: ProfileStore = None):
+        self.app = app
+        self.token = (settings.PROFILING_TOKEN if token is None else token).encode()
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.store = profile_store if store is None else store
+        self._active = False
+
+    def _wants_profile(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        self._active = True
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            self._active = False
+            self.store.add(profile_id, {
+                "profile_id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 3),
+                "created_at": time.time(),
+                "report": render_profile(profiler),
+            })
@@ -0,0 +1,174 @@
+# app/utils/rate_limit.py
+import math
+import time
+from collections import OrderedDict
+from typing import List, NamedTuple, Tuple
+from urllib.parse import parse_qs
+from fastapi.responses import JSONResponse
+from app.config import settings
+from app.utils.metrics import rate_limited_requests_total
+
+# Routes running bcrypt on every call; limited per client IP, login also per account
+LOGIN_PATH = "/api/auth/login"
+AUTH_PATHS = frozenset({LOGIN_PATH, "/api/auth/register"})
+
+FORWARDED_FOR_HEADER = b"x-forwarded-for"
+FORM_CONTENT_TYPE = b"application/x-www-form-urlencoded"
+
+
+class RateLimit(NamedTuple):
+    """A token bucket policy: up to `burst` requests at once, refilled at `per_minute`."""
+    name: str
+    burst: int
+    per_minute: float
+
+    @property
+    def rate(self) -> float:
+        """Tokens added per second."""
+        return self.per_minute / 60
+
+
+def retry_after(tokens: float, cost: int, rate: float) -> float:
+    """Seconds until a bucket holding `tokens` can pay `cost`."""
+    return (cost - tokens) / rate if rate > 0 else math.inf
+
+
+class LocalBucketStore:
+    """
+    Token buckets for a single worker, in a bounded LRU dict.
+
+    take() is O(1): a bucket is only a (tokens, last update) pair, refilled
+    lazily from the time elapsed since it was last touched, and there is no
+    per-bucket timer. Once max_keys buckets exist the least recently used is
+    dropped, which at worst forgives the client that has been idle longest.
+    """
+
+    def __init__(self, max_keys: int, clock=time.monotonic):
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+
+    def take_now(self, key: str, burst: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        """Refill the bucket, then take cost tokens if available. Returns (allowed, retry_after seconds)."""
+        now = self._clock()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else retry_after(tokens, cost, rate)
+
+    async def take(self, key: str, burst: int, rate: float, cost: int = 1) -> Tuple[bool, float]:
+        # Same interface as the shared RateLimitRepository stores
+        return self.take_now(key, burst, rate, cost)
+
+    def clear(self):
+        self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+async def _buffer_body(receive):
+    """
+    Read the whole request body, returning it together with a receive
+    callable that replays the buffered messages to the app.
+    """
+    messages = []
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request" or not message.get("more_body", False):
+            break
+    body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.request")
+
+    async def replay():
+        return messages.pop(0) if messages else await receive()
+
+    return body, replay
+
+
+def _form_username(scope, body: bytes) -> str:
+    """The normalized "username" field of an urlencoded login form, or ""."""
+    for name, value in scope["headers"]:
+        if name == b"content-type" and value.split(b";")[0].strip().lower() == FORM_CONTENT_TYPE:
+            usernames = parse_qs(body.decode("utf-8", "replace")).get("username")
+            return usernames[0].strip().lower() if usernames else ""
+    return ""
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI middleware enforcing token buckets before a request reaches
+    the app: per client IP on login/register (auth_ip), per account on
+    login (login_account, keyed by the form's username whatever the IP) and
+    optionally per client IP on every other route (api_ip). Rejected
+    requests get 429 with a Retry-After header and are counted in
+    rate_limited_requests_total.
+
+    Buckets live in `store`: a LocalBucketStore per worker, or the shared
+    rate_limit_repository so limits hold across workers. If the store
+    fails the request is let through rather than locking users out.
+    """
+
+    def __init__(self, app, store=None, auth_ip: RateLimit = None, login_account: RateLimit = None,
+                 api_ip: RateLimit = None, trust_forwarded: bool = None):
+        self.app = app
+        self.store = LocalBucketStore(settings.RATE_LIMIT_MAX_KEYS) if store is None else store
+        self.auth_ip = auth_ip or RateLimit(
+            "auth_ip", settings.RATE_LIMIT_AUTH_IP_BURST, settings.RATE_LIMIT_AUTH_IP_PER_MINUTE)
+        self.login_account = login_account or RateLimit(
+            "login_account", settings.RATE_LIMIT_LOGIN_ACCOUNT_BURST, settings.RATE_LIMIT_LOGIN_ACCOUNT_PER_MINUTE)
+        self.api_ip = api_ip or RateLimit(
+            "api_ip", settings.RATE_LIMIT_API_IP_BURST, settings.RATE_LIMIT_API_IP_PER_MINUTE)
+        self.trust_forwarded = settings.RATE_LIMIT_TRUST_FORWARDED if trust_forwarded is None else trust_forwarded
+        for limit in (self.auth_ip, self.login_account, self.api_ip):
+            rate_limited_requests_total.labels(limit.name)
+
+    def _client_ip(self, scope) -> str:
+        if self.trust_forwarded:
+            for name, value in scope["headers"]:
+                if name == FORWARDED_FOR_HEADER:
+                    return value.decode("latin-1").split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def _checks(self, scope, receive) -> Tuple[List[Tuple[RateLimit, str]], object]:
+        """The (limit, identity) pairs that apply to this request, plus the receive to pass on."""
+        client_ip = self._client_ip(scope)
+        if scope["method"] != "POST" or scope["path"] not in AUTH_PATHS:
+            return [(self.api_ip, client_ip)], receive
+        checks = [(self.auth_ip, client_ip)]
+        if scope["path"] == LOGIN_PATH and self.login_account.burst > 0:
+            body, receive = await _buffer_body(receive)
+            account = _form_username(scope, body)
+            if account:
+                checks.append((self.login_account, account))
+        return checks, receive
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        checks, receive = await self._checks(scope, receive)
+        for limit, identity in checks:
+            if limit.burst <= 0:
+                continue
+            try:
+                allowed, wait = await self.store.take(f"{limit.name}:{identity}", limit.burst, limit.rate)
+            except Exception as exc:
+                print(f"Rate limit store failed, allowing request: {exc}")
+                continue
+            if not allowed:
+                rate_limited_requests_total.labels(limit.name).inc()
+                headers = {"Retry-After": str(max(1, math.ceil(wait))) if math.isfinite(wait) else "3600"}
+                response = JSONResponse({"detail": "Too many requests"}, status_code=429, headers=headers)
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
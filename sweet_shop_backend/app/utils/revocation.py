@@ -0,0 +1,54 @@
+# app/utils/revocation.py
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Tuple
+from app.config import settings
+
+
+class TokenRevocations:
+    """
+    In-process view of token revocations: user ID -> lowest token version
+    still accepted. Checked on every authenticated request without touching
+    the database; kept in step with other workers by periodically merging
+    in the revocations collection (see auth_service.start_revocation_sync).
+
+    An entry is dropped once every token issued before it has expired, so
+    the list only ever holds users revoked within the token lifetime.
+    """
+
+    def __init__(self, token_lifetime: timedelta, clock=datetime.utcnow):
+        self.token_lifetime = token_lifetime
+        self._clock = clock
+        self._entries: Dict[str, Tuple[int, datetime]] = {}  # user_id -> (min_version, revoked_at)
+
+    def revoke(self, user_id: str, version: int, revoked_at: datetime = None):
+        """Reject tokens of user_id whose version is below version (never lowers an existing entry)."""
+        revoked_at = revoked_at or self._clock()
+        current = self._entries.get(user_id)
+        if current is None or version >= current[0]:
+            self._entries[user_id] = (version, max(revoked_at, current[1]) if current else revoked_at)
+
+    def is_revoked(self, user_id: str, version: int) -> bool:
+        entry = self._entries.get(user_id)
+        return entry is not None and version < entry[0]
+
+    def window_start(self) -> datetime:
+        """Oldest revocation time that can still affect an unexpired token."""
+        return self._clock() - self.token_lifetime
+
+    def merge(self, revocations: Iterable[dict]):
+        """Merge revocation documents ({_id, version, revoked_at}) and prune expired entries."""
+        for entry in revocations:
+            self.revoke(entry["_id"], entry["version"], entry["revoked_at"])
+        cutoff = self.window_start()
+        for user_id in [user_id for user_id, (_, revoked_at) in self._entries.items() if revoked_at < cutoff]:
+            del self._entries[user_id]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Revocations for tokens issued by any worker (see auth_service.revoke_tokens)
+token_revocations = TokenRevocations(timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
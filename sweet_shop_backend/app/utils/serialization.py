@@ -0,0 +1,29 @@
+# app/utils/serialization.py
+import json
+from fastapi.responses import JSONResponse
+
+# orjson is optional: it is several times faster, the standard library
+# encoder is used when it is not installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    """Compact UTF-8 JSON; values the encoder does not know (ObjectId, datetime) become str."""
+    if orjson is not None:
+        return orjson.dumps(content, default=str)
+    return json.dumps(content, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for trusted, already API-shaped data (documents passed
+    through obj_to_dict). Returning it from a route skips response_model
+    validation, so route decorators keep response_model for the OpenAPI
+    schema only.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,172 @@
+"""
+Shared setup for the load benchmarks.
+
+Every scenario runs on one event loop against the in-process app, and its
+summary (throughput, latency percentiles) is collected here, written to a
+JSON results file when the session ends, and checked against the stored
+baseline for the active storage backend.
+"""
+import asyncio
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+
+# Same hermetic default as the functional suite; must be set before the app
+# (and its settings) are imported.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+# All load comes from one address, which the rate limiter would throttle
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from httpx import AsyncClient
+from httpx._transports.asgi import ASGITransport
+
+from app.config import settings
+from app.main import app
+from app.utils.password_pool import shutdown_password_pool
+from load_driver import run_load
+
+BENCH_DIR = Path(__file__).parent
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", 32))
+REQUESTS = int(os.getenv("BENCH_REQUESTS", 2000))
+# Every login runs bcrypt, so the login scenario gets a much smaller budget
+LOGIN_REQUESTS = int(os.getenv("BENCH_LOGIN_REQUESTS", 32))
+CATALOG_SIZE = int(os.getenv("BENCH_CATALOG_SIZE", 1000))
+# Allowed slowdown before a metric counts as a regression: 0.5 tolerates
+# half the baseline throughput or twice the baseline tail latency.
+TOLERANCE = float(os.getenv("BENCH_TOLERANCE", 0.5))
+BASELINE_PATH = Path(os.getenv("BENCH_BASELINE", BENCH_DIR / "baseline.json"))
+RESULTS_PATH = Path(os.getenv("BENCH_RESULTS", BENCH_DIR / "results" / "latest.json"))
+UPDATE_BASELINE = os.getenv("BENCH_UPDATE_BASELINE", "").lower() in {"1", "true", "yes"}
+
+_results: Dict[str, Dict] = {}
+
+
+def load_baseline() -> Dict:
+    if BASELINE_PATH.exists():
+        return json.loads(BASELINE_PATH.read_text())
+    return {}
+
+
+def find_regressions(scenario: str, result: Dict, baseline: Dict) -> List[str]:
+    """
+    Compare one scenario against its baseline entry.
+
+    Runs at a different concurrency or request count are not comparable,
+    so they (and scenarios without a baseline yet) never fail.
+    """
+    reference = baseline.get(settings.STORAGE_BACKEND, {}).get(scenario)
+    if not reference:
+        return []
+    if (reference["concurrency"], reference["requests"]) != (result["concurrency"], result["requests"]):
+        return []
+
+    regressions = []
+    floor = reference["throughput"] * (1 - TOLERANCE)
+    if result["throughput"] < floor:
+        regressions.append(f"{scenario}: throughput {result['throughput']} req/s < {floor:.1f} "
+                           f"(baseline {reference['throughput']})")
+    for metric in ("p95_ms", "p99_ms"):
+        ceiling = reference[metric] / (1 - TOLERANCE)
+        if result[metric] > ceiling:
+            regressions.append(f"{scenario}: {metric} {result[metric]} > {ceiling:.3f} "
+                               f"(baseline {reference[metric]})")
+    return regressions
+
+
+@pytest.fixture(scope="session")
+def load_profile() -> Dict:
+    """Request budgets for the scenarios (BENCH_* env vars)."""
+    return {"requests": REQUESTS, "login_requests": LOGIN_REQUESTS}
+
+
+@pytest.fixture(scope="session")
+def bench_loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def bench_client(bench_loop):
+    client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+    yield client
+    bench_loop.run_until_complete(client.aclose())
+    shutdown_password_pool()
+
+
+@pytest.fixture(scope="session")
+def bench_state(bench_loop, bench_client):
+    """Register an admin and a customer and seed the catalog once per session."""
+    async def seed():
+        suffix = uuid.uuid4().hex[:8]
+        admin = await bench_client.post("/api/auth/register", json={
+            "email": f"bench_admin_{suffix}@example.com",
+            "password": "BenchSecret123",
+            "role": "admin",
+            "admin_secret": settings.ADMIN_SECRET
+        })
+        assert admin.status_code == 201
+        admin_headers = {"Authorization": f"Bearer {admin.json()['access_token']}"}
+
+        customer = {"username": f"bench_user_{suffix}@example.com", "password": "BenchSecret123"}
+        registered = await bench_client.post("/api/auth/register", json={
+            "email": customer["username"], "password": customer["password"]
+        })
+        assert registered.status_code == 201
+
+        created = await bench_client.post("/api/sweets/bulk", headers=admin_headers, json={"items": [
+            {"name": f"Bench {suffix} {i}", "category": f"Bench {i % 10}", "price": 1 + i % 50, "quantity": 1000}
+            for i in range(CATALOG_SIZE)
+        ]})
+        assert created.status_code == 200
+        sweet_ids = [row["sweet_id"] for row in created.json()["results"]]
+        assert len(sweet_ids) == CATALOG_SIZE
+        return {"suffix": suffix, "admin_headers": admin_headers, "customer": customer, "sweet_ids": sweet_ids}
+
+    return bench_loop.run_until_complete(seed())
+
+
+@pytest.fixture
+def measure(benchmark, bench_loop, bench_client):
+    """
+    Run one load scenario under pytest-benchmark, record its summary and
+    fail if it regressed against the baseline or saw unexpected responses.
+    """
+    baseline = load_baseline()
+
+    def run(scenario: str, send, requests: int, expected=(200,)):
+        def load():
+            return bench_loop.run_until_complete(run_load(bench_client, send, requests, CONCURRENCY, expected))
+
+        # One unmeasured request per worker fills caches and starts pools, so
+        # the first round's cold start does not land in the tail percentiles
+        bench_loop.run_until_complete(
+            run_load(bench_client, send, CONCURRENCY, CONCURRENCY, expected, first_index=requests)
+        )
+        result = benchmark.pedantic(load, rounds=1, iterations=1)
+        benchmark.extra_info.update(result)
+        _results[scenario] = result
+        print(f"{scenario}: {result['throughput']} req/s, p50 {result['p50_ms']} ms, "
+              f"p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, errors {result['errors']}")
+        assert result["errors"] == 0
+        if not UPDATE_BASELINE:
+            regressions = find_regressions(scenario, result, baseline)
+            assert not regressions, "; ".join(regressions)
+        return result
+
+    return run
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not _results:
+        return
+    RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    RESULTS_PATH.write_text(json.dumps({settings.STORAGE_BACKEND: _results}, indent=2) + "\n")
+    if UPDATE_BASELINE:
+        baseline = load_baseline()
+        baseline.setdefault(settings.STORAGE_BACKEND, {}).update(_results)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
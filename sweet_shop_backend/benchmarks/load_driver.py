@@ -0,0 +1,78 @@
+"""
+Async load driver for the in-process app.
+
+Fires a fixed number of requests through httpx's ASGI transport from a pool
+of concurrent workers and reports throughput and latency percentiles.
+No sockets are involved, so the numbers measure the app itself (routing,
+validation, services, storage, serialization) rather than the network.
+"""
+import asyncio
+import math
+import time
+from typing import Awaitable, Callable, Collection, Dict, List
+
+from httpx import AsyncClient, Response
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float, concurrency: int) -> Dict:
+    """Throughput (req/s) and latency percentiles (ms) for one run."""
+    ordered = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 4),
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+
+
+async def run_load(
+    client: AsyncClient,
+    send: Callable[[AsyncClient, int], Awaitable[Response]],
+    requests: int,
+    concurrency: int,
+    expected: Collection[int] = (200,),
+    first_index: int = 0,
+) -> Dict:
+    """
+    Issue `requests` calls of `send(client, i)` from `concurrency` workers.
+
+    Each worker takes the next request number as soon as its previous call
+    returns (closed-loop load), so at most `concurrency` requests are in
+    flight. Request numbers start at `first_index`, so a warm-up pass can use
+    a range that does not collide with the measured one. Responses outside
+    `expected` and raised exceptions count as errors.
+    """
+    latencies: List[float] = []
+    errors = 0
+    next_index = first_index
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < first_index + requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await send(client, index)
+                failed = response.status_code not in expected
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    return summarize(latencies, errors, time.perf_counter() - start, concurrency)
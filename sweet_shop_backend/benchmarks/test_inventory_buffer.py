@@ -0,0 +1,78 @@
+"""
+Throughput benchmark for the hot-item inventory buffer.
+
+Runs INVENTORY_BENCH_OPS sales and restocks (three single-unit sales per
+restock of 4) on one sweet whose stored writes serialize on the document,
+simulated with a lock and a 0.5 ms delay per write, once with direct
+guarded writes and once through InventoryBuffer. tests/ checks the buffer's
+batching and stock deterministically; this compares the rates.
+"""
+import asyncio
+import os
+import time
+
+from bson import ObjectId
+
+from app.repositories.memory import MemorySweetRepository
+from app.services.inventory_buffer import InventoryBuffer
+
+INVENTORY_BENCH_OPS = int(os.getenv("INVENTORY_BENCH_OPS", 2000))
+WRITE_LATENCY = 0.0005
+
+
+class HotDocumentRepository(MemorySweetRepository):
+    """Every write waits for the previous one, like updates to a single Mongo document."""
+    def __init__(self):
+        super().__init__()
+        self.lock, self.writes = asyncio.Lock(), 0
+
+    async def _serialized(self, write):
+        async with self.lock:
+            self.writes += 1
+            await asyncio.sleep(WRITE_LATENCY)
+            return await write
+
+    async def decrement_quantity(self, sweet_id, quantity):
+        return await self._serialized(super().decrement_quantity(sweet_id, quantity))
+
+    async def increment_quantity(self, sweet_id, delta):
+        return await self._serialized(super().increment_quantity(sweet_id, delta))
+
+    async def bulk_increment(self, deltas):
+        return await self._serialized(super().bulk_increment(deltas))
+
+
+async def run(use_buffer: bool):
+    repository = HotDocumentRepository()
+    sweet_id = ObjectId()
+    await repository.insert({"_id": sweet_id, "name": "Hot", "category": "Bench", "price": 1.0, "quantity": 100})
+    buffer = InventoryBuffer(repository, lease_size=50, flush_threshold=500)
+
+    async def operation(i):
+        if i % 4 == 0:  # One restock of 4 for every three single-unit sales
+            if use_buffer:
+                buffer.restock(sweet_id, 4)
+            else:
+                await repository.increment_quantity(sweet_id, 4)
+        elif use_buffer:
+            await buffer.take({sweet_id: 1})
+        else:
+            await repository.decrement_quantity(sweet_id, 1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(operation(i) for i in range(INVENTORY_BENCH_OPS)))
+    await buffer.flush()
+    elapsed = time.perf_counter() - start
+    stored = (await repository.get(sweet_id))["quantity"]
+    return INVENTORY_BENCH_OPS / elapsed, repository.writes, stored
+
+
+def test_inventory_buffer_hot_sweet(bench_loop):
+    direct_rate, direct_writes, direct_stock = bench_loop.run_until_complete(run(use_buffer=False))
+    buffered_rate, buffered_writes, buffered_stock = bench_loop.run_until_complete(run(use_buffer=True))
+    print(f"hot sweet: direct {direct_rate:.0f} ops/s ({direct_writes} writes), "
+          f"buffered {buffered_rate:.0f} ops/s ({buffered_writes} writes)")
+    sales = INVENTORY_BENCH_OPS - (INVENTORY_BENCH_OPS + 3) // 4
+    assert buffered_stock == direct_stock == 100 + (INVENTORY_BENCH_OPS - sales) * 4 - sales
+    assert buffered_writes * 10 < direct_writes
+    assert buffered_rate > direct_rate * 5
@@ -0,0 +1,80 @@
+"""
+Load scenarios for the auth and sweets endpoints.
+
+Run with `pytest benchmarks` (the functional suite under tests/ is not
+affected). Each scenario drives the in-process app from BENCH_CONCURRENCY
+workers; see benchmarks/conftest.py for the other knobs and the baseline
+check.
+"""
+import uuid
+
+from httpx import AsyncClient
+
+
+def test_login_load(measure, bench_state, load_profile):
+    customer = bench_state["customer"]
+
+    async def send(client: AsyncClient, i: int):
+        return await client.post("/api/auth/login", data=customer)
+
+    measure("login", send, load_profile["login_requests"])
+
+
+def test_list_load(measure, bench_state, load_profile):
+    async def send(client: AsyncClient, i: int):
+        return await client.get("/api/sweets/", params={"limit": 50})
+
+    measure("list", send, load_profile["requests"])
+
+
+def test_search_load(measure, bench_state, load_profile):
+    suffix = bench_state["suffix"]
+
+    async def send(client: AsyncClient, i: int):
+        if i % 2:
+            return await client.get("/api/sweets/search", params={"name": f"Bench {suffix} {i % 100}"})
+        return await client.get("/api/sweets/search", params={"category": f"Bench {i % 10}", "price_max": 25})
+
+    measure("search", send, load_profile["requests"])
+
+
+def test_create_load(measure, bench_state, load_profile):
+    headers, run_id = bench_state["admin_headers"], uuid.uuid4().hex[:8]
+
+    async def send(client: AsyncClient, i: int):
+        return await client.post("/api/sweets/", headers=headers, json={
+            "name": f"Load {run_id} {i}", "category": "Load", "price": 2.5, "quantity": 10
+        })
+
+    measure("create", send, load_profile["requests"], expected=(201,))
+
+
+def test_restock_load(measure, bench_state, load_profile):
+    headers, sweet_ids = bench_state["admin_headers"], bench_state["sweet_ids"]
+
+    async def send(client: AsyncClient, i: int):
+        return await client.patch(f"/api/sweets/{sweet_ids[i % len(sweet_ids)]}/restock",
+                                  headers=headers, params={"quantity": 1})
+
+    measure("restock", send, load_profile["requests"])
+
+
+def test_mixed_read_write_load(measure, bench_state, load_profile):
+    """80% catalog reads (list and search) with restocks and creates interleaved."""
+    headers, sweet_ids, suffix = bench_state["admin_headers"], bench_state["sweet_ids"], bench_state["suffix"]
+    run_id = uuid.uuid4().hex[:8]
+
+    async def send(client: AsyncClient, i: int):
+        kind = i % 10
+        if kind == 8:
+            return await client.patch(f"/api/sweets/{sweet_ids[i % len(sweet_ids)]}/restock",
+                                      headers=headers, params={"quantity": 1})
+        if kind == 9:
+            return await client.post("/api/sweets/", headers=headers, json={
+                "name": f"Mixed {run_id} {i}", "category": "Load", "price": 2.5, "quantity": 10
+            })
+        if kind % 2:
+            return await client.get("/api/sweets/search", params={"name": f"Bench {suffix} {i % 100}"})
+        return await client.get("/api/sweets/", params={"limit": 50})
+
+    measure("mixed", send, load_profile["requests"], expected=(200, 201))
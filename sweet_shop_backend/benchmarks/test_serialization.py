@@ -0,0 +1,56 @@
+"""
+Serialization benchmark for catalog responses.
+
+Renders SERIALIZATION_BENCH_ROWS trusted rows through the previous path
+(response_model validation, alias handling, stdlib JSON) and through
+FastJSONResponse, and reports rows/s for both. Timings are recorded, not
+asserted; tests/ checks that both paths produce the same JSON.
+"""
+import os
+import time
+from typing import List
+
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from app.schemas.sweet_schema import SweetResponse
+from app.services import sweet_service
+from app.utils.serialization import FastJSONResponse
+
+SERIALIZATION_BENCH_ROWS = int(os.getenv("SERIALIZATION_BENCH_ROWS", 10_000))
+
+
+def best_of(render, repeat: int = 3) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def test_fast_serialization(benchmark):
+    rows = [
+        sweet_service.obj_to_dict({"_id": ObjectId(), "name": f"Sweet {i}", "name_lower": f"sweet {i}",
+                                   "category": "Bench", "category_lower": "bench", "price": 1.5, "quantity": i, "held": 0})
+        for i in range(SERIALIZATION_BENCH_ROWS)
+    ]
+    adapter = TypeAdapter(List[SweetResponse])
+
+    def validated_render():
+        return JSONResponse(content=adapter.dump_python(adapter.validate_python(rows), mode="json", by_alias=True)).body
+
+    def fast_render():
+        return FastJSONResponse(content=rows).body
+
+    before = best_of(validated_render)
+    benchmark.pedantic(fast_render, rounds=3, iterations=1)
+    after = best_of(fast_render)
+    benchmark.extra_info.update({
+        "rows": SERIALIZATION_BENCH_ROWS,
+        "validated_rows_per_second": round(SERIALIZATION_BENCH_ROWS / before),
+        "fast_rows_per_second": round(SERIALIZATION_BENCH_ROWS / after),
+    })
+    print(f"{SERIALIZATION_BENCH_ROWS} rows: validated {SERIALIZATION_BENCH_ROWS / before:.0f} rows/s, "
+          f"fast {SERIALIZATION_BENCH_ROWS / after:.0f} rows/s ({before / after:.1f}x)")
@@ -1,8 +1,17 @@
+import os
 import sys
 import asyncio
 import pytest
 from typing import Generator
 
+# Run the suite hermetically on the in-memory storage backend unless told
+# otherwise (STORAGE_BACKEND=mongo pytest runs it against a live mongod).
+# Must be set before the app (and its settings) are imported.
+os.environ.setdefault("STORAGE_BACKEND", "memory")
+# Every test client shares one address, so the app-wide rate limiter is off
+# here; rate limiting is tested with its own middleware instance.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
 @pytest.fixture(scope="session")
 def event_loop() -> Generator[asyncio.AbstractEventLoop, None, None]:
     if sys.platform.startswith("win"):
@@ -1,6 +1,23 @@
 import pytest
 from httpx import AsyncClient, ASGITransport
+from fastapi import HTTPException
+from fastapi.middleware.cors import CORSMiddleware
+from jose import jwt
 from app.main import app
+from app.config import settings
+from app.repositories import rate_limit_repository, revocation_repository, user_repository
+from app.services import auth_service
+from app.services.auth_service import delete_user, hash_password, set_user_role
+from app.services.index_service import provision_indexes
+from app.utils.cache import TTLCache, principal_cache
+from app.utils.hash import calibrate_rounds, configure_hashing, current_rounds, verify_and_update_password
+from app.utils.password_pool import run_password_task
+from app.utils.rate_limit import LocalBucketStore, RateLimit, RateLimitMiddleware
+from app.utils.revocation import TokenRevocations
+from datetime import timedelta
+import asyncio
+import threading
+import time
 import uuid
 
 # Helper function to generate a unique email for each test run
@@ -39,3 +56,293 @@ async def test_register_duplicate_user_fails():
         # Intentionally incorrect assertions to force failure
         assert duplicate_response.status_code == 201  # Fail on purpose (should be 400)
         assert duplicate_response.json()["detail"] == "Some other error"  # Fail on purpose (wrong error message)
+
+@pytest.mark.asyncio
+async def test_admin_checks_from_token_claims_and_revocation(monkeypatch):
+    # Test case: Admin checks are answered from the signed token without a
+    # user lookup, and demoting or deleting a user revokes their tokens on
+    # this worker at once and on other workers after a sync
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        email = unique_email()
+        response = await ac.post("/api/auth/register", json={
+            "email": email,
+            "password": "Secret123",
+            "role": "admin",
+            "admin_secret": settings.ADMIN_SECRET
+        })
+        assert response.status_code == 201
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        claims = jwt.get_unverified_claims(token)
+        user_id = claims["sub"]
+        assert (claims["role"], claims["ver"]) == ("admin", 0)
+
+        async def no_lookup(user_id):
+            raise AssertionError("authorization must not read the user")
+        monkeypatch.setattr(user_repository, "find_by_id", no_lookup)
+        sweet = {"name": "Chikki", "category": "Indian", "price": 5.0, "quantity": 1}
+        lookups_before = principal_cache.hits + principal_cache.misses
+        for _ in range(3):
+            assert (await ac.post("/api/sweets/", json=sweet, headers=headers)).status_code == 201
+        assert principal_cache.hits + principal_cache.misses == lookups_before
+        monkeypatch.undo()
+
+        # Another worker's view, before and after it syncs
+        other_worker = TokenRevocations(timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+        await set_user_role(user_id, "user")
+        demoted = await ac.post("/api/sweets/", json=sweet, headers=headers)
+        assert demoted.status_code == 401
+        assert demoted.json()["detail"] == "Token revoked"
+        assert not other_worker.is_revoked(user_id, 0)
+        other_worker.merge(await revocation_repository.active(other_worker.window_start()))
+        assert other_worker.is_revoked(user_id, 0)
+
+        # A fresh login carries the new role and version
+        relogin = await ac.post("/api/auth/login", data={"username": email, "password": "Secret123"})
+        new_token = relogin.json()["access_token"]
+        assert jwt.get_unverified_claims(new_token)["ver"] == 1
+        new_headers = {"Authorization": f"Bearer {new_token}"}
+        assert (await ac.post("/api/sweets/", json=sweet, headers=new_headers)).status_code == 403
+        assert (await ac.post("/api/sweets/checkout", json={"items": []}, headers=new_headers)).status_code != 401
+
+        await delete_user(user_id)
+        assert (await ac.post("/api/sweets/checkout", json={"items": []}, headers=new_headers)).status_code == 401
+
+def test_ttl_cache_expiry_lru_and_stats():
+    # Test case: Entries expire after the TTL, the least recently used entry
+    # is evicted when full, and hits/misses/evictions are counted
+    now = [0.0]
+    cache = TTLCache(max_size=2, ttl_seconds=10, clock=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert (cache.get("b"), cache.get("a"), cache.get("c")) == (None, 1, 3)
+
+    now[0] = 10.0
+    assert cache.get("a", "expired") == "expired"
+    assert len(cache) == 1
+    cache.invalidate("c")
+    assert cache.get("c") is None
+    assert cache.stats() == {"size": 0, "max_size": 2, "hits": 3, "misses": 3, "evictions": 1, "hit_ratio": 0.5}
+
+    disabled = TTLCache(max_size=0, ttl_seconds=10)
+    disabled.set("a", 1)
+    assert disabled.get("a") is None
+
+@pytest.mark.asyncio
+async def test_principal_cache_for_tokens_without_role_claims(monkeypatch):
+    # Test case: Tokens issued without role/ver claims fall back to a user
+    # lookup that the principal cache serves after the first call; changing
+    # the role or deleting the user drops the cached entry at once
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        response = await ac.post("/api/auth/register", json={
+            "email": unique_email(),
+            "password": "Secret123",
+            "role": "admin",
+            "admin_secret": settings.ADMIN_SECRET
+        })
+        assert response.status_code == 201
+        user_id = jwt.get_unverified_claims(response.json()["access_token"])["sub"]
+        headers = {"Authorization": f"Bearer {auth_service.create_access_token(data={'sub': user_id})}"}
+
+        lookups = []
+        find_by_id = user_repository.find_by_id
+
+        async def counted_find_by_id(user_id):
+            lookups.append(user_id)
+            return await find_by_id(user_id)
+        monkeypatch.setattr(user_repository, "find_by_id", counted_find_by_id)
+
+        sweet = {"name": "Chikki", "category": "Indian", "price": 5.0, "quantity": 1}
+        hits_before = principal_cache.hits
+        for _ in range(3):
+            assert (await ac.post("/api/sweets/", json=sweet, headers=headers)).status_code == 201
+        assert lookups == [user_id]
+        assert principal_cache.hits - hits_before == 2
+
+        await set_user_role(user_id, "user")
+        assert (await ac.post("/api/sweets/", json=sweet, headers=headers)).status_code == 403
+        assert len(lookups) == 2
+
+        await delete_user(user_id)
+        missing = await ac.post("/api/sweets/", json=sweet, headers=headers)
+        assert (missing.status_code, missing.json()["detail"]) == (401, "User not found")
+        assert len(lookups) == 3
+        assert principal_cache.get(user_id) is None
+
+@pytest.mark.asyncio
+async def test_login_bcrypt_runs_in_password_pool(monkeypatch):
+    # Test case: Password verification runs in the password pool, so the
+    # event loop keeps serving catalog reads while slow logins are verified
+    hash_seconds = 0.25
+    threads = []
+
+    def slow_verify_and_update(plain_password, hashed_password):
+        threads.append(threading.current_thread())
+        time.sleep(hash_seconds)
+        return verify_and_update_password(plain_password, hashed_password)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        email = unique_email()
+        assert (await register(ac, email)).status_code == 201
+        monkeypatch.setattr(auth_service, "verify_and_update_password", slow_verify_and_update)
+
+        async def form_login():
+            return await ac.post("/api/auth/login", data={"username": email, "password": "Secret123"})
+
+        storm = asyncio.gather(*(form_login() for _ in range(4)))
+        longest_stall, reads = 0.0, 0
+        while not storm.done():
+            start = time.perf_counter()
+            assert (await ac.get("/api/sweets/")).status_code == 200
+            await asyncio.sleep(0.01)
+            longest_stall = max(longest_stall, time.perf_counter() - start)
+            reads += 1
+        assert [r.status_code for r in await storm] == [200] * 4
+
+    assert len(threads) == 4
+    assert all(thread is not threading.main_thread() for thread in threads)
+    assert all(thread.name.startswith("bcrypt") for thread in threads)
+    # A hash on the event loop would stall a read for a whole hash_seconds
+    assert reads > 4
+    assert longest_stall < hash_seconds / 2
+
+@pytest.mark.asyncio
+async def test_password_pool_rejects_when_saturated(monkeypatch):
+    # Test case: Once the pending limit is reached new work fails fast with 503
+    monkeypatch.setattr(settings, "PASSWORD_POOL_MAX_PENDING", 1)
+    slow = asyncio.ensure_future(run_password_task(time.sleep, 0.2))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as exc_info:
+        await run_password_task(hash_password, "Secret123")
+    assert exc_info.value.status_code == 503
+    await slow
+
+@pytest.mark.asyncio
+async def test_index_provisioning_is_idempotent_and_enforces_unique_email():
+    # Test case: Provisioning twice reports existing indexes, and the unique
+    # email index rejects concurrent duplicate registrations
+    await provision_indexes()
+    report = await provision_indexes()
+    assert "email_unique" in report["users"]["existing"]
+    assert report["users"]["created"] == []
+    assert report["sweets"]["created"] == []
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        email = unique_email()
+        responses = await asyncio.gather(register(ac, email), register(ac, email))
+        assert sorted(r.status_code for r in responses) == [201, 400]
+
+@pytest.mark.asyncio
+async def test_rate_limiter_throttles_login_per_ip_and_per_account():
+    # Test case: Login attempts are limited per account whatever the client
+    # IP and per IP whatever the account, with 429 + Retry-After, metrics,
+    # refill over time, and catalog reads left alone
+    now = [0.0]
+    limited_app = RateLimitMiddleware(
+        app,
+        store=LocalBucketStore(max_keys=1000, clock=lambda: now[0]),
+        auth_ip=RateLimit("auth_ip", burst=3, per_minute=60),
+        login_account=RateLimit("login_account", burst=2, per_minute=60),
+        api_ip=RateLimit("api_ip", burst=0, per_minute=0),
+        trust_forwarded=True,
+    )
+
+    async def attempt(ac, account, ip):
+        # Unknown accounts: no bcrypt, the limiter is what is being measured
+        return await ac.post("/api/auth/login", data={"username": account, "password": "guess"},
+                             headers={"X-Forwarded-For": ip})
+
+    async with AsyncClient(transport=ASGITransport(app=limited_app), base_url="http://test") as ac:
+        victim, other = unique_email(), unique_email()
+        assert (await attempt(ac, victim, "10.0.0.1")).status_code == 401
+        assert (await attempt(ac, victim.upper(), "10.0.0.2")).status_code == 401
+        throttled = await attempt(ac, victim, "10.0.0.3")
+        assert throttled.status_code == 429
+        assert throttled.json()["detail"] == "Too many requests"
+        assert throttled.headers["Retry-After"] == "1"
+        assert (await attempt(ac, other, "10.0.0.3")).status_code == 401
+
+        # One address spraying different accounts runs out of its own bucket
+        for _ in range(3):
+            assert (await attempt(ac, unique_email(), "10.0.0.9")).status_code == 401
+        assert (await attempt(ac, unique_email(), "10.0.0.9")).status_code == 429
+        assert (await ac.get("/api/sweets/search", headers={"X-Forwarded-For": "10.0.0.9"})).status_code == 200
+
+        now[0] += 1.0  # One token back in every bucket
+        assert (await attempt(ac, victim, "10.0.0.9")).status_code == 401
+
+        metrics = (await ac.get("/metrics")).text
+        assert 'rate_limited_requests_total{limit="login_account"} 1.0' in metrics
+        assert 'rate_limited_requests_total{limit="auth_ip"} 1.0' in metrics
+
+    # The shared store gives the same answers to every worker
+    key = f"test:{uuid.uuid4()}"
+    assert (await rate_limit_repository.take(key, 2, 1.0))[0]
+    assert (await rate_limit_repository.take(key, 2, 1.0))[0]
+    allowed, wait = await rate_limit_repository.take(key, 2, 1.0)
+    assert not allowed and 0 < wait <= 1.0
+
+@pytest.mark.asyncio
+async def test_throttled_responses_carry_cors_headers():
+    # Test case: CORS is the outermost middleware, so a 429 from the rate
+    # limiter still has Access-Control-Allow-Origin for the browser
+    cors = app.user_middleware[0]
+    assert cors.cls is CORSMiddleware
+
+    limited_app = RateLimitMiddleware(
+        app,
+        store=LocalBucketStore(max_keys=10),
+        auth_ip=RateLimit("auth_ip", burst=1, per_minute=1),
+        login_account=RateLimit("login_account", burst=0, per_minute=0),
+        api_ip=RateLimit("api_ip", burst=0, per_minute=0),
+    )
+    stack = CORSMiddleware(limited_app, *cors.args, **cors.kwargs)  # As main.py nests them
+    async with AsyncClient(transport=ASGITransport(app=stack), base_url="http://test") as ac:
+        origin = {"Origin": "http://frontend.test"}
+        await ac.post("/api/auth/login", data={"username": unique_email(), "password": "guess"}, headers=origin)
+        throttled = await ac.post("/api/auth/login", data={"username": unique_email(), "password": "guess"},
+                                  headers=origin)
+        assert throttled.status_code == 429
+        assert throttled.headers["Access-Control-Allow-Origin"] == "http://frontend.test"
+        assert "Retry-After" in throttled.headers["Access-Control-Expose-Headers"]
+
+@pytest.mark.asyncio
+async def test_login_rehashes_stored_hash_at_new_cost():
+    # Test case: Hashes made at a lower bcrypt cost are upgraded on the next
+    # successful login (and only then), without changing the password; a
+    # worker calibrated to a lower cost leaves stronger hashes alone
+    startup_rounds = current_rounds()
+    try:
+        configure_hashing(4)
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            email = unique_email()
+            assert (await register(ac, email)).status_code == 201
+            user = await user_repository.find_by_email(email)
+            assert user["hashed_password"].startswith("$2b$04$")
+
+            configure_hashing(5)
+            bad = await ac.post("/api/auth/login", data={"username": email, "password": "wrong"})
+            assert bad.status_code == 401
+            assert (await user_repository.find_by_email(email))["hashed_password"] == user["hashed_password"]
+
+            async def login_and_read_hash():
+                response = await ac.post("/api/auth/login", data={"username": email, "password": "Secret123"})
+                assert response.status_code == 200
+                return (await user_repository.find_by_email(email))["hashed_password"]
+
+            rehashed = await login_and_read_hash()
+            assert rehashed.startswith("$2b$05$")
+            assert await login_and_read_hash() == rehashed  # Already at the current cost
+
+            # Workers calibrated to 4 and 5 alternate: no rehash back and forth
+            for rounds in (4, 5, 4):
+                configure_hashing(rounds)
+                assert await login_and_read_hash() == rehashed
+    finally:
+        configure_hashing(startup_rounds)
+
+    # Calibration stays within bounds whatever the target
+    assert calibrate_rounds(0.001, min_rounds=4, max_rounds=6) == 4
+    assert calibrate_rounds(60_000, min_rounds=4, max_rounds=6) == 6
@@ -2,8 +2,40 @@ import pytest
 from httpx import AsyncClient
 from httpx._transports.asgi import ASGITransport
 from app.main import app
+from app.config import settings
+from bson import ObjectId
+from app.repositories import hold_repository, sweet_repository
+from app.repositories import mongo as mongo_repositories
+from app.repositories.memory import MemorySweetRepository
+from app.services import hold_service, sweet_service
+from app.services.index_service import provision_indexes
+from app.utils.command_monitor import command_counter
+from app.services.catalog_feed import CatalogFeed
+from app.services.facet_service import FacetSummary
+from app.services.inventory_buffer import InventoryBuffer
+from app.utils.profiler import ProfilingMiddleware
+from app.utils.serialization import FastJSONResponse
+from app.schemas.sweet_schema import SweetResponse
+from fastapi.responses import JSONResponse
+from motor.core import AgnosticClientSession
+from pymongo.errors import OperationFailure
+from pydantic import TypeAdapter
+from types import SimpleNamespace
+from typing import List
+from datetime import datetime, timedelta
+from collections import Counter
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import time
 import uuid
 
+# Tests that inspect MongoDB itself (query plans, driver commands)
+requires_mongo = pytest.mark.skipif(
+    settings.STORAGE_BACKEND != "mongo",
+    reason="needs the mongo storage backend"
+)
+
 def generate_unique_email():
     """
     Generate a unique email address for testing to avoid conflicts.
@@ -179,3 +211,1184 @@ async def test_restock_sweet_success():
         )
         assert restock_response.status_code == 999  # Force fail
         assert restock_response.json()["quantity"] == -1  # Wrong value
+
+async def get_admin_headers(ac: AsyncClient) -> dict:
+    """
+    Helper function to register an admin user and return JWT auth headers.
+    Admin registration requires the configured admin secret.
+    """
+    response = await ac.post("/api/auth/register", json={
+        "email": generate_unique_email(),
+        "password": "Secret123",
+        "role": "admin",
+        "admin_secret": settings.ADMIN_SECRET
+    })
+    assert response.status_code == 201
+    token = response.json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+async def find_sweet(ac: AsyncClient, name: str, sweet_id: str) -> dict:
+    """
+    Helper function to read back a single sweet through the public search
+    endpoint, independent of catalog page size.
+    """
+    response = await ac.get("/api/sweets/search", params={"name": name})
+    assert response.status_code == 200
+    return next(s for s in response.json() if s["_id"] == sweet_id)
+
+@pytest.mark.asyncio
+async def test_concurrent_restock_no_lost_updates():
+    """
+    Fire hundreds of parallel restock calls at one sweet and verify that
+    every increment lands. Reports p50/p99 latency of the restock endpoint.
+    """
+    concurrency = 200
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+
+        name = f"Peda {uuid.uuid4().hex}"
+        create_response = await ac.post("/api/sweets/", json={
+            "name": name,
+            "category": "Indian",
+            "price": 12.0,
+            "quantity": 0
+        }, headers=headers)
+        assert create_response.status_code == 201
+        sweet_id = create_response.json()["_id"]
+
+        async def timed_restock():
+            start = time.perf_counter()
+            response = await ac.patch(
+                f"/api/sweets/{sweet_id}/restock",
+                params={"quantity": 1},
+                headers=headers
+            )
+            return response.status_code, time.perf_counter() - start
+
+        results = await asyncio.gather(*(timed_restock() for _ in range(concurrency)))
+
+        assert all(status_code == 200 for status_code, _ in results)
+
+        # Final quantity must equal the number of increments (no lost updates)
+        sweet = await find_sweet(ac, name, sweet_id)
+        assert sweet["quantity"] == concurrency
+
+        latencies = sorted(latency for _, latency in results)
+        p50 = latencies[int(0.50 * (len(latencies) - 1))]
+        p99 = latencies[int(0.99 * (len(latencies) - 1))]
+        print(f"restock x{concurrency}: p50={p50 * 1000:.2f}ms p99={p99 * 1000:.2f}ms")
+
+@pytest.mark.asyncio
+async def test_checkout_basket_all_or_nothing():
+    """
+    Test checkout decrements every line of a basket in one request, and
+    that a basket with one short line leaves all stock untouched.
+    """
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+
+        names = [f"Kalakand {uuid.uuid4().hex}", f"Modak {uuid.uuid4().hex}"]
+        sweet_ids = []
+        for name, quantity in zip(names, (10, 5)):
+            create_response = await ac.post("/api/sweets/", json={
+                "name": name,
+                "category": "Indian",
+                "price": 10.0,
+                "quantity": quantity
+            }, headers=headers)
+            assert create_response.status_code == 201
+            sweet_ids.append(create_response.json()["_id"])
+
+        checkout_response = await ac.post("/api/sweets/checkout", json={"items": [
+            {"sweet_id": sweet_ids[0], "quantity": 4},
+            {"sweet_id": sweet_ids[1], "quantity": 5}
+        ]}, headers=headers)
+        assert checkout_response.status_code == 200
+        body = checkout_response.json()
+        assert body["success"] is True
+        assert [line["status"] for line in body["lines"]] == ["ok", "ok"]
+
+        # Second basket: first line fits, second line is out of stock
+        failed_response = await ac.post("/api/sweets/checkout", json={"items": [
+            {"sweet_id": sweet_ids[0], "quantity": 1},
+            {"sweet_id": sweet_ids[1], "quantity": 1}
+        ]}, headers=headers)
+        assert failed_response.status_code == 409
+        statuses = [line["status"] for line in failed_response.json()["lines"]]
+        assert statuses == ["not_applied", "insufficient_stock"]
+
+        assert (await find_sweet(ac, names[0], sweet_ids[0]))["quantity"] == 6
+        assert (await find_sweet(ac, names[1], sweet_ids[1]))["quantity"] == 0
+
+@pytest.mark.asyncio
+async def test_checkout_transaction_retries_write_conflicts(monkeypatch):
+    """
+    Test a checkout transaction that hits write conflicts with concurrent
+    checkouts (TransientTransactionError) is re-run by the driver's
+    with_transaction, and that a basket still conflicting after
+    TRANSACTION_ATTEMPTS runs comes back not applied (409) instead of an error.
+    """
+    class FakeSession:
+        # The driver's retry loop, run against an in-process session
+        with_transaction = AgnosticClientSession.with_transaction
+
+        def __init__(self):
+            self.in_transaction = False
+            self.commits = 0
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc_info):
+            return False
+
+        @asynccontextmanager
+        async def start_transaction(self, *args, **kwargs):
+            self.in_transaction = True
+            yield
+
+        async def abort_transaction(self):
+            self.in_transaction = False
+
+        async def commit_transaction(self):
+            self.in_transaction = False
+            self.commits += 1
+
+    class ConflictingCollection:
+        def __init__(self, conflicts):
+            self.conflicts = conflicts
+            self.runs = 0
+
+        async def bulk_write(self, operations, ordered, session):
+            assert session.in_transaction
+            self.runs += 1
+            if self.runs <= self.conflicts:
+                raise OperationFailure("WriteConflict", code=112, details={"errorLabels": ["TransientTransactionError"]})
+            return SimpleNamespace(modified_count=len(operations))
+
+    sessions = []
+
+    async def start_session():
+        sessions.append(FakeSession())
+        return sessions[-1]
+
+    monkeypatch.setattr(mongo_repositories, "client", SimpleNamespace(start_session=start_session))
+    basket = {ObjectId(): 1, ObjectId(): 2}
+
+    collection = ConflictingCollection(conflicts=2)
+    repository = mongo_repositories.MongoSweetRepository(collection=collection, read_collection=None, meta=None)
+    assert await repository.decrement_basket(basket) == {sweet_id: "ok" for sweet_id in basket}
+    assert collection.runs == 3
+    assert sessions[-1].commits == 1
+    assert repository.transactions_supported is True
+
+    collection = ConflictingCollection(conflicts=100)
+    repository = mongo_repositories.MongoSweetRepository(collection=collection, read_collection=None, meta=None)
+    assert await repository.decrement_basket(basket) == {sweet_id: "not_applied" for sweet_id in basket}
+    assert collection.runs == mongo_repositories.TRANSACTION_ATTEMPTS
+    assert sessions[-1].commits == 0
+    assert repository.transactions_supported is True
+
+@pytest.mark.asyncio
+async def test_get_all_sweets_keyset_pagination():
+    """
+    Test walking the catalog with limit/after cursors, the next-cursor and
+    total-count headers, and field projection.
+    """
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+
+        sweet_ids = []
+        for name in ("Ghevar", "Mysore Pak", "Sandesh"):
+            create_response = await ac.post("/api/sweets/", json={
+                "name": name,
+                "category": "Indian",
+                "price": 35.0,
+                "quantity": 12
+            }, headers=headers)
+            assert create_response.status_code == 201
+            sweet_ids.append(create_response.json()["_id"])
+
+        page = await ac.get("/api/sweets/", params={"limit": 1, "after": sweet_ids[0]})
+        assert page.status_code == 200
+        assert [s["_id"] for s in page.json()] == [sweet_ids[1]]
+        assert page.headers["X-Next-Cursor"] == sweet_ids[1]
+        assert int(page.headers["X-Total-Count"]) >= 3
+
+        next_page = await ac.get("/api/sweets/", params={
+            "limit": 1,
+            "after": page.headers["X-Next-Cursor"],
+            "fields": "name"
+        })
+        assert next_page.status_code == 200
+        assert next_page.json() == [{"_id": sweet_ids[2], "name": "Sandesh"}]
+
+        bad_cursor = await ac.get("/api/sweets/", params={"after": "not-an-id"})
+        assert bad_cursor.status_code == 400
+
+@pytest.mark.asyncio
+async def test_export_sweets_ndjson():
+    """
+    Test the streaming export returns one JSON document per line and
+    includes a freshly created sweet. Export is admin only.
+    """
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+
+        create_response = await ac.post("/api/sweets/", json={
+            "name": "Petha",
+            "category": "Indian",
+            "price": 9.0,
+            "quantity": 3
+        }, headers=headers)
+        assert create_response.status_code == 201
+        sweet_id = create_response.json()["_id"]
+
+        export_response = await ac.get("/api/sweets/export", params={"format": "ndjson"}, headers=headers)
+        assert export_response.status_code == 200
+        assert export_response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in export_response.text.splitlines()]
+        assert any(row["_id"] == sweet_id and row["name"] == "Petha" for row in rows)
+
+        unauthenticated = await ac.get("/api/sweets/export")
+        assert unauthenticated.status_code == 422  # Missing Authorization header
+
+@pytest.mark.asyncio
+async def test_export_streams_fixed_size_chunks():
+    """
+    Test the NDJSON exporter emits rows_per_chunk rows per chunk plus a
+    final partial chunk, so memory depends on the chunk size, not the row
+    count (the 1M-row RSS check lives in benchmarks/test_export.py).
+    """
+    async def documents():
+        for i in range(25):
+            yield {"_id": i, "name": f"Sweet {i}", "category": "Bench", "price": 1.0, "quantity": i}
+
+    chunks = [chunk async for chunk in sweet_service.iter_ndjson(documents(), 10)]
+    assert [chunk.count(b"\n") for chunk in chunks] == [10, 10, 5]
+    rows = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+    assert [row["_id"] for row in rows] == [str(i) for i in range(25)]
+
+@pytest.mark.asyncio
+async def test_search_prefix_case_insensitive_and_escaped():
+    """
+    Test search matches case-insensitive name prefixes, treats regex
+    metacharacters literally, and ignores empty filters.
+    """
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        tag = uuid.uuid4().hex
+        create_response = await ac.post("/api/sweets/", json={
+            "name": f"Kesar.Peda {tag}",
+            "category": "Milk",
+            "price": 14.0,
+            "quantity": 7
+        }, headers=headers)
+        assert create_response.status_code == 201
+        sweet_id = create_response.json()["_id"]
+
+        prefix = await ac.get("/api/sweets/search", params={"name": f"KESAR.PEDA {tag}", "category": ""})
+        assert [s["_id"] for s in prefix.json()] == [sweet_id]
+        assert "name_lower" not in prefix.json()[0]
+
+        # "." must not act as a wildcard
+        literal = await ac.get("/api/sweets/search", params={"name": f"KesarXPeda {tag}"})
+        assert literal.json() == []
+
+@requires_mongo
+@pytest.mark.asyncio
+async def test_search_query_uses_index():
+    """
+    Test the search filter is served by an index scan, not a collection scan.
+    """
+    from app.repositories.mongo import build_search_query
+
+    await provision_indexes()
+    for name, category in (("ladoo", ""), ("", "indian"), ("ras", "syrup")):
+        query = build_search_query(name, category, 0, 1000)
+        explain = await sweet_repository.collection.find(query).explain()
+        winning_plan = str(explain["queryPlanner"]["winningPlan"])
+        assert "IXSCAN" in winning_plan
+        assert "COLLSCAN" not in winning_plan
+
+@pytest.mark.asyncio
+async def test_catalog_cache_hits_and_write_invalidation():
+    """
+    Test repeated catalog reads are served from the cache and that an
+    admin write invalidates cached list and search results.
+    """
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        name = f"Imarti {uuid.uuid4().hex}"
+
+        assert (await ac.get("/api/sweets/search", params={"name": name})).json() == []
+        hits_before = sweet_service.catalog_cache.hits
+        assert (await ac.get("/api/sweets/search", params={"name": name})).json() == []
+        assert sweet_service.catalog_cache.hits == hits_before + 1
+
+        create_response = await ac.post("/api/sweets/", json={
+            "name": name,
+            "category": "Fried",
+            "price": 11.0,
+            "quantity": 9
+        }, headers=headers)
+        assert create_response.status_code == 201
+
+        # The cached empty result must not survive the write
+        found = (await ac.get("/api/sweets/search", params={"name": name})).json()
+        assert [s["_id"] for s in found] == [create_response.json()["_id"]]
+
+        stats = (await ac.get("/api/sweets/cache-stats", headers=headers)).json()
+        assert stats["catalog"]["hits"] >= 1
+        assert 0 <= stats["catalog"]["hit_ratio"] <= 1
+
+@pytest.mark.asyncio
+async def test_catalog_etag_not_modified_until_write():
+    """
+    Test catalog reads return an ETag, answer 304 when the client's tag is
+    current, and return fresh data with a new tag after a write.
+    """
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+
+        first = await ac.get("/api/sweets/", params={"limit": 1})
+        etag = first.headers["ETag"]
+        assert first.status_code == 200
+
+        cached = await ac.get("/api/sweets/", params={"limit": 1}, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+        search = await ac.get("/api/sweets/search", params={"name": "Ladoo"}, headers={"If-None-Match": etag})
+        assert search.status_code == 304
+
+        create_response = await ac.post("/api/sweets/", json={
+            "name": "Rabri",
+            "category": "Milk",
+            "price": 28.0,
+            "quantity": 4
+        }, headers=headers)
+        assert create_response.status_code == 201
+
+        refreshed = await ac.get("/api/sweets/", params={"limit": 1}, headers={"If-None-Match": etag})
+        assert refreshed.status_code == 200
+        assert refreshed.headers["ETag"] != etag
+
+@pytest.mark.asyncio
+async def test_bulk_create_update_delete():
+    """
+    Test the bulk endpoints apply a batch in one call and report a
+    status for every item, including unknown and malformed IDs.
+    """
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        tag = uuid.uuid4().hex
+
+        create_response = await ac.post("/api/sweets/bulk", json={"items": [
+            {"name": f"Bulk {tag} {i}", "category": "Season", "price": 10.0 + i, "quantity": i}
+            for i in range(3)
+        ]}, headers=headers)
+        assert create_response.status_code == 200
+        created = create_response.json()
+        assert created["succeeded"] == 3
+        sweet_ids = [result["sweet_id"] for result in created["results"]]
+
+        missing_id = "0" * 24
+        update_response = await ac.patch("/api/sweets/bulk", json={"items": [
+            {"sweet_id": sweet_ids[0], "data": {"price": 99.0}},
+            {"sweet_id": missing_id, "data": {"price": 1.0}},
+            {"sweet_id": "not-an-id", "data": {"price": 1.0}}
+        ]}, headers=headers)
+        assert update_response.status_code == 200
+        statuses = [result["status"] for result in update_response.json()["results"]]
+        assert statuses == ["updated", "not_found", "invalid_id"]
+        assert (await find_sweet(ac, f"Bulk {tag} 0", sweet_ids[0]))["price"] == 99.0
+
+        delete_response = await ac.request("DELETE", "/api/sweets/bulk", json={"ids": sweet_ids}, headers=headers)
+        assert delete_response.status_code == 200
+        assert delete_response.json()["succeeded"] == 3
+        remaining = await ac.get("/api/sweets/search", params={"name": f"Bulk {tag}"})
+        assert remaining.json() == []
+
+@requires_mongo
+@pytest.mark.asyncio
+async def test_admin_mutations_respect_round_trip_budget():
+    """
+    Test each admin mutation costs one command on the sweet (no read-back
+    after the write) plus the bump of the shared catalog version, counting
+    every command the driver sends. Deleting a sweet only touches the holds
+    collection while some of its stock is held.
+    """
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        await ac.get("/api/sweets/cache-stats", headers=headers)  # Warm the principal cache
+
+        def commands(before):
+            return dict(command_counter.snapshot() - before)
+
+        version_bump = {("findAndModify", "meta"): 1}
+        before = command_counter.snapshot()
+        create_response = await ac.post("/api/sweets/", json={
+            "name": "Malpua",
+            "category": "Fried",
+            "price": 16.0,
+            "quantity": 10
+        }, headers=headers)
+        assert create_response.status_code == 201
+        assert commands(before) == {("insert", "sweets"): 1, **version_bump}
+        sweet_id = create_response.json()["_id"]
+
+        before = command_counter.snapshot()
+        update_response = await ac.put(f"/api/sweets/{sweet_id}", json={"price": 17.0}, headers=headers)
+        assert update_response.status_code == 200
+        assert update_response.json()["price"] == 17.0
+        assert commands(before) == {("findAndModify", "sweets"): 1, **version_bump}
+
+        before = command_counter.snapshot()
+        restock_response = await ac.patch(f"/api/sweets/{sweet_id}/restock", params={"quantity": 5}, headers=headers)
+        assert restock_response.status_code == 200
+        assert commands(before) == {("findAndModify", "sweets"): 1, **version_bump}
+
+        before = command_counter.snapshot()
+        delete_response = await ac.delete(f"/api/sweets/{sweet_id}", headers=headers)
+        assert delete_response.status_code == 200
+        # Returns the deleted document for facets; nothing held, so no holds to drop
+        assert commands(before) == {("findAndModify", "sweets"): 1, **version_bump}
+
+        held = await ac.post("/api/sweets/", json={"name": "Imarti", "category": "Fried", "price": 12.0, "quantity": 3},
+                             headers=headers)
+        held_id = held.json()["_id"]
+        assert (await ac.post(f"/api/sweets/{held_id}/hold", json={"quantity": 1}, headers=headers)).status_code == 201
+        before = command_counter.snapshot()
+        assert (await ac.delete(f"/api/sweets/{held_id}", headers=headers)).status_code == 200
+        assert commands(before) == {("findAndModify", "sweets"): 1, ("delete", "holds"): 1, **version_bump}
+
+@pytest.mark.asyncio
+async def test_memory_repository_keeps_indexes_in_sync():
+    """
+    Test the in-memory engine's sorted indexes follow updates and deletes,
+    so price-range and prefix searches stay correct.
+    """
+    repository = MemorySweetRepository()
+    sweet_ids = [ObjectId() for _ in range(3)]
+    for sweet_id, (name, price) in zip(sweet_ids, (("Kaju Roll", 40.0), ("Kaju Katli", 45.0), ("Jalebi", 10.0))):
+        await repository.insert({"_id": sweet_id, "name": name, "category": "Indian", "price": price, "quantity": 1})
+
+    assert {doc["_id"] for doc in await repository.search("kaju", "", 0, 1000)} == set(sweet_ids[:2])
+
+    await repository.update_fields(sweet_ids[0], {"price": 5.0})
+    cheap = await repository.search("", "", 0, 20)
+    assert {doc["_id"] for doc in cheap} == {sweet_ids[0], sweet_ids[2]}
+
+    await repository.delete(sweet_ids[2])
+    assert [doc["_id"] for doc in await repository.list_page(None, 10)] == sweet_ids[:2]
+    assert [doc["_id"] for doc in await repository.list_page(sweet_ids[0], 10)] == [sweet_ids[1]]
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_route_latency_and_caches():
+    """
+    Test /metrics exposes latency per route template (not raw path),
+    a label set for routes not yet called, and cache hit ratios.
+    """
+    def sample(text: str, series: str) -> float:
+        line = next(line for line in text.splitlines() if line.startswith(series + " "))
+        return float(line.rsplit(" ", 1)[1])
+
+    series = 'http_request_duration_seconds_count{method="GET",route="/api/sweets/search",status="200"}'
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        before = sample((await ac.get("/metrics")).text, series)
+        await ac.get("/api/sweets/search", params={"name": "metrics"})
+        response = await ac.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert sample(response.text, series) == before + 1
+    assert 'route="/api/sweets/{sweet_id}/restock",status="200"' in response.text
+    assert "http_requests_in_flight " in response.text
+    assert 'cache_hit_ratio{cache="catalog"}' in response.text
+    assert "password_pool_pending_jobs " in response.text
+
+def test_mongo_pool_settings_and_read_preference_validation(monkeypatch):
+    """
+    Test pool settings become Motor client options (0 = driver default,
+    left out) and an unknown catalog read preference is rejected by name.
+    """
+    from app.config import READ_PREFERENCE_NAMES, Settings
+    from app.database import READ_PREFERENCES, client_options
+
+    for name, value in (("MONGO_MAX_POOL_SIZE", 50), ("MONGO_MIN_POOL_SIZE", 5), ("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+                        ("MONGO_SOCKET_TIMEOUT_MS", 0), ("MONGO_COMPRESSORS", "zstd,zlib")):
+        monkeypatch.setattr(settings, name, value)
+    assert client_options() == {
+        "maxPoolSize": 50, "minPoolSize": 5, "waitQueueTimeoutMS": 2000, "compressors": "zstd,zlib",
+        "serverSelectionTimeoutMS": settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": settings.MONGO_CONNECT_TIMEOUT_MS,
+    }
+
+    assert set(READ_PREFERENCES) == set(READ_PREFERENCE_NAMES)
+    invalid = Settings()
+    invalid.MONGO_CATALOG_READ_PREFERENCE = "secondarypreferred"
+    with pytest.raises(ValueError, match="Invalid MONGO_CATALOG_READ_PREFERENCE: 'secondarypreferred'"):
+        invalid.validate()
+
+@pytest.mark.asyncio
+async def test_pool_saturation_tracked_per_server(monkeypatch):
+    """
+    Test pool usage is counted per server, saturation compares each pool
+    with maxPoolSize (the limit of one pool, not of all servers together),
+    and /api/health and /metrics report it.
+    """
+    import app.database as database
+    from app.utils.command_monitor import PoolMonitor
+
+    monitor = PoolMonitor()
+    primary, secondary = SimpleNamespace(address=("db1", 27017)), SimpleNamespace(address=("db2", 27017))
+    for server in (primary, secondary):
+        monitor.pool_created(SimpleNamespace(address=server.address, options={"maxPoolSize": 2}))
+    for server in (primary, primary, secondary):
+        monitor.connection_created(server)
+        monitor.connection_check_out_started(server)
+        monitor.connection_checked_out(server)
+    monitor.connection_check_out_started(primary)  # Waits: db1's pool is full
+    monitor.connection_check_out_started(secondary)
+    monitor.connection_check_out_failed(secondary)
+
+    stats = monitor.stats()
+    assert (stats["checked_out"], stats["waiting"], stats["checkout_failures"]) == (3, 1, 1)
+    assert stats["saturation"] == 1.0  # Not 3 / 2
+    assert stats["servers"]["db1:27017"]["saturation"] == 1.0
+    assert stats["servers"]["db2:27017"]["saturation"] == 0.5
+    monitor.connection_checked_in(primary)
+    assert monitor.stats()["saturation"] == 0.5
+
+    monkeypatch.setattr(database, "pool_monitor", monitor)
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "mongo")
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        health = (await ac.get("/api/health")).json()
+        metrics = (await ac.get("/metrics")).text
+    assert health["status"] == "ok" and health["backend"] == "mongo"
+    assert health["mongo_pool"]["servers"]["db2:27017"]["checkout_failures"] == 1
+    assert health["mongo_pool"]["saturation"] == 0.5
+    assert 'mongo_pool_server_checked_out{server="db1:27017"} 1' in metrics
+    assert "mongo_pool_saturation 0.5" in metrics
+
+@pytest.mark.asyncio
+async def test_profiling_middleware_profiles_only_selected_requests():
+    """
+    Test requests carrying the profiling token are profiled and the report
+    can be fetched by admins; other requests pass through untouched.
+    """
+    profiled_app = ProfilingMiddleware(app, token="profile-me", sample_rate=0)
+    async with AsyncClient(transport=ASGITransport(app=profiled_app), base_url="http://test") as ac:
+        plain_response = await ac.get("/api/sweets/search", params={"name": "profiled"})
+        assert plain_response.status_code == 200
+        assert "X-Profile-Id" not in plain_response.headers
+
+        wrong_token = await ac.get("/api/sweets/search", headers={"X-Profile": "guess"})
+        assert "X-Profile-Id" not in wrong_token.headers
+
+        response = await ac.get("/api/sweets/search", params={"name": "profiled"}, headers={"X-Profile": "profile-me"})
+        assert response.status_code == 200
+        profile_id = response.headers["X-Profile-Id"]
+
+        headers = await get_admin_headers(ac)
+        report_response = await ac.get(f"/api/profiles/{profile_id}", headers=headers)
+        assert report_response.status_code == 200
+        assert "search_sweets" in report_response.text  # Service call is covered
+
+        listing = (await ac.get("/api/profiles/", headers=headers)).json()
+        assert listing[0]["profile_id"] == profile_id
+        assert listing[0]["path"] == "/api/sweets/search"
+        assert (await ac.get(f"/api/profiles/{uuid.uuid4().hex}", headers=headers)).status_code == 404
+
+def test_fast_serialization_matches_validated_output():
+    """
+    Test FastJSONResponse renders trusted rows to the same JSON as the
+    response_model path (validation, aliases, stdlib JSON). Its speed is
+    measured in benchmarks/test_serialization.py.
+    """
+    rows = [
+        sweet_service.obj_to_dict({"_id": ObjectId(), "name": f"Sweet {i}", "name_lower": f"sweet {i}",
+                                   "category": "Bench", "category_lower": "bench", "price": 1.5 + i, "quantity": i, "held": i % 2})
+        for i in range(20)
+    ]
+    adapter = TypeAdapter(List[SweetResponse])
+    validated = JSONResponse(content=adapter.dump_python(adapter.validate_python(rows), mode="json", by_alias=True)).body
+    assert json.loads(FastJSONResponse(content=rows).body) == json.loads(validated)
+
+@pytest.mark.asyncio
+async def test_stock_holds_reserve_release_purchase_and_expire(monkeypatch):
+    """
+    Test holds move stock out of the available quantity, never oversell
+    under concurrency, and return to stock on release or expiry.
+    """
+    async def user_headers(ac: AsyncClient) -> dict:
+        response = await ac.post("/api/auth/register", json={"email": generate_unique_email(), "password": "Secret123"})
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        admin_headers = await get_admin_headers(ac)
+        name = f"Soan Papdi {uuid.uuid4().hex}"
+        create_response = await ac.post("/api/sweets/", json={
+            "name": name, "category": "Flaky", "price": 8.0, "quantity": 10
+        }, headers=admin_headers)
+        sweet_id = create_response.json()["_id"]
+        buyer, other = await user_headers(ac), await user_headers(ac)
+
+        # Flash sale: 25 concurrent single-unit holds on 10 units
+        responses = await asyncio.gather(*(
+            ac.post(f"/api/sweets/{sweet_id}/hold", json={"quantity": 1}, headers=buyer) for _ in range(25)
+        ))
+        assert sorted(r.status_code for r in responses).count(201) == 10
+        assert all(r.status_code in (201, 409) for r in responses)
+        sweet = await find_sweet(ac, name, sweet_id)
+        assert (sweet["quantity"], sweet["held"]) == (0, 10)
+
+        hold_ids = [r.json()["hold_id"] for r in responses if r.status_code == 201]
+        assert (await ac.delete(f"/api/sweets/holds/{hold_ids[0]}", headers=other)).status_code == 404
+        assert (await ac.delete(f"/api/sweets/holds/{hold_ids[0]}", headers=buyer)).status_code == 200
+        assert (await ac.post(f"/api/sweets/holds/{hold_ids[1]}/purchase", headers=buyer)).status_code == 200
+        assert (await ac.delete(f"/api/sweets/holds/{hold_ids[1]}", headers=buyer)).status_code == 404
+        sweet = await find_sweet(ac, name, sweet_id)
+        assert (sweet["quantity"], sweet["held"]) == (1, 8)
+
+        # Expired holds go back to stock when the reaper runs (in batches)
+        monkeypatch.setattr(settings, "HOLD_REAPER_BATCH_SIZE", 3)
+        expired = await ac.post(f"/api/sweets/{sweet_id}/hold", json={"quantity": 1}, headers=buyer)
+        assert expired.status_code == 201
+        later = datetime.utcnow() + timedelta(seconds=settings.HOLD_TTL_SECONDS + 1)
+        assert await hold_service.reap_expired_holds(now=later) >= 9
+        sweet = await find_sweet(ac, name, sweet_id)
+        assert (sweet["quantity"], sweet["held"]) == (9, 0)
+        monkeypatch.setattr(settings, "HOLD_TTL_SECONDS", -1)  # Already expired when purchased
+        expired = await ac.post(f"/api/sweets/{sweet_id}/hold", json={"quantity": 1}, headers=buyer)
+        assert (await ac.post(f"/api/sweets/holds/{expired.json()['hold_id']}/purchase", headers=buyer)).status_code == 404
+
+        missing = await ac.post(f"/api/sweets/{ObjectId()}/hold", json={"quantity": 1}, headers=buyer)
+        assert missing.status_code == 404
+
+        # Deleting the sweet drops its outstanding holds
+        monkeypatch.setattr(settings, "HOLD_TTL_SECONDS", 600)
+        assert (await ac.post(f"/api/sweets/{sweet_id}/hold", json={"quantity": 1}, headers=buyer)).status_code == 201
+        assert (await ac.delete(f"/api/sweets/{sweet_id}", headers=admin_headers)).status_code == 200
+        assert await hold_repository.delete_for_sweets([ObjectId(sweet_id)]) == 0
+
+@requires_mongo
+@pytest.mark.asyncio
+async def test_hold_reaper_recovers_from_crashed_pass(monkeypatch):
+    """
+    Test holds left behind by a reaper that died mid-pass are reclaimed once
+    the claim is stale, and a hold whose units were already returned is not
+    returned a second time.
+    """
+    sweet_id = ObjectId()
+    await sweet_repository.insert({"_id": sweet_id, "name": f"Kaju Katli {uuid.uuid4().hex}",
+                                   "category": "Barfi", "price": 12.0, "quantity": 0, "held": 5})
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=settings.HOLD_CLAIM_TIMEOUT_SECONDS + 1)
+    lost, returned = ObjectId(), ObjectId()
+    await hold_repository.collection.insert_many([
+        # Claimed, then the reaper crashed before returning anything
+        {"_id": lost, "sweet_id": sweet_id, "user_id": "u", "quantity": 2,
+         "expires_at": stale, "claimed_by": "crashed", "claimed_at": stale},
+        # Units already returned, then the reaper crashed before deleting it
+        {"_id": returned, "sweet_id": sweet_id, "user_id": "u", "quantity": 3,
+         "expires_at": stale, "claimed_by": "crashed", "claimed_at": stale},
+    ])
+    await sweet_repository.collection.update_one(
+        {"_id": sweet_id}, {"$set": {"quantity": 3, "held": 2, "returned_holds": [returned]}}
+    )
+
+    assert len(await hold_repository.reap(now, 10)) == 2
+    sweet = await sweet_repository.get(sweet_id)
+    assert (sweet["quantity"], sweet["held"], sweet["returned_holds"]) == (5, 0, [])
+    assert await hold_repository.collection.count_documents({"sweet_id": sweet_id}) == 0
+    assert "returned_holds" not in sweet_service.obj_to_dict(sweet)
+
+@requires_mongo
+@pytest.mark.asyncio
+async def test_hold_reaper_overlapping_passes_return_units_once(monkeypatch):
+    """
+    Test a reaper pass that stalls after returning a hold's units, while a
+    second pass takes over its stale claim: the first pass must not pull the
+    hold's ID from returned_holds, or the second pass would return the units again.
+    """
+    sweet_id, hold_id = ObjectId(), ObjectId()
+    now = datetime.utcnow()
+    await sweet_repository.insert({"_id": sweet_id, "name": f"Rasgulla {uuid.uuid4().hex}",
+                                   "category": "Bengali", "price": 5.0, "quantity": 0, "held": 4})
+    await hold_repository.collection.insert_one({"_id": hold_id, "sweet_id": sweet_id, "user_id": "u",
+                                                 "quantity": 4, "expires_at": now - timedelta(seconds=1)})
+
+    first_stalled, second_stalled = asyncio.Event(), asyncio.Event()
+    resume_first, resume_second = asyncio.Event(), asyncio.Event()
+    original_run_bulk = mongo_repositories.run_bulk
+    calls = []
+
+    async def interleaved_run_bulk(collection, operations):
+        calls.append(operations)
+        if len(calls) == 1:  # First pass: units returned, then it stalls past the claim timeout
+            errors = await original_run_bulk(collection, operations)
+            first_stalled.set()
+            await resume_first.wait()
+            return errors
+        if len(calls) == 2:  # Second pass: took over the claim, stalls before returning units
+            second_stalled.set()
+            await resume_second.wait()
+        return await original_run_bulk(collection, operations)
+
+    monkeypatch.setattr(mongo_repositories, "run_bulk", interleaved_run_bulk)
+    first = asyncio.create_task(hold_repository.reap(now, 10))
+    await first_stalled.wait()
+    later = now + timedelta(seconds=settings.HOLD_CLAIM_TIMEOUT_SECONDS + 1)
+    second = asyncio.create_task(hold_repository.reap(later, 10))
+    await second_stalled.wait()
+
+    resume_first.set()
+    assert await first == []  # Its claim was taken over: the hold is not its to pull
+    assert (await sweet_repository.get(sweet_id))["returned_holds"] == [hold_id]
+    resume_second.set()
+    assert await second == [sweet_id]
+
+    sweet = await sweet_repository.get(sweet_id)
+    assert (sweet["quantity"], sweet["held"], sweet["returned_holds"]) == (4, 0, [])
+    assert await hold_repository.collection.count_documents({"_id": hold_id}) == 0
+
+@pytest.mark.asyncio
+async def test_inventory_buffer_never_oversells_and_flushes(monkeypatch):
+    """
+    Test buffered checkouts and restocks on one sweet: concurrent baskets
+    never sell more than the stock, and a flush writes the exact quantity back.
+    """
+    buffer = InventoryBuffer(sweet_repository, lease_size=5, flush_threshold=10_000)
+    monkeypatch.setattr(sweet_service, "inventory_buffer", buffer)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        create_response = await ac.post("/api/sweets/", json={
+            "name": f"Mysore Pak {uuid.uuid4().hex}", "category": "Indian", "price": 12.0, "quantity": 20
+        }, headers=headers)
+        sweet_id = create_response.json()["_id"]
+
+        responses = await asyncio.gather(*(
+            ac.post("/api/sweets/checkout", json={"items": [{"sweet_id": sweet_id, "quantity": 3}]}, headers=headers)
+            for _ in range(10)
+        ))
+        assert sorted(r.status_code for r in responses) == [200] * 6 + [409] * 4  # 6 x 3 <= 20 < 7 x 3
+
+        restock_response = await ac.patch(f"/api/sweets/{sweet_id}/restock", params={"quantity": 10}, headers=headers)
+        assert restock_response.json()["quantity"] == 12  # Stored plus buffered units
+
+    await buffer.flush()
+    assert (await sweet_repository.get(ObjectId(sweet_id)))["quantity"] == 12
+    assert buffer.buffered(ObjectId(sweet_id)) == 0
+
+@pytest.mark.asyncio
+async def test_inventory_buffer_quantity_set_then_flush(monkeypatch):
+    """
+    Test an absolute quantity set via PUT replaces the units buffered for
+    that sweet instead of having the next flush add them on top, and that
+    deltas of deleted sweets are dropped rather than retried.
+    """
+    buffer = InventoryBuffer(sweet_repository, lease_size=5, flush_threshold=10_000)
+    monkeypatch.setattr(sweet_service, "inventory_buffer", buffer)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        create_response = await ac.post("/api/sweets/", json={
+            "name": f"Peda {uuid.uuid4().hex}", "category": "Indian", "price": 6.0, "quantity": 20
+        }, headers=headers)
+        sweet_id = create_response.json()["_id"]
+
+        checkout = await ac.post("/api/sweets/checkout", json={"items": [{"sweet_id": sweet_id, "quantity": 3}]},
+                                 headers=headers)
+        assert checkout.status_code == 200
+        await ac.patch(f"/api/sweets/{sweet_id}/restock", params={"quantity": 4}, headers=headers)
+        assert buffer.buffered(ObjectId(sweet_id)) == 9  # 5 leased ahead, 4 restocked
+
+        update_response = await ac.put(f"/api/sweets/{sweet_id}", json={"quantity": 50}, headers=headers)
+        assert update_response.json()["quantity"] == 50
+
+    await buffer.flush()
+    assert (await sweet_repository.get(ObjectId(sweet_id)))["quantity"] == 50
+
+    class FailingRepository(MemorySweetRepository):
+        async def bulk_increment(self, deltas):
+            return {index: "write failed" for index in range(len(deltas))}
+
+    repository = FailingRepository()
+    kept, deleted = ObjectId(), ObjectId()
+    await repository.insert({"_id": kept, "name": "Kept", "category": "Test", "price": 1.0, "quantity": 1})
+    buffer = InventoryBuffer(repository, lease_size=5, flush_threshold=10_000)
+    buffer.restock(kept, 2)
+    buffer.restock(deleted, 3)
+    await buffer.flush()
+    assert (buffer.buffered(kept), buffer.buffered(deleted)) == (2, 0)
+
+@pytest.mark.asyncio
+async def test_inventory_buffer_batches_hot_sweet_writes(monkeypatch):
+    """
+    Test buffered checkouts and restocks of one hot sweet: sales lease stock
+    lease_size units at a time instead of writing per sale and bump no
+    catalog version, and one flush writes everything back in one batch and
+    bumps the version once.
+    """
+    class CountingRepository:
+        def __init__(self, repository):
+            self.repository, self.calls = repository, Counter()
+
+        def __getattr__(self, name):
+            method = getattr(self.repository, name)
+
+            async def counted(*args, **kwargs):
+                self.calls[name] += 1
+                return await method(*args, **kwargs)
+            return counted
+
+    repository = CountingRepository(sweet_repository)
+    buffer = InventoryBuffer(repository, lease_size=10, flush_threshold=10_000, on_flush=sweet_service.catalog_changed)
+    monkeypatch.setattr(sweet_service, "inventory_buffer", buffer)
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        create_response = await ac.post("/api/sweets/", json={
+            "name": f"Sohan Halwa {uuid.uuid4().hex}", "category": "Indian", "price": 9.0, "quantity": 100
+        }, headers=headers)
+        sweet_id = create_response.json()["_id"]
+
+        bumps = []
+        original_bump = sweet_repository.bump_catalog_version
+
+        async def counted_bump():
+            bumps.append(sweet_id)
+            return await original_bump()
+
+        monkeypatch.setattr(sweet_repository, "bump_catalog_version", counted_bump)
+        version = sweet_service.current_catalog_version()
+
+        for _ in range(20):
+            checkout = await ac.post("/api/sweets/checkout", json={"items": [{"sweet_id": sweet_id, "quantity": 1}]},
+                                     headers=headers)
+            assert checkout.status_code == 200
+        for _ in range(4):
+            restock = await ac.patch(f"/api/sweets/{sweet_id}/restock", params={"quantity": 5}, headers=headers)
+            assert restock.status_code == 200
+
+        # Two leases of 1 + 10 units served 20 sales; nothing else was written
+        assert repository.calls["decrement_quantity"] == 2
+        assert repository.calls["bulk_increment"] == 0
+        assert (await sweet_repository.get(ObjectId(sweet_id)))["quantity"] == 78
+        assert buffer.buffered(ObjectId(sweet_id)) == 2 + 20
+        assert bumps == []
+        assert sweet_service.current_catalog_version() == version
+
+        await buffer.flush()
+        assert repository.calls["bulk_increment"] == 1
+        assert (await sweet_repository.get(ObjectId(sweet_id)))["quantity"] == 100
+        assert buffer.buffered(ObjectId(sweet_id)) == 0
+        assert len(bumps) == 1
+        assert sweet_service.current_catalog_version() == version + 1
+
+@pytest.mark.asyncio
+async def test_catalog_feed_polling_syncs_workers_and_pushes_events():
+    """
+    Test the polling fallback: local writes bump the shared version as they
+    happen, a bump by another worker rebuilds this worker's facets, and SSE
+    clients get events for both.
+    """
+    feed = CatalogFeed(sweet_repository, poll_interval=0.01, queue_size=2)
+    await feed.poll_once()  # Catch up with earlier tests
+    stream = feed.events(heartbeat=0.01)
+    assert await stream.__anext__() == b"retry: 3000\n\n"
+    assert await stream.__anext__() == b": keep-alive\n\n"  # Now subscribed
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        before = await sweet_repository.get_catalog_version()
+        await ac.post("/api/sweets/", json={"name": "Feed Barfi", "category": "Milk", "price": 5.0, "quantity": 1}, headers=headers)
+        assert await sweet_repository.get_catalog_version() == before + 1
+        assert sweet_service.shared_catalog_version() == before + 1  # Our own write: nothing to catch up
+        await feed.poll_once()
+        assert (await stream.__anext__()).startswith(b"event: invalidate\ndata: ")
+
+        # Another worker writes: our facets are rebuilt on the next poll
+        await sweet_service.get_facets()
+        await sweet_repository.bump_catalog_version()
+        await feed.poll_once()
+        assert sweet_service.shared_catalog_version() == before + 2
+        assert sweet_service.facet_summary._stale
+        assert (await stream.__anext__()).startswith(b"event: invalidate")
+
+        await feed.poll_once()  # Nothing changed: no event
+        assert await stream.__anext__() == b": keep-alive\n\n"
+    await stream.aclose()
+    assert not feed._subscribers
+
+@pytest.mark.asyncio
+async def test_catalog_version_bumps_coalesce_per_worker(monkeypatch):
+    """
+    Test concurrent writes share bumps of the shared catalog version: one
+    bump in flight at a time, and each write returns only after a bump
+    that started once it was stored.
+    """
+    stored, finished = [], []  # finished: writes stored when each completed bump started
+    original = sweet_repository.bump_catalog_version
+
+    async def slow_bump():
+        started = len(stored)
+        await asyncio.sleep(0.01)
+        finished.append(started)
+        return await original()
+
+    async def write():
+        stored.append(object())
+        position = len(stored)
+        await sweet_service._publish_write()
+        assert any(started >= position for started in finished)
+
+    before = await sweet_repository.get_catalog_version()
+    monkeypatch.setattr(sweet_repository, "bump_catalog_version", slow_bump)
+    await asyncio.gather(*(write() for _ in range(10)))
+    assert finished == [1, 10]
+    assert sweet_service.current_catalog_version() == before + 2
+    assert not sweet_service._publishing
+
+@pytest.mark.asyncio
+async def test_catalog_etag_tracks_writes_from_other_workers(monkeypatch):
+    """
+    Test the catalog ETag comes from the shared catalog version kept in
+    memory: a current tag gets 304 without touching storage, and a write by
+    another worker (stored, then the shared version bumped) moves this
+    worker's tag once its feed picks the bump up, to the same tag every
+    worker hands out for that version.
+    """
+    feed = CatalogFeed(sweet_repository, poll_interval=0.01, queue_size=2)
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        name = f"Two Worker Halwa {uuid.uuid4().hex}"
+        created = await ac.post("/api/sweets/", json={"name": name, "category": "Halwa", "price": 9.0, "quantity": 2},
+                                headers=headers)
+        sweet_id = ObjectId(created.json()["_id"])
+        await feed.poll_once()  # Catch up with earlier tests
+
+        first = await ac.get("/api/sweets/search", params={"name": name})
+        etag = first.headers["ETag"]
+        assert etag == sweet_service.catalog_etag(await sweet_repository.get_catalog_version())
+
+        async def no_storage(*args, **kwargs):
+            raise AssertionError("a conditional catalog read touched storage")
+
+        with monkeypatch.context() as patched:
+            for method in ("get_catalog_version", "consistent_reads", "list_page", "estimated_count", "search"):
+                patched.setattr(sweet_repository, method, no_storage)
+            conditional = {"If-None-Match": etag}
+            assert (await ac.get("/api/sweets/search", params={"name": name}, headers=conditional)).status_code == 304
+            assert (await ac.get("/api/sweets/", headers=conditional)).status_code == 304
+
+        # The other worker's restock: its own sweet_service stores it and bumps the shared version
+        await sweet_repository.increment_quantity(sweet_id, 5)
+        await sweet_repository.bump_catalog_version()
+        await feed.poll_once()
+
+        refreshed = await ac.get("/api/sweets/search", params={"name": name}, headers={"If-None-Match": etag})
+        assert refreshed.status_code == 200
+        assert refreshed.headers["ETag"] != etag
+        assert refreshed.json()[0]["quantity"] == 7
+        assert refreshed.headers["ETag"] == sweet_service.catalog_etag(await sweet_repository.get_catalog_version())
+
+@pytest.mark.asyncio
+async def test_catalog_feed_change_stream_events():
+    """
+    Test change stream events become upsert/delete pushes, version bumps
+    move the ETag without a push, and a client that falls behind gets a
+    single invalidate instead of a backlog.
+    """
+    sweet_id = ObjectId()
+    # Another worker's bump of the shared version, as the stream reports it
+    version = await sweet_repository.bump_catalog_version() + 1
+
+    class StreamingRepository(MemorySweetRepository):
+        async def watch(self, resume_after=None):
+            yield {"op": "insert", "_id": sweet_id, "resume_token": {"_data": "1"},
+                   "document": {"_id": sweet_id, "name": "Peda", "name_lower": "peda", "category": "Milk",
+                                "category_lower": "milk", "price": 3.0, "quantity": 4}}
+            yield {"op": "delete", "_id": sweet_id, "document": None, "resume_token": {"_data": "2"}}
+            yield {"op": "version", "version": version, "resume_token": {"_data": "3"}}
+
+    feed = CatalogFeed(StreamingRepository(), poll_interval=0.01, queue_size=2)
+    queue = feed.subscribe()
+    await feed.follow_changes()
+    assert feed.mode == "change_stream"
+    assert feed._resume_token == {"_data": "3"}
+    assert sweet_service.current_catalog_version() == version
+    upsert, delete = queue.get_nowait(), queue.get_nowait()
+    assert upsert == {"type": "upsert", "sweet": {"_id": str(sweet_id), "name": "Peda", "category": "Milk", "price": 3.0, "quantity": 4}}
+    assert delete == {"type": "delete", "sweet_id": str(sweet_id)}
+
+    await feed.follow_changes()
+    await feed.follow_changes()  # Queue overflows: backlog replaced by one invalidate
+    assert queue.qsize() == 2 and queue.get_nowait() == {"type": "invalidate"}
+
+@pytest.mark.asyncio
+async def test_catalog_feed_change_events_keep_facet_summary(monkeypatch):
+    """
+    Test change stream events clear the catalog cache but only re-aggregate
+    the categories they touched, and fall back to a full rebuild only when
+    the event does not tell which categories changed.
+    """
+    category = f"Stream {uuid.uuid4().hex}"
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        created = await ac.post("/api/sweets/", json={
+            "name": "Stream Jalebi", "category": category, "price": 4.0, "quantity": 2
+        }, headers=headers)
+        sweet_id = ObjectId(created.json()["_id"])
+    await sweet_service.facet_summary.facets()
+
+    calls = []
+    original = sweet_repository.facet_stats
+    async def recording_facet_stats(categories=None):
+        calls.append(categories)
+        return await original(categories)
+    monkeypatch.setattr(sweet_repository, "facet_stats", recording_facet_stats)
+
+    stored = await sweet_repository.increment_quantity(sweet_id, 3)
+    events = [
+        {"op": "update", "_id": sweet_id, "document": stored, "updated_fields": ["quantity"]},
+        {"op": "delete", "_id": sweet_id, "document": None, "before": stored},
+        {"op": "delete", "_id": sweet_id, "document": None},
+    ]
+    def stream_of(event: dict):
+        async def watch(resume_after=None):
+            yield {"resume_token": {"_data": "1"}, **event}
+        return watch
+
+    feed = CatalogFeed(sweet_repository, poll_interval=0.01, queue_size=10)
+    for index, event in enumerate(events):
+        monkeypatch.setattr(sweet_repository, "watch", stream_of(event))
+        await sweet_service.search_sweets(name="stream jalebi")
+        await feed.follow_changes()
+        assert len(sweet_service.catalog_cache) == 0
+        facets = await sweet_service.facet_summary.facets()
+        assert next(c for c in facets["categories"] if c["category"] == category)["count"] == 1
+        assert calls[index] == ([category] if index < 2 else None)
+
+@pytest.mark.asyncio
+async def test_facets_maintained_incrementally_on_writes(monkeypatch):
+    """
+    Test /facets reflects create, update, restock and delete without
+    re-aggregating, and always matches a fresh aggregation.
+    """
+    category = f"Facet {uuid.uuid4().hex}"
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        await ac.get("/api/sweets/facets")  # Build the summary once
+
+        aggregations = 0
+        original = sweet_repository.facet_stats
+        async def counting_facet_stats(categories=None):
+            nonlocal aggregations
+            aggregations += 1
+            return await original(categories)
+        monkeypatch.setattr(sweet_repository, "facet_stats", counting_facet_stats)
+
+        sweet_ids = []
+        for price, quantity in ((10.0, 0), (20.0, 5), (30.0, 2)):
+            response = await ac.post("/api/sweets/", json={
+                "name": f"Facet sweet {price}", "category": category, "price": price, "quantity": quantity
+            }, headers=headers)
+            sweet_ids.append(response.json()["_id"])
+        await ac.patch(f"/api/sweets/{sweet_ids[0]}/restock", params={"quantity": 3}, headers=headers)
+        await ac.put(f"/api/sweets/{sweet_ids[1]}", json={"price": 25.0}, headers=headers)
+
+        facets = (await ac.get("/api/sweets/facets")).json()
+        assert aggregations == 0
+        facet = next(c for c in facets["categories"] if c["category"] == category)
+        assert facet == {"category": category, "count": 3, "in_stock": 3, "out_of_stock": 0,
+                         "min_price": 10.0, "max_price": 30.0, "avg_price": 21.67}
+
+        # Deleting the cheapest sweet needs a rescan for the new minimum
+        await ac.delete(f"/api/sweets/{sweet_ids[0]}", headers=headers)
+        facets = (await ac.get("/api/sweets/facets")).json()
+        assert aggregations == 1
+        facet = next(c for c in facets["categories"] if c["category"] == category)
+        assert (facet["count"], facet["min_price"], facet["avg_price"]) == (2, 25.0, 27.5)
+
+    assert facets == await FacetSummary(sweet_repository).facets()
+
+@pytest.mark.asyncio
+async def test_facets_refresh_only_categories_touched_by_bulk_writes(monkeypatch):
+    """
+    Test checkout, holds and bulk writes re-aggregate only the categories
+    they touched (looked up from the sweet IDs where not known), never the
+    whole summary.
+    """
+    tag = uuid.uuid4().hex
+    milk, fried, dry, baked = (f"{name} {tag}" for name in ("Milk", "Fried", "Dry", "Baked"))
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        headers = await get_admin_headers(ac)
+        created = await ac.post("/api/sweets/bulk", json={"items": [
+            {"name": f"Rasgulla {tag}", "category": milk, "price": 5.0, "quantity": 1},
+            {"name": f"Jalebi {tag}", "category": fried, "price": 3.0, "quantity": 2},
+        ]}, headers=headers)
+        milk_id, fried_id = (row["sweet_id"] for row in created.json()["results"])
+        await ac.get("/api/sweets/facets")
+
+        refreshed = []
+        original = sweet_repository.facet_stats
+        async def recording_facet_stats(categories=None):
+            refreshed.append(categories)
+            return await original(categories)
+        monkeypatch.setattr(sweet_repository, "facet_stats", recording_facet_stats)
+
+        async def facets_after(write) -> dict:
+            refreshed.clear()
+            response = await write
+            assert response.status_code in (200, 201)
+            facets = (await ac.get("/api/sweets/facets")).json()
+            return {c["category"]: c for c in facets["categories"]}
+
+        checkout = ac.post("/api/sweets/checkout", json={"items": [{"sweet_id": milk_id, "quantity": 1}]}, headers=headers)
+        assert (await facets_after(checkout))[milk]["in_stock"] == 0
+        assert refreshed == [[milk]]
+
+        hold = ac.post(f"/api/sweets/{fried_id}/hold", json={"quantity": 2}, headers=headers)
+        assert (await facets_after(hold))[fried]["in_stock"] == 0
+        assert refreshed == [[fried]]
+
+        bulk_create = ac.post("/api/sweets/bulk", json={"items": [
+            {"name": f"Kaju Katli {tag}", "category": dry, "price": 9.0, "quantity": 4}
+        ]}, headers=headers)
+        assert (await facets_after(bulk_create))[dry]["count"] == 1
+        assert refreshed == [[dry]]
+
+        bulk_update = ac.patch("/api/sweets/bulk", json={"items": [
+            {"sweet_id": milk_id, "data": {"category": baked}}
+        ]}, headers=headers)
+        facets = await facets_after(bulk_update)
+        assert milk not in facets and facets[baked]["count"] == 1
+        assert refreshed == [sorted([milk, baked])]
+
+        bulk_delete = ac.request("DELETE", "/api/sweets/bulk", json={"ids": [fried_id]}, headers=headers)
+        assert fried not in await facets_after(bulk_delete)
+        assert refreshed == [[fried]]
+
+    assert (await sweet_service.get_facets()) == await FacetSummary(sweet_repository).facets()